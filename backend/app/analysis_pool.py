@@ -0,0 +1,72 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from app.textProcessor import get_text_processor
+
+# Worker processes for batch analysis; each holds its own CLTK pipelines
+ANALYZE_PROCESSES = int(os.getenv("ANALYZE_PROCESSES", str(max(1, (os.cpu_count() or 2) // 2))))
+# "spawn" is safe with the server's threads; "fork" shares preloaded models but
+# is only safe when no other threads hold locks at fork time
+ANALYZE_START_METHOD = os.getenv("ANALYZE_START_METHOD", "spawn")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_analysis_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=ANALYZE_PROCESSES,
+                mp_context=multiprocessing.get_context(ANALYZE_START_METHOD),
+            )
+        return _pool
+
+
+def shutdown_analysis_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _analyze_document(text: str, language: str, incremental: bool) -> List[Dict]:
+    """Runs inside a worker process."""
+    processor = get_text_processor()
+    if incremental:
+        return processor.analyze_text_incremental(text, language)
+    return processor.analyze_text(text, language)
+
+
+async def analyze_documents(documents: List[Dict], incremental: bool = False) -> List[Dict]:
+    """
+    Analyze many documents across the process pool, one task per document.
+    Each document is {"id", "text", "language"}; results keep the input order.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_analysis_pool()
+    futures = [
+        loop.run_in_executor(pool, _analyze_document, doc["text"], doc.get("language", "lat"), incremental)
+        for doc in documents
+    ]
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    output = []
+    for doc, result in zip(documents, results):
+        if isinstance(result, Exception):
+            output.append({"id": doc.get("id"), "success": False, "error": str(result)})
+            continue
+        # The processor reports unsupported languages and pipeline failures as [{"error": ...}]
+        error = next((w["error"] for w in result if "error" in w), None)
+        if error is not None:
+            output.append({"id": doc.get("id"), "success": False, "language": doc.get("language", "lat"),
+                           "error": error})
+        else:
+            output.append({"id": doc.get("id"), "success": True, "language": doc.get("language", "lat"),
+                           "text_analysis": result})
+    return output
@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import os
+import zipfile
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional
+
+from app.cache import MISS, lookup_cached, store_cached
+from app.ingest import is_multipage
+from app.jobs import Job, run_in_stage_pool, run_stage
+from app.layout import OCR_LAYOUT, PageLayout, analyze_layout
+from app.ocr_ai_processor import extract_layout_texts, extract_texts, layout_ocr_result
+from app.ocr_backends import get_ocr_backend
+from app.ocr_words import WordTable
+from app.pipeline import (
+    IMAGE_EXTENSIONS, PIPELINE_STAGES, correct_and_analyze, is_primary_engine, pack_page_ocr,
+    preprocessed_name, run_upload_pipeline, store_document, unpack_page_ocr, upload_ocr_key, words_dict
+)
+from app.preprocess import DEFAULT_TIER, preprocess_to_file
+from app.storage import StoredFile, UploadTooLargeError, derived_path, file_url, link_into_job, store_stream
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))
+# OCR batches processed at the same time; each holds up to the backend's batch_size images
+BATCH_GROUP_CONCURRENCY = int(os.getenv("BATCH_GROUP_CONCURRENCY", "4"))
+
+BATCH_EXTENSIONS = IMAGE_EXTENSIONS | {".pdf", ".tif", ".tiff"}
+
+
+class BatchTooLargeError(UploadTooLargeError):
+    """Raised when a batch holds more than BATCH_MAX_FILES files."""
+
+
+def _batch_member(member: zipfile.ZipInfo) -> Optional[str]:
+    name = os.path.basename(member.filename)
+    if member.is_dir() or not name or Path(name).suffix.lower() not in BATCH_EXTENSIONS:
+        return None
+    return name
+
+
+def save_batch_upload(filename: str, stream: BinaryIO, batch_id: str,
+                      limit: int = BATCH_MAX_FILES) -> List[StoredFile]:
+    """
+    Store one uploaded file, unpacking it if it is a zip, and link each
+    image or document into the batch's job directory. Zip members are
+    flattened to their base names; unsupported files are skipped. Raises
+    BatchTooLargeError before storing anything when the upload holds more
+    than `limit` supported files.
+    """
+    saved = []
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(stream) as archive:
+            # Counted from the central directory, so an oversized archive is never extracted
+            members = [(m, name) for m in archive.infolist() for name in [_batch_member(m)] if name]
+            if len(members) > limit:
+                raise BatchTooLargeError(f"Batch exceeds {BATCH_MAX_FILES} files")
+            for member, name in members:
+                with archive.open(member) as src:
+                    stored = store_stream(src, name)
+                stored.path = link_into_job(stored, batch_id)
+                saved.append(stored)
+        return saved
+
+    if Path(filename).suffix.lower() not in BATCH_EXTENSIONS:
+        return saved
+    if limit < 1:
+        raise BatchTooLargeError(f"Batch exceeds {BATCH_MAX_FILES} files")
+    stored = store_stream(stream, filename)
+    stored.path = link_into_job(stored, batch_id)
+    saved.append(stored)
+    return saved
+
+
+async def _process_group(files: List[StoredFile], language: str, preprocess_tier: str,
+                         ocr_backend: Optional[str], queue: asyncio.Queue):
+    """
+    Run _run_group and make sure every file of the group gets a result line,
+    so iter_batch_results never waits for one that will not come.
+    """
+    reported = set()
+
+    async def report(i: int, result: Dict):
+        reported.add(i)
+        await queue.put(result)
+
+    try:
+        await _run_group(files, language, preprocess_tier, ocr_backend, report)
+    except Exception as e:
+        logger.exception("Batch group failed")
+        for i, stored in enumerate(files):
+            if i not in reported:
+                await queue.put({"filename": stored.path.name, "success": False, "error": str(e)})
+
+
+async def _run_group(files: List[StoredFile], language: str, preprocess_tier: str,
+                     ocr_backend: Optional[str], report):
+    """
+    Preprocess a group of images, find their text regions, OCR every
+    region of the group in one batch call, then correct and analyze each.
+    """
+    paths = [f.path for f in files]
+    hashes = [f.sha256 for f in files]
+    jobs = [Job(PIPELINE_STAGES, {"filename": path.name}) for path in paths]
+    keys: List[Optional[str]] = [None] * len(paths)
+    texts: List[Optional[str]] = [None] * len(paths)
+    regions: List[Optional[List[Dict]]] = [None] * len(paths)
+    words: List[Optional[WordTable]] = [None] * len(paths)
+    errors: List[Optional[str]] = [None] * len(paths)
+    preprocessed: Dict[int, str] = {}
+
+    async def prepare(i: int, path: Path):
+        try:
+            keys[i] = upload_ocr_key(hashes[i], True, preprocess_tier, ocr_backend, language)
+            cached = await run_in_stage_pool("storage", lookup_cached, "page-ocr", keys[i])
+            if cached is not MISS:
+                texts[i], regions[i], words[i] = unpack_page_ocr(cached)
+                jobs[i].set_stage("preprocess", "cached")
+                jobs[i].set_stage("layout", "cached")
+                jobs[i].set_stage("ocr", "cached")
+                return
+            output_path = str(derived_path(hashes[i], preprocessed_name(preprocess_tier)))
+            if os.path.exists(output_path):
+                jobs[i].set_stage("preprocess", "cached")
+                preprocessed[i] = output_path
+                return
+            preprocessed[i], _ = await run_stage(
+                jobs[i], "preprocess", preprocess_to_file, str(path), preprocess_tier, output_path
+            )
+        except Exception as e:
+            logger.exception(f"Preprocessing {path.name} failed")
+            errors[i] = str(e)
+
+    await asyncio.gather(*(prepare(i, path) for i, path in enumerate(paths)))
+
+    if preprocessed and OCR_LAYOUT:
+        await _ocr_group_regions(jobs, preprocessed, keys, texts, regions, words, errors, ocr_backend, language)
+    elif preprocessed:
+        order = sorted(preprocessed)
+        for i in order:
+            jobs[i].set_stage("layout", "skipped")
+            jobs[i].set_stage("ocr", "running")
+        try:
+            batch_results = await run_in_stage_pool(
+                "ocr", extract_texts, [preprocessed[i] for i in order], ocr_backend, language
+            )
+        except Exception as e:
+            logger.exception("Batch OCR failed")
+            batch_results = [((None, str(e), None), None)] * len(order)
+        for i, ((text, error, page_words), engine) in zip(order, batch_results):
+            jobs[i].set_stage("ocr", "failed" if error else "done")
+            jobs[i].set_stage_detail("ocr", "engine", engine)
+            if error:
+                errors[i] = error
+            else:
+                texts[i], words[i] = text, page_words
+                if is_primary_engine(ocr_backend, engine):
+                    await run_in_stage_pool(
+                        "storage", store_cached, "page-ocr", keys[i], pack_page_ocr(text, None, page_words)
+                    )
+
+    async def finish(i: int, path: Path):
+        if errors[i] is not None:
+            await report(i, {"filename": path.name, "success": False, "error": errors[i]})
+            return
+        try:
+            file_language, corrected_text, text_analysis = await correct_and_analyze(
+                jobs[i], texts[i], language, doc_id=hashes[i], doc_name=path.name, words=words[i]
+            )
+            await report(i, await store_document(jobs[i].id, hashes[i], {
+                "filename": path.name,
+                "success": True,
+                "language": file_language,
+                "file_url": file_url(path),
+                "preprocessed_file": file_url(Path(preprocessed[i])) if i in preprocessed else None,
+                "raw_ocr_text": texts[i],
+                "regions": regions[i],
+                "ocr_words": words_dict(words[i]),
+                "accurate_text": corrected_text,
+                "text_analysis": text_analysis,
+                "stages": jobs[i].to_dict(include_result=False)["stages"],
+            }, preprocess_tier, ocr_backend))
+        except Exception as e:
+            logger.exception(f"Correcting or analyzing {path.name} failed")
+            await report(i, {"filename": path.name, "success": False, "error": str(e)})
+
+    await asyncio.gather(*(finish(i, path) for i, path in enumerate(paths)))
+
+
+async def _ocr_group_regions(jobs: List[Job], preprocessed: Dict[int, str], keys: List[Optional[str]],
+                             texts: List[Optional[str]], regions: List[Optional[List[Dict]]],
+                             words: List[Optional[WordTable]], errors: List[Optional[str]],
+                             ocr_backend: Optional[str], language: str):
+    """Detect each page's regions, then OCR the regions of the whole group together."""
+    layouts: Dict[int, PageLayout] = {}
+
+    async def detect(i: int):
+        try:
+            layouts[i] = await run_stage(jobs[i], "layout", analyze_layout, preprocessed[i])
+            jobs[i].set_stage_detail("layout", "stats", layouts[i].stats())
+        except Exception as e:
+            logger.exception(f"Layout analysis of {preprocessed[i]} failed")
+            errors[i] = str(e)
+
+    await asyncio.gather(*(detect(i) for i in sorted(preprocessed)))
+    order = sorted(layouts)
+    if not order:
+        return
+    for i in order:
+        jobs[i].set_stage("ocr", "running")
+    try:
+        await run_in_stage_pool("ocr", extract_layout_texts, [layouts[i] for i in order], ocr_backend, language)
+    except Exception as e:
+        for i in order:
+            jobs[i].set_stage("ocr", "failed")
+            errors[i] = str(e)
+        return
+    for i in order:
+        (text, error, page_words), engine = layout_ocr_result(layouts[i], ocr_backend)
+        jobs[i].set_stage("ocr", "failed" if text is None else "done")
+        jobs[i].set_stage_detail("ocr", "engine", engine)
+        if text is None:
+            errors[i] = error
+            continue
+        texts[i], words[i] = text, page_words
+        regions[i] = [r.to_dict() for r in layouts[i].regions]
+        if error is None and is_primary_engine(ocr_backend, engine):
+            await run_in_stage_pool(
+                "storage", store_cached, "page-ocr", keys[i], pack_page_ocr(text, regions[i], page_words)
+            )
+
+
+async def _process_document(stored: StoredFile, language: str, preprocess_tier: str,
+                            ocr_backend: Optional[str], queue: asyncio.Queue):
+    """Multi-page files go through the page-parallel document pipeline."""
+    path = stored.path
+    job = Job(PIPELINE_STAGES, {"filename": path.name})
+    try:
+        result = await run_upload_pipeline(job, path, language, preprocess_tier, ocr_backend, stored.sha256)
+        result["filename"] = path.name
+        await queue.put(result)
+    except Exception as e:
+        logger.exception(f"Processing {path.name} failed")
+        await queue.put({"filename": path.name, "success": False, "error": str(e)})
+
+
+async def iter_batch_results(files: List[StoredFile], language: str,
+                             preprocess_tier: str = DEFAULT_TIER,
+                             ocr_backend: Optional[str] = None) -> AsyncIterator[Dict]:
+    """
+    Yield one result per file as soon as it finishes. Images are grouped
+    into OCR batches (Vision batch_annotate_images by default); at most
+    BATCH_GROUP_CONCURRENCY groups run at once and every stage inside them
+    still goes through its bounded pool.
+    """
+    images = [f for f in files if not is_multipage(str(f.path))]
+    documents = [f for f in files if is_multipage(str(f.path))]
+    group_size = max(1, get_ocr_backend(ocr_backend).batch_size)
+    groups = [images[i:i + group_size] for i in range(0, len(images), group_size)]
+
+    queue: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(BATCH_GROUP_CONCURRENCY)
+
+    async def bounded(coro):
+        async with semaphore:
+            await coro
+
+    tasks = [asyncio.create_task(bounded(_process_group(g, language, preprocess_tier, ocr_backend, queue))) for g in groups]
+    tasks += [asyncio.create_task(bounded(_process_document(d, language, preprocess_tier, ocr_backend, queue))) for d in documents]
+
+    try:
+        for _ in range(len(files)):
+            yield await queue.get()
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
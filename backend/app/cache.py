@@ -0,0 +1,241 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") not in ("0", "false", "False")
+CACHE_PATH = os.getenv("RESULT_CACHE_PATH", os.path.join("cache", "results.sqlite3"))
+CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+CACHE_MAX_AGE_SECONDS = int(os.getenv("RESULT_CACHE_MAX_AGE_SECONDS", str(30 * 24 * 3600)))
+
+# Sentinel so a cached None/empty value is distinguishable from a miss
+MISS = object()
+# Keys per SELECT ... IN (...), well under SQLite's bound parameter limit
+LOOKUP_BATCH_KEYS = 500
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_key(*parts: Any) -> str:
+    """Build a stable cache key from arbitrary JSON-serializable parts."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES,
+                 max_age_seconds: int = CACHE_MAX_AGE_SECONDS):
+        """Persistent content-addressed cache for stage results, backed by SQLite."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at)")
+        self._conn.commit()
+        self.evict()
+
+    def get(self, namespace: str, key: str) -> Any:
+        """Return the cached value or MISS."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age_seconds:
+                self.misses[namespace] = self.misses.get(namespace, 0) + 1
+                return MISS
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits[namespace] = self.hits.get(namespace, 0) + 1
+        return json.loads(row[0])
+
+    def get_many(self, namespace: str, keys: List[str]) -> Dict[str, Any]:
+        """Cached values of the keys that are present, with one commit for all of them."""
+        now = time.time()
+        found: Dict[str, str] = {}
+        with self._lock:
+            for i in range(0, len(keys), LOOKUP_BATCH_KEYS):
+                batch = keys[i:i + LOOKUP_BATCH_KEYS]
+                for key, value, created_at in self._conn.execute(
+                    f"SELECT key, value, created_at FROM entries WHERE key IN ({', '.join('?' * len(batch))})",
+                    batch,
+                ):
+                    if now - created_at <= self.max_age_seconds:
+                        found[key] = value
+            if found:
+                self._conn.executemany("UPDATE entries SET accessed_at = ? WHERE key = ?", [(now, k) for k in found])
+                self._conn.commit()
+            unique = len(set(keys))
+            self.hits[namespace] = self.hits.get(namespace, 0) + len(found)
+            self.misses[namespace] = self.misses.get(namespace, 0) + unique - len(found)
+        return {key: json.loads(value) for key, value in found.items()}
+
+    def set(self, namespace: str, key: str, value: Any):
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, namespace, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, namespace, data, len(data.encode("utf-8")), now, now),
+            )
+            self._conn.commit()
+            self._writes_since_evict += 1
+            should_evict = self._writes_since_evict >= 100
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under the size limit."""
+        with self._lock:
+            self._writes_since_evict = 0
+            self._conn.execute(
+                "DELETE FROM entries WHERE created_at < ?", (time.time() - self.max_age_seconds,)
+            )
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                freed = 0
+                stale_keys = []
+                for key, size in self._conn.execute(
+                    "SELECT key, size FROM entries ORDER BY accessed_at ASC"
+                ):
+                    stale_keys.append((key,))
+                    freed += size
+                    if freed >= excess:
+                        break
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", stale_keys)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+            namespaces = sorted(set(self.hits) | set(self.misses))
+            return {
+                "enabled": CACHE_ENABLED,
+                "entries": entries,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "max_age_seconds": self.max_age_seconds,
+                "namespaces": {
+                    ns: {"hits": self.hits.get(ns, 0), "misses": self.misses.get(ns, 0)}
+                    for ns in namespaces
+                },
+            }
+
+
+# Singleton
+_result_cache: Optional[ResultCache] = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
+
+
+def lookup_cached(namespace: str, key: str) -> Any:
+    """
+    Return a cached value or MISS (always MISS when the cache is disabled,
+    or unreadable). Touches the database, so coroutines run it on the
+    "storage" pool.
+    """
+    if not CACHE_ENABLED:
+        return MISS
+    try:
+        return get_result_cache().get(namespace, key)
+    except sqlite3.Error as e:
+        logger.warning(f"Could not read cached {namespace} result: {e}")
+        return MISS
+
+
+def lookup_cached_many(namespace: str, keys: List[str]) -> Dict[str, Any]:
+    """lookup_cached for many keys in one transaction; only hits are returned."""
+    if not CACHE_ENABLED or not keys:
+        return {}
+    try:
+        return get_result_cache().get_many(namespace, keys)
+    except sqlite3.Error as e:
+        logger.warning(f"Could not read cached {namespace} results: {e}")
+        return {}
+
+
+def store_cached(namespace: str, key: str, value: Any):
+    if not CACHE_ENABLED:
+        return
+    try:
+        get_result_cache().set(namespace, key, value)
+    except (sqlite3.Error, TypeError, ValueError) as e:
+        logger.warning(f"Could not cache {namespace} result: {e}")
+
+
+def cached_call(namespace: str, key: str, compute: Callable[[], Any],
+                should_store: Optional[Callable[[Any], bool]] = None) -> Any:
+    """
+    Return the cached result for key, or compute and store it.
+    should_store lets callers skip caching fallback/error results.
+    """
+    value = lookup_cached(namespace, key)
+    if value is not MISS:
+        return value
+    value = compute()
+    if should_store is None or should_store(value):
+        store_cached(namespace, key, value)
+    return value
+
+
+def _reset_after_fork():
+    # A SQLite connection must not be shared across fork; children reconnect lazily
+    global _result_cache, _result_cache_lock
+    _result_cache = None
+    _result_cache_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,110 @@
+import re
+from difflib import SequenceMatcher
+from typing import List
+
+# Lines of the previous chunk repeated at the start of the next one, so the
+# LLM sees the context a word or sentence continues from
+OVERLAP_LINES = 2
+# Similarity above which two overlap regions are treated as the same text
+OVERLAP_SIMILARITY = 0.8
+
+
+def _split_long_line(line: str, max_chars: int) -> List[str]:
+    """Break a single over-long line on whitespace."""
+    pieces, current = [], ""
+    for word in line.split(" "):
+        if current and len(current) + 1 + len(word) > max_chars:
+            pieces.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _tail_context(lines: List[str], overlap_lines: int) -> List[str]:
+    """Last overlap_lines non-blank lines, keeping any paragraph breaks among them."""
+    if not overlap_lines:
+        return []
+    start, seen = len(lines), 0
+    while start > 0 and seen < overlap_lines:
+        start -= 1
+        if lines[start]:
+            seen += 1
+    return lines[start:]
+
+
+def split_text_into_chunks(text: str, max_chars: int, overlap_lines: int = OVERLAP_LINES) -> List[str]:
+    """
+    Split OCR text into chunks of at most max_chars (plus overlap), breaking on
+    paragraph boundaries first and line boundaries second. Each chunk after the
+    first starts with the last overlap_lines lines of the previous chunk.
+    """
+    if len(text) <= max_chars:
+        return [text]
+
+    # Keep blank lines as paragraph markers so they survive stitching
+    units: List[str] = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        for line in paragraph.split("\n"):
+            units.extend(_split_long_line(line, max_chars) if len(line) > max_chars else [line])
+        units.append("")
+    if units and units[-1] == "":
+        units.pop()
+
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    size = 0
+    for unit in units:
+        # Prefer to cut at a paragraph break once the chunk is reasonably full
+        if current and (size + len(unit) + 1 > max_chars or (unit == "" and size > max_chars * 0.75)):
+            chunks.append(current)
+            current = _tail_context(current, overlap_lines)
+            size = sum(len(line) + 1 for line in current)
+        current.append(unit)
+        size += len(unit) + 1
+    if current:
+        chunks.append(current)
+
+    return ["\n".join(chunk).strip("\n") for chunk in chunks]
+
+
+def _normalize(line: str) -> str:
+    return re.sub(r"\s+", " ", line).strip().lower()
+
+
+def _overlap_length(previous: List[str], following: List[str], max_lines: int) -> int:
+    """Number of leading lines of `following` that repeat the tail of `previous`."""
+    limit = min(max_lines, len(previous), len(following))
+    candidates = []
+    for k in range(limit, 0, -1):
+        tail = " ".join(_normalize(line) for line in previous[-k:])
+        head = " ".join(_normalize(line) for line in following[:k])
+        if tail or head:
+            candidates.append((k, tail, head))
+    # Exact matches first, so a fuzzy match never swallows a genuine new line
+    for k, tail, head in candidates:
+        if tail == head:
+            return k
+    for k, tail, head in candidates:
+        if SequenceMatcher(None, tail, head).ratio() >= OVERLAP_SIMILARITY:
+            return k
+    return 0
+
+
+def stitch_chunks(chunks: List[str], overlap_lines: int = OVERLAP_LINES) -> str:
+    """
+    Join corrected chunks, dropping the overlap lines each chunk repeats from
+    the previous one. The LLM may have merged or split lines, so a little
+    slack is allowed when matching.
+    """
+    if not chunks:
+        return ""
+    lines = chunks[0].split("\n")
+    for chunk in chunks[1:]:
+        following = chunk.split("\n")
+        # Overlap lines may include paragraph breaks, so allow for those too
+        drop = _overlap_length(lines, following, 2 * overlap_lines + 1)
+        lines.extend(following[drop:])
+    return "\n".join(lines).strip()
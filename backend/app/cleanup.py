@@ -0,0 +1,341 @@
+import os
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.langdetect import LANGUAGE_SCRIPTS, SAMPLES_DIR, script_of
+
+# Bump whenever a rule table changes; part of the correction cache key
+CLEANUP_VERSION = "2"
+LEXICON_DIR = Path(os.getenv("CLEANUP_LEXICON_DIR", str(Path(__file__).parent / "data" / "cleanup")))
+# Merged words shorter than this are left alone
+SPLIT_MIN_CHARS = 7
+SPLIT_MAX_PARTS = 3
+# Tokens longer than this are most likely several words run together
+MAX_WORD_CHARS = 18
+
+# Marks scribes put over contractions (macron, overline, tilde)
+ABBREVIATION_MARKS = {"\u0303", "\u0304", "\u0305"}
+# Punctuation allowed around a word without making it suspicious
+EDGE_PUNCTUATION = ".,;:!?'\"()[]\u00b7\u0387\u037e\u0964\u0965"
+VOWELS = set("aeiouyæœαεηιουω")
+
+# Characters that are never text in these manuscripts; removed everywhere
+STRAY_SYMBOLS = "*~^`_#@$%<>{}=+\\¬•¤©®™§"
+
+# Per-language tables. Abbreviations are keyed by the contracted form in
+# capitals with its marks removed; they expand when written in capitals or
+# with a contraction mark (single letters only with a mark).
+ABBREVIATIONS = {
+    "latin": {
+        "DNS": "DOMINUS", "DNI": "DOMINI", "DNO": "DOMINO", "DNM": "DOMINUM", "DNE": "DOMINE",
+        "XPS": "CHRISTUS", "XPI": "CHRISTI", "XPO": "CHRISTO", "XPM": "CHRISTUM", "XPE": "CHRISTE",
+        "IHS": "IESUS", "IHU": "IESU", "IHM": "IESUM",
+        "SCS": "SANCTUS", "SCI": "SANCTI", "SCO": "SANCTO", "SCM": "SANCTUM", "SCA": "SANCTA",
+        "SPS": "SPIRITUS", "SPU": "SPIRITU", "SPM": "SPIRITUM",
+        "NRI": "NOSTRI", "NRO": "NOSTRO", "NRA": "NOSTRA", "NRM": "NOSTRUM",
+        "ISRL": "ISRAEL", "HIERLM": "HIERUSALEM", "EPS": "EPISCOPUS", "EPI": "EPISCOPI",
+    },
+    "old_english": {
+        "Þ": "ÞÆT", "Ð": "ÐÆT",
+    },
+    "greek": {
+        "ΘΣ": "ΘΕΟΣ", "ΘΥ": "ΘΕΟΥ", "ΘΩ": "ΘΕΩ", "ΘΝ": "ΘΕΟΝ",
+        "ΙΣ": "ΙΗΣΟΥΣ", "ΙΥ": "ΙΗΣΟΥ", "ΙΝ": "ΙΗΣΟΥΝ",
+        "ΧΣ": "ΧΡΙΣΤΟΣ", "ΧΥ": "ΧΡΙΣΤΟΥ", "ΧΩ": "ΧΡΙΣΤΩ", "ΧΝ": "ΧΡΙΣΤΟΝ",
+        "ΚΣ": "ΚΥΡΙΟΣ", "ΚΥ": "ΚΥΡΙΟΥ", "ΚΩ": "ΚΥΡΙΩ", "ΚΝ": "ΚΥΡΙΟΝ",
+        "ΠΝΑ": "ΠΝΕΥΜΑ", "ΠΝΣ": "ΠΝΕΥΜΑΤΟΣ", "ΑΝΟΣ": "ΑΝΘΡΩΠΟΣ", "ΑΝΩΝ": "ΑΝΘΡΩΠΩΝ",
+        "ΟΥΝΟΣ": "ΟΥΡΑΝΟΣ", "ΟΥΝΟΥ": "ΟΥΡΑΝΟΥ", "ΠΗΡ": "ΠΑΤΗΡ", "ΠΡΣ": "ΠΑΤΡΟΣ",
+    },
+}
+# Whole tokens replaced outright (the Tironian "7" for "and")
+WORD_REPLACEMENTS = {
+    "old_english": {"7": "and", "&": "and"},
+    "latin": {"&": "et"},
+    "sanskrit": {"।।": "॥"},
+}
+# Single characters mapped (or expanded) wherever they appear
+CHARACTER_MAP = {
+    "latin": {"ſ": "s", "ꝑ": "per", "ꝓ": "pro", "ꝯ": "con", "ꝰ": "us", "ﬁ": "fi", "ﬂ": "fl", "ﬀ": "ff"},
+    "old_english": {"⁊": "and", "ꝥ": "þæt", "ſ": "s", "ꝼ": "f", "ꞃ": "r", "ꞅ": "s", "ꞇ": "t"},
+    "greek": {"ϲ": "σ", "Ϲ": "Σ", "ϐ": "β", "ϑ": "θ", "ϰ": "κ", "ϱ": "ρ", "ϖ": "π"},
+    "sanskrit": {"|": "।"},
+}
+# Look-alike letters OCR substitutes from another script; applied only
+# inside words that mix scripts
+HOMOGLYPHS = {
+    "latin": {
+        "Α": "A", "Β": "B", "Ε": "E", "Ζ": "Z", "Η": "H", "Ι": "I", "Κ": "K", "Μ": "M", "Ν": "N",
+        "Ο": "O", "Ρ": "P", "Τ": "T", "Υ": "Y", "Χ": "X", "ο": "o", "α": "a", "ι": "i", "ν": "v",
+    },
+    "greek": {
+        "A": "Α", "B": "Β", "E": "Ε", "Z": "Ζ", "H": "Η", "I": "Ι", "K": "Κ", "M": "Μ", "N": "Ν",
+        "O": "Ο", "P": "Ρ", "T": "Τ", "Y": "Υ", "X": "Χ", "o": "ο", "a": "α", "i": "ι", "v": "ν",
+        "u": "υ", "p": "ρ", "x": "χ", "w": "ω", "k": "κ",
+    },
+}
+HOMOGLYPHS["old_english"] = HOMOGLYPHS["latin"]
+
+
+@dataclass
+class CleanupResult:
+    text: str
+    # Share of words that look clean after the rules, 0..1
+    quality: float
+    words: int
+    fixes: Dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict:
+        return {"quality": round(self.quality, 4), "words": self.words, "fixes": self.fixes}
+
+
+def fold(ch: str) -> str:
+    """Base letter of a character, lowercased; combining marks fold to ''."""
+    if unicodedata.combining(ch):
+        return ""
+    return unicodedata.normalize("NFD", ch)[0].lower()
+
+
+class Trie:
+    def __init__(self, words=()):
+        """Character trie over folded words, for splitting run-together words."""
+        self.root: Dict = {}
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str):
+        node = self.root
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def __contains__(self, word: str) -> bool:
+        node = self.root
+        for ch in word:
+            node = node.get(ch)
+            if node is None:
+                return False
+        return "" in node
+
+    def prefix_ends(self, text: str, start: int) -> List[int]:
+        """End offsets of every lexicon word that starts at text[start]."""
+        ends, node = [], self.root
+        for i in range(start, len(text)):
+            node = node.get(text[i])
+            if node is None:
+                break
+            if "" in node:
+                ends.append(i + 1)
+        return ends
+
+    def split(self, text: str) -> Optional[List[int]]:
+        """
+        Cut offsets splitting text into the fewest lexicon words (at most
+        SPLIT_MAX_PARTS), or None when it cannot be split.
+        """
+        best: List[Optional[List[int]]] = [None] * (len(text) + 1)
+        best[0] = []
+        for start in range(len(text)):
+            if best[start] is None or len(best[start]) >= SPLIT_MAX_PARTS:
+                continue
+            for end in self.prefix_ends(text, start):
+                candidate = best[start] + [end]
+                if best[end] is None or len(candidate) < len(best[end]):
+                    best[end] = candidate
+        cuts = best[len(text)]
+        return cuts[:-1] if cuts and len(cuts) > 1 else None
+
+
+def _folded_words(text: str) -> List[str]:
+    return ["".join(fold(ch) for ch in word) for word in re.findall(r"\w+", unicodedata.normalize("NFC", text))]
+
+
+def _load_bigrams(language: str) -> set:
+    """
+    Letter pairs seen inside words of the lexicon and the language detection
+    sample. A word with a pair outside this set most likely has a misread
+    letter ("prlncipio", "verbnm"). The sample is small, so some valid words
+    are flagged as well; that only sends more text to the LLM.
+    """
+    bigrams = set()
+    for path in (LEXICON_DIR / f"{language}.txt", SAMPLES_DIR / f"{language}.txt"):
+        if path.exists():
+            lines = [line for line in path.read_text(encoding="utf-8").splitlines() if not line.startswith("#")]
+            for word in _folded_words("\n".join(lines)):
+                bigrams.update(word[i:i + 2] for i in range(len(word) - 1))
+    return bigrams
+
+
+def _load_lexicon(language: str) -> Trie:
+    trie = Trie()
+    path = LEXICON_DIR / f"{language}.txt"
+    if path.exists():
+        for line in path.read_text(encoding="utf-8").splitlines():
+            if line.startswith("#"):
+                continue
+            for word in line.split():
+                trie.add("".join(fold(ch) for ch in unicodedata.normalize("NFC", word)))
+    return trie
+
+
+class RuleSet:
+    def __init__(self, language: str):
+        """Compiled cleanup rules for one correction language."""
+        self.language = language
+        self.scripts = set(LANGUAGE_SCRIPTS.get(language, ()))
+        table = {ord(ch): None for ch in STRAY_SYMBOLS}
+        table.update({ord(ch): value for ch, value in CHARACTER_MAP.get(language, {}).items()})
+        self.translation = table
+        self.abbreviations = ABBREVIATIONS.get(language, {})
+        self.words = WORD_REPLACEMENTS.get(language, {})
+        self.homoglyphs = HOMOGLYPHS.get(language, {})
+        self.lexicon = _load_lexicon(language)
+        self.needs_vowels = language in ("latin", "old_english", "greek")
+        # Alphabetic scripts only; Devanagari samples are too small to judge letter pairs by
+        self.bigrams = _load_bigrams(language) if self.needs_vowels else set()
+
+    def apply(self, text: str) -> CleanupResult:
+        """
+        Run every rule over text: one translate() for character maps and
+        stray symbols, then one pass over whitespace-separated tokens for
+        abbreviations, homoglyphs and word splitting, which also scores
+        how clean each word looks.
+        """
+        fixes = {"abbreviations": 0, "homoglyphs": 0, "splits": 0}
+        counts = {"words": 0, "suspicious": 0}
+        text = unicodedata.normalize("NFC", text).translate(self.translation)
+
+        def token(match: re.Match) -> str:
+            fixed = self._fix_token(match.group(0), fixes)
+            for word in fixed.split(" "):
+                core = word.strip(EDGE_PUNCTUATION)
+                if core:
+                    counts["words"] += 1
+                    counts["suspicious"] += self._suspicious(core)
+            return fixed
+
+        text = re.sub(r"\S+", token, text)
+        text = "\n".join(" ".join(line.split()) for line in text.splitlines())
+        words = counts["words"]
+        quality = 1.0 - counts["suspicious"] / words if words else 1.0
+        return CleanupResult(text.strip(), quality, words, {k: v for k, v in fixes.items() if v})
+
+    def _fix_token(self, token: str, fixes: Dict[str, int]) -> str:
+        if token in self.words:
+            fixes["abbreviations"] += 1
+            return self.words[token]
+        lead = len(token) - len(token.lstrip(EDGE_PUNCTUATION))
+        trail = len(token) - len(token.rstrip(EDGE_PUNCTUATION))
+        core = token[lead:len(token) - trail] if trail else token[lead:]
+        if not core:
+            return token
+        prefix, suffix = token[:lead], token[len(token) - trail:] if trail else ""
+
+        expanded = self._expand(core)
+        if expanded is not None:
+            fixes["abbreviations"] += 1
+            return prefix + expanded + suffix
+
+        if self.homoglyphs and len({script_of(ch) for ch in core if ch.isalpha()} - {""}) > 1:
+            core = "".join(self.homoglyphs.get(ch, ch) for ch in core)
+            fixes["homoglyphs"] += 1
+
+        # Only words that already look wrong are split; "propterea" stays whole
+        if len(core) >= SPLIT_MIN_CHARS and core.isalpha() and self._suspicious(core):
+            split = self._split(core)
+            if split is not None:
+                fixes["splits"] += 1
+                core = split
+        return prefix + core + suffix
+
+    def _expand(self, core: str) -> Optional[str]:
+        if not self.abbreviations:
+            return None
+        decomposed = unicodedata.normalize("NFD", core)
+        marked = any(ch in ABBREVIATION_MARKS for ch in decomposed)
+        key = "".join(ch for ch in decomposed if not unicodedata.combining(ch)).upper()
+        expansion = self.abbreviations.get(key)
+        if expansion is None or not (marked or (len(key) > 1 and core.isupper())):
+            return None
+        base = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+        if base.isupper() and len(base) > 1:
+            return expansion
+        if base[:1].isupper():
+            return expansion[:1] + expansion[1:].lower()
+        return expansion.lower()
+
+    def _split(self, core: str) -> Optional[str]:
+        # Folded letters, and where each one sits in the original word
+        folded, positions = [], []
+        for i, ch in enumerate(core):
+            base = fold(ch)
+            if base:
+                folded.append(base)
+                positions.append(i)
+        folded_text = "".join(folded)
+        if folded_text in self.lexicon:
+            return None
+        cuts = self.lexicon.split(folded_text)
+        if cuts is None:
+            return None
+        bounds = [0] + [positions[c] for c in cuts] + [len(core)]
+        parts = [core[a:b] for a, b in zip(bounds, bounds[1:])]
+        # The split has to explain what looked wrong, not move it into a part
+        if any(self._suspicious(part) for part in parts):
+            return None
+        return " ".join(parts)
+
+    def _suspicious(self, word: str) -> bool:
+        has_letter = has_digit = False
+        scripts = set()
+        previous, run = "", 0
+        for ch in word:
+            if ch.isdigit():
+                has_digit = True
+            elif unicodedata.category(ch)[0] in ("L", "M"):
+                has_letter = True
+                script = script_of(ch)
+                if script:
+                    scripts.add(script)
+            else:
+                # Symbol or punctuation inside the word
+                return True
+            run = run + 1 if ch == previous else 1
+            previous = ch
+            if run >= 3:
+                return True
+        if has_letter and has_digit:
+            return True
+        if len(scripts) > 1 or (self.scripts and scripts - self.scripts):
+            return True
+        if self.needs_vowels and has_letter:
+            if len(word) > MAX_WORD_CHARS:
+                return True
+            folded = "".join(fold(ch) for ch in word)
+            if folded in self.lexicon:
+                return False
+            if len(folded) > 1 and not VOWELS.intersection(folded):
+                return True
+            if self.bigrams and any(folded[i:i + 2] not in self.bigrams for i in range(len(folded) - 1)):
+                return True
+        return False
+
+
+_rule_sets: Dict[str, RuleSet] = {}
+_rule_sets_lock = threading.Lock()
+
+
+def get_rule_set(language: str) -> RuleSet:
+    with _rule_sets_lock:
+        rules = _rule_sets.get(language)
+        if rules is None:
+            rules = _rule_sets[language] = RuleSet(language)
+        return rules
+
+
+def apply_rules(text: str, language: str) -> CleanupResult:
+    """Deterministic OCR cleanup for a correction language."""
+    return get_rule_set(language).apply(text)
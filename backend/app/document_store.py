@@ -0,0 +1,410 @@
+import base64
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_STORE_ENABLED = os.getenv("DOCUMENT_STORE_ENABLED", "1") not in ("0", "false", "False")
+DOCUMENT_STORE_PATH = os.getenv("DOCUMENT_STORE_PATH", os.path.join("data", "documents.sqlite3"))
+
+# Projectable fields -> column. Document metadata is small and returned by
+# default; page blobs (analysis, regions, word tables) only when asked for.
+DOCUMENT_FIELDS = {
+    "id": "id",
+    "sha256": "sha256",
+    "filename": "filename",
+    "language": "language",
+    "ocr_backend": "ocr_backend",
+    "preprocess_tier": "preprocess_tier",
+    "page_count": "page_count",
+    "status": "status",
+    "file_url": "file_url",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+}
+PAGE_FIELDS = {
+    "page": "page",
+    "success": "success",
+    "language": "language",
+    "preprocessed_file": "preprocessed_file",
+    "error": "error",
+    "raw_ocr_text": "raw_text",
+    "accurate_text": "corrected_text",
+    "text_analysis": "analysis",
+    "regions": "regions",
+    "ocr_words": "ocr_words",
+}
+# Stored as JSON text
+JSON_COLUMNS = {"analysis", "regions", "ocr_words"}
+DEFAULT_PAGE_FIELDS = ("page", "success", "language", "preprocessed_file", "error", "raw_ocr_text", "accurate_text")
+# Not columns: joined from the translations table
+TRANSLATIONS_FIELD = "translations"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    sha256 TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    language TEXT,
+    ocr_backend TEXT,
+    preprocess_tier TEXT,
+    page_count INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    file_url TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_sha256 ON documents(sha256);
+CREATE INDEX IF NOT EXISTS idx_documents_language ON documents(language, seq);
+CREATE INDEX IF NOT EXISTS idx_documents_filename ON documents(filename, seq);
+CREATE INDEX IF NOT EXISTS idx_documents_status ON documents(status, seq);
+CREATE INDEX IF NOT EXISTS idx_documents_created ON documents(created_at);
+
+CREATE TABLE IF NOT EXISTS pages (
+    document_id TEXT NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    page INTEGER NOT NULL,
+    success INTEGER NOT NULL,
+    language TEXT,
+    preprocessed_file TEXT,
+    error TEXT,
+    raw_text TEXT,
+    corrected_text TEXT,
+    analysis TEXT,
+    regions TEXT,
+    ocr_words TEXT,
+    PRIMARY KEY (document_id, page)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS translations (
+    document_id TEXT NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    page INTEGER NOT NULL,
+    source_lang TEXT NOT NULL,
+    target_lang TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (document_id, page, source_lang, target_lang)
+) WITHOUT ROWID;
+"""
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(value: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    """The position after which the next page starts; None for the first page."""
+    if not cursor:
+        return None
+    try:
+        (value,) = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return int(value)
+    except (ValueError, TypeError):
+        raise InvalidCursorError("Invalid cursor")
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str], default: Sequence[str]) -> List[str]:
+    """Comma-separated field names, validated; the default set when none are given."""
+    if not fields:
+        return list(default)
+    names = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in names if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)} (allowed: {', '.join(allowed)})")
+    return names
+
+
+def result_pages(result: Dict) -> List[Dict]:
+    """Per-page entries of a pipeline result; a single image is page 1."""
+    if "pages" in result:
+        return result["pages"]
+    return [{**result, "page": 1}]
+
+
+def document_status(pages: List[Dict]) -> str:
+    succeeded = sum(1 for p in pages if p.get("success"))
+    if pages and succeeded == len(pages):
+        return "done"
+    return "partial" if succeeded else "failed"
+
+
+class DocumentStore:
+    def __init__(self, path: str = DOCUMENT_STORE_PATH):
+        """
+        Processed documents, their pages and translations, in SQLite (WAL).
+        Writes go through one connection under a lock; reads use a
+        connection per thread, so they never wait for a writer.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = self._connect()
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # Writes
+
+    def save_document(self, document_id: str, sha256: str, filename: str, pages: List[Dict],
+                      status: Optional[str] = None, **meta: Any):
+        """
+        Insert or update a document and its pages in one transaction.
+        meta: language, ocr_backend, preprocess_tier, page_count, file_url.
+        """
+        now = time.time()
+        status = status or document_status(pages)
+        page_count = meta.get("page_count") or len(pages)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO documents (id, sha256, filename, language, ocr_backend, preprocess_tier, "
+                "page_count, status, file_url, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET sha256 = excluded.sha256, filename = excluded.filename, "
+                "language = COALESCE(excluded.language, documents.language), "
+                "ocr_backend = excluded.ocr_backend, preprocess_tier = excluded.preprocess_tier, "
+                "page_count = excluded.page_count, status = excluded.status, "
+                "file_url = excluded.file_url, updated_at = excluded.updated_at",
+                (document_id, sha256, filename, meta.get("language"), meta.get("ocr_backend"),
+                 meta.get("preprocess_tier"), page_count, status, meta.get("file_url"), now, now),
+            )
+            self._write_pages(document_id, pages)
+
+    def save_pages(self, document_id: str, pages: List[Dict]):
+        """Add or replace pages of a document saved before, e.g. while a document streams."""
+        with self._lock, self._conn:
+            self._write_pages(document_id, pages)
+            self._conn.execute("UPDATE documents SET updated_at = ? WHERE id = ?", (time.time(), document_id))
+
+    def _write_pages(self, document_id: str, pages: List[Dict]):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO pages (document_id, page, success, language, preprocessed_file, error, "
+            "raw_text, corrected_text, analysis, regions, ocr_words) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (document_id, p["page"], int(bool(p.get("success"))), p.get("language"),
+                 p.get("preprocessed_file"), p.get("error"), p.get("raw_ocr_text"), p.get("accurate_text"),
+                 _dumps(p.get("text_analysis")), _dumps(p.get("regions")), _dumps(p.get("ocr_words")))
+                for p in pages
+            ],
+        )
+
+    def finish_document(self, document_id: str, language: Optional[str] = None):
+        """Set the status (and language) of a streamed document from its saved pages."""
+        with self._lock, self._conn:
+            succeeded, total = self._conn.execute(
+                "SELECT COALESCE(SUM(success), 0), COUNT(*) FROM pages WHERE document_id = ?", (document_id,)
+            ).fetchone()
+            status = "done" if total and succeeded == total else ("partial" if succeeded else "failed")
+            self._conn.execute(
+                "UPDATE documents SET status = ?, language = COALESCE(?, language), updated_at = ? WHERE id = ?",
+                (status, language, time.time(), document_id),
+            )
+
+    def save_translation(self, document_id: str, page: Optional[int], source_lang: str,
+                         target_lang: str, text: str):
+        """A translation of one page, or of the whole document when page is None."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO translations (document_id, page, source_lang, target_lang, text, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (document_id, page or 0, source_lang, target_lang, text, time.time()),
+            )
+
+    def delete_document(self, document_id: str) -> bool:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM documents WHERE id = ?", (document_id,)).rowcount > 0
+
+    # Reads
+
+    def exists(self, document_id: str) -> bool:
+        return self._reader().execute("SELECT 1 FROM documents WHERE id = ?", (document_id,)).fetchone() is not None
+
+    def list_documents(self, fields: Sequence[str], limit: int = 50, cursor: Optional[str] = None,
+                       **filters: Any) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Newest first, `limit` at a time. Filters: language, sha256, filename,
+        status (exact) and created_after / created_before (epoch seconds).
+        Returns (documents, next_cursor); next_cursor is None on the last page.
+        """
+        after = decode_cursor(cursor)
+        where, params = [], []
+        for name in ("language", "sha256", "filename", "status"):
+            if filters.get(name) is not None:
+                where.append(f"{name} = ?")
+                params.append(filters[name])
+        if filters.get("created_after") is not None:
+            where.append("created_at >= ?")
+            params.append(filters["created_after"])
+        if filters.get("created_before") is not None:
+            where.append("created_at < ?")
+            params.append(filters["created_before"])
+        if after is not None:
+            where.append("seq < ?")
+            params.append(after)
+        columns = [DOCUMENT_FIELDS[f] for f in fields if f in DOCUMENT_FIELDS]
+        sql = f"SELECT seq, {', '.join(['id'] + columns)} FROM documents"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY seq DESC LIMIT ?"
+        conn = self._reader()
+        rows = conn.execute(sql, params + [limit + 1]).fetchall()
+        documents = []
+        for row in rows[:limit]:
+            document = dict(zip(columns, row[2:]))
+            if TRANSLATIONS_FIELD in fields:
+                document[TRANSLATIONS_FIELD] = self._translations(conn, row[1])
+            documents.append({f: document[DOCUMENT_FIELDS.get(f, f)] for f in fields})
+        next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+        return documents, next_cursor
+
+    def get_document(self, document_id: str, fields: Sequence[str]) -> Optional[Dict]:
+        columns = [DOCUMENT_FIELDS[f] for f in fields if f in DOCUMENT_FIELDS]
+        conn = self._reader()
+        row = conn.execute(
+            f"SELECT {', '.join(['id'] + columns)} FROM documents WHERE id = ?", (document_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        document = dict(zip(columns, row[1:]))
+        if TRANSLATIONS_FIELD in fields:
+            document[TRANSLATIONS_FIELD] = self._translations(conn, document_id)
+        return {f: document[DOCUMENT_FIELDS.get(f, f)] for f in fields}
+
+    def list_pages(self, document_id: str, fields: Sequence[str], limit: int = 50,
+                   cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Pages in order, `limit` at a time; only the requested columns are read."""
+        after = decode_cursor(cursor) or 0
+        columns = [PAGE_FIELDS[f] for f in fields if f in PAGE_FIELDS]
+        conn = self._reader()
+        rows = conn.execute(
+            f"SELECT {', '.join(['page'] + columns)} FROM pages WHERE document_id = ? AND page > ? "
+            "ORDER BY page LIMIT ?",
+            (document_id, after, limit + 1),
+        ).fetchall()
+        translations: Dict[int, List[Dict]] = {}
+        if TRANSLATIONS_FIELD in fields and rows:
+            for entry in self._translations(conn, document_id, rows[0][0], rows[:limit][-1][0]):
+                translations.setdefault(entry.pop("page"), []).append(entry)
+        pages = [self._page(row, columns, fields, translations) for row in rows[:limit]]
+        next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+        return pages, next_cursor
+
+    def get_page(self, document_id: str, page: int, fields: Sequence[str]) -> Optional[Dict]:
+        columns = [PAGE_FIELDS[f] for f in fields if f in PAGE_FIELDS]
+        conn = self._reader()
+        row = conn.execute(
+            f"SELECT {', '.join(['page'] + columns)} FROM pages WHERE document_id = ? AND page = ?",
+            (document_id, page),
+        ).fetchone()
+        if row is None:
+            return None
+        translations: Dict[int, List[Dict]] = {}
+        if TRANSLATIONS_FIELD in fields:
+            for entry in self._translations(conn, document_id, page, page):
+                translations.setdefault(entry.pop("page"), []).append(entry)
+        return self._page(row, columns, fields, translations)
+
+    @staticmethod
+    def _page(row: tuple, columns: List[str], fields: Sequence[str], translations: Dict[int, List[Dict]]) -> Dict:
+        values = {}
+        for column, value in zip(columns, row[1:]):
+            if column in JSON_COLUMNS:
+                value = json.loads(value) if value is not None else None
+            elif column == "success":
+                value = bool(value)
+            values[column] = value
+        values[TRANSLATIONS_FIELD] = translations.get(row[0], [])
+        return {f: values[PAGE_FIELDS.get(f, f)] for f in fields}
+
+    @staticmethod
+    def _translations(conn: sqlite3.Connection, document_id: str, first_page: Optional[int] = None,
+                      last_page: Optional[int] = None) -> List[Dict]:
+        """Translations of a document (page None = whole document), or of pages first..last."""
+        sql = "SELECT page, source_lang, target_lang, text, created_at FROM translations WHERE document_id = ?"
+        params: List[Any] = [document_id]
+        if first_page is not None:
+            sql += " AND page BETWEEN ? AND ?"
+            params += [first_page, last_page]
+        return [
+            {"page": page or None, "source_lang": source, "target_lang": target, "text": text, "created_at": created}
+            for page, source, target, text, created in conn.execute(sql + " ORDER BY page, target_lang", params)
+        ]
+
+    def stats(self) -> Dict:
+        documents, pages, translations = self._reader().execute(
+            "SELECT (SELECT COUNT(*) FROM documents), (SELECT COUNT(*) FROM pages), "
+            "(SELECT COUNT(*) FROM translations)"
+        ).fetchone()
+        return {"enabled": DOCUMENT_STORE_ENABLED, "documents": documents, "pages": pages,
+                "translations": translations}
+
+
+def _dumps(value: Any) -> Optional[str]:
+    return json.dumps(value, ensure_ascii=False) if value is not None else None
+
+
+# Singleton
+_document_store: Optional[DocumentStore] = None
+_document_store_lock = threading.Lock()
+
+
+def get_document_store() -> DocumentStore:
+    global _document_store
+    with _document_store_lock:
+        if _document_store is None:
+            _document_store = DocumentStore()
+        return _document_store
+
+
+def save_result(document_id: str, sha256: str, result: Dict, **meta: Any) -> Optional[str]:
+    """
+    Store a pipeline result (single image or multi-page) under document_id.
+    Returns the id, or None when the store is disabled or the write failed;
+    a storage problem never fails the upload itself.
+    """
+    if not DOCUMENT_STORE_ENABLED:
+        return None
+    pages = result_pages(result)
+    try:
+        get_document_store().save_document(
+            document_id, sha256, result.get("original_filename") or result.get("filename") or "", pages,
+            language=result.get("language"), file_url=result.get("file_url"),
+            page_count=result.get("page_count") or len(pages), **meta,
+        )
+    except (sqlite3.Error, TypeError, ValueError) as e:
+        logger.warning(f"Could not store document {document_id}: {e}")
+        return None
+    return document_id
+
+
+def _reset_after_fork():
+    # A SQLite connection must not be shared across fork; children reconnect lazily
+    global _document_store, _document_store_lock
+    _document_store = None
+    _document_store_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,84 @@
+import os
+from typing import Dict, Iterator, Tuple
+
+from app.job_queue import queue_task
+from app.lazy import lazy_import
+from app.preprocess import preprocess_array, write_image
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+# Resolution PDF pages are rasterized at before preprocessing
+PDF_RASTER_DPI = int(os.getenv("PDF_RASTER_DPI", "300"))
+
+MULTIPAGE_EXTENSIONS = {".pdf", ".tif", ".tiff"}
+
+
+def is_multipage(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in MULTIPAGE_EXTENSIONS
+
+
+def _open_pdf(path: str):
+    try:
+        import fitz  # PyMuPDF
+    except ImportError as e:
+        raise RuntimeError("PDF support requires PyMuPDF (pip install PyMuPDF)") from e
+    return fitz.open(path)
+
+
+def count_pages(path: str) -> int:
+    """Number of pages without decoding any of them."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        with _open_pdf(path) as doc:
+            return doc.page_count
+    if ext in (".tif", ".tiff"):
+        return cv2.imcount(path)
+    return 1
+
+
+def load_page(path: str, index: int, dpi: int = PDF_RASTER_DPI) -> "np.ndarray":
+    """
+    Decode a single page as a grayscale array. Only this page is held in
+    memory, so workers can process pages of arbitrarily long documents.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        import fitz
+        with _open_pdf(path) as doc:
+            page = doc.load_page(index)
+            pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+            # Copy out of the pixmap buffer before the document is closed
+            return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width].copy()
+    if ext in (".tif", ".tiff"):
+        ok, pages = cv2.imreadmulti(path, index, 1, flags=cv2.IMREAD_GRAYSCALE)
+        if not ok or not pages:
+            raise ValueError(f"Unable to read page {index + 1} of {path}")
+        return pages[0]
+    if index != 0:
+        raise IndexError(f"{path} has a single page")
+    img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise ValueError(f"Unable to read image: {path}")
+    return img
+
+
+def iter_pages(path: str, dpi: int = PDF_RASTER_DPI) -> Iterator[Tuple[int, "np.ndarray"]]:
+    """Lazily yield (index, grayscale page) one page at a time."""
+    for index in range(count_pages(path)):
+        yield index, load_page(path, index, dpi)
+
+
+def preprocess_page(path: str, index: int, output_path: str, tier: str, timings=None) -> str:
+    """Rasterize one page, preprocess it and write the binarized PNG."""
+    page = load_page(path, index)
+    binary = preprocess_array(page, tier, timings)
+    del page
+    return write_image(output_path, binary)
+
+
+@queue_task
+def preprocess_page_to_file(path: str, index: int, output_path: str, tier: str) -> Tuple[str, Dict[str, float]]:
+    """preprocess_page returning its sub-step timings, so it can run in a stage worker."""
+    timings: Dict[str, float] = {}
+    return preprocess_page(path, index, output_path, tier, timings), timings
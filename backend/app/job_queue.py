@@ -0,0 +1,373 @@
+import asyncio
+import importlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# With the queue on, blocking stages run in dedicated stage worker processes
+# (python -m app.stage_worker) instead of the web workers' thread pools
+JOB_QUEUE_ENABLED = os.getenv("JOB_QUEUE_ENABLED", "0") not in ("0", "false", "False")
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join("data", "queue.sqlite3"))
+JOB_QUEUE_STAGES = {
+    s.strip() for s in os.getenv("JOB_QUEUE_STAGES", "preprocess,ocr,correct,analyze").split(",") if s.strip()
+}
+# How often waiting web workers and idle stage workers check the queue
+JOB_QUEUE_POLL_SECONDS = float(os.getenv("JOB_QUEUE_POLL_SECONDS", "0.02"))
+# A running task whose worker stops renewing its lease for this long is
+# handed to another worker; stage workers renew every JOB_QUEUE_HEARTBEAT_SECONDS
+JOB_QUEUE_LEASE_SECONDS = float(os.getenv("JOB_QUEUE_LEASE_SECONDS", "60"))
+JOB_QUEUE_HEARTBEAT_SECONDS = float(os.getenv("JOB_QUEUE_HEARTBEAT_SECONDS", str(JOB_QUEUE_LEASE_SECONDS / 4)))
+JOB_QUEUE_MAX_ATTEMPTS = int(os.getenv("JOB_QUEUE_MAX_ATTEMPTS", "2"))
+JOB_QUEUE_TIMEOUT_SECONDS = float(os.getenv("JOB_QUEUE_TIMEOUT_SECONDS", "900"))
+# Finished tasks nobody collected and shared job snapshots are dropped after this
+JOB_QUEUE_RETENTION_SECONDS = int(os.getenv("JOB_QUEUE_RETENTION_SECONDS", "3600"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    stage TEXT NOT NULL,
+    name TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_claim ON tasks(status, stage, id);
+CREATE INDEX IF NOT EXISTS idx_tasks_lease ON tasks(status, lease_until);
+
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (id, stage)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    snapshot TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Functions stage workers may run, by "module:qualname"
+_tasks: Dict[str, Callable] = {}
+
+
+def queue_task(fn: Callable) -> Callable:
+    """
+    Mark a stage function as runnable by stage workers. Its arguments and
+    result must be JSON-serializable (objects with to_dict() are converted).
+    """
+    name = f"{fn.__module__}:{fn.__qualname__}"
+    _tasks[name] = fn
+    fn.queue_name = name
+    return fn
+
+
+def is_queued(stage: str) -> bool:
+    return JOB_QUEUE_ENABLED and stage in JOB_QUEUE_STAGES
+
+
+def resolve_task(name: str) -> Callable:
+    """The registered function for a task name, importing its module on first use."""
+    if name not in _tasks:
+        importlib.import_module(name.split(":", 1)[0])
+    try:
+        return _tasks[name]
+    except KeyError:
+        raise LookupError(f"Not a queue task: {name}")
+
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, default=lambda o: o.to_dict())
+
+
+class TaskFailed(RuntimeError):
+    pass
+
+
+class JobQueue:
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        """
+        Stage tasks and job snapshots shared by every web and stage worker
+        process on the host, in SQLite (WAL). Each thread has its own
+        connection; claims take the write lock so a task runs once.
+        """
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # Tasks
+
+    def submit(self, stage: str, name: str, args: Iterable = (), kwargs: Optional[Dict] = None) -> int:
+        payload = _encode({"args": list(args), "kwargs": kwargs or {}})
+        return self._conn().execute(
+            "INSERT INTO tasks (stage, name, payload, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+            (stage, name, payload, time.time()),
+        ).lastrowid
+
+    def claim(self, stages: Iterable[str], worker: str) -> Optional[Tuple[int, str, List, Dict]]:
+        """Take the oldest queued task of the given stages: (id, name, args, kwargs), or None."""
+        stages = list(stages)
+        now = time.time()
+        conn = self._conn()
+        # SELECT then UPDATE under the write lock (no UPDATE ... RETURNING before SQLite 3.35)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._expire_leases(conn, now)
+            row = conn.execute(
+                f"SELECT id, name, payload FROM tasks WHERE status = 'queued' AND stage IN "
+                f"({', '.join('?' * len(stages))}) ORDER BY id LIMIT 1",
+                stages,
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE tasks SET status = 'running', worker = ?, started_at = ?, lease_until = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (worker, now, now + JOB_QUEUE_LEASE_SECONDS, row[0]),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        payload = json.loads(row[2])
+        return row[0], row[1], payload["args"], payload["kwargs"]
+
+    @staticmethod
+    def _expire_leases(conn: sqlite3.Connection, now: float):
+        # Workers that died mid-task: retry, or give up after JOB_QUEUE_MAX_ATTEMPTS
+        conn.execute(
+            "UPDATE tasks SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, "
+            "error = CASE WHEN attempts < ? THEN NULL ELSE 'Stage worker lost' END, "
+            "finished_at = CASE WHEN attempts < ? THEN NULL ELSE ? END "
+            "WHERE status = 'running' AND lease_until < ?",
+            (JOB_QUEUE_MAX_ATTEMPTS, JOB_QUEUE_MAX_ATTEMPTS, JOB_QUEUE_MAX_ATTEMPTS, now, now),
+        )
+
+    def heartbeat(self, task_ids: List[int], worker: str) -> List[int]:
+        """Extend the leases of running tasks this worker holds; returns the ids it still holds."""
+        if not task_ids:
+            return []
+        placeholders = ", ".join("?" * len(task_ids))
+        conn = self._conn()
+        conn.execute(
+            f"UPDATE tasks SET lease_until = ? WHERE status = 'running' AND worker = ? AND id IN ({placeholders})",
+            (time.time() + JOB_QUEUE_LEASE_SECONDS, worker, *task_ids),
+        )
+        return [row[0] for row in conn.execute(
+            f"SELECT id FROM tasks WHERE status = 'running' AND worker = ? AND id IN ({placeholders})",
+            (worker, *task_ids),
+        )]
+
+    def complete(self, task_id: int, result: Any, worker: str) -> bool:
+        """Store a result; False (and nothing stored) when the worker no longer holds the task."""
+        return self._conn().execute(
+            "UPDATE tasks SET status = 'done', result = ?, finished_at = ? "
+            "WHERE id = ? AND status = 'running' AND worker = ?",
+            (_encode(result), time.time(), task_id, worker),
+        ).rowcount == 1
+
+    def fail(self, task_id: int, error: str, worker: str) -> bool:
+        return self._conn().execute(
+            "UPDATE tasks SET status = 'failed', error = ?, finished_at = ? "
+            "WHERE id = ? AND status = 'running' AND worker = ?",
+            (error, time.time(), task_id, worker),
+        ).rowcount == 1
+
+    def cancel(self, task_ids: List[int]):
+        """Drop tasks nobody waits for any more; running ones finish and are purged later."""
+        if task_ids:
+            self._conn().execute(
+                f"DELETE FROM tasks WHERE status = 'queued' AND id IN ({', '.join('?' * len(task_ids))})", task_ids
+            )
+
+    def take_results(self, task_ids: List[int]) -> List[Tuple[int, str, Any, Optional[str]]]:
+        """(id, status, result, error) of the given tasks that have finished; those rows are removed."""
+        if not task_ids:
+            return []
+        placeholders = ", ".join("?" * len(task_ids))
+        conn = self._conn()
+        rows = conn.execute(
+            f"SELECT id, status, result, error FROM tasks WHERE id IN ({placeholders}) "
+            "AND status IN ('done', 'failed')",
+            task_ids,
+        ).fetchall()
+        if rows:
+            conn.execute(
+                f"DELETE FROM tasks WHERE id IN ({', '.join('?' * len(rows))})", [row[0] for row in rows]
+            )
+        return [(i, status, json.loads(result) if result is not None else None, error)
+                for i, status, result, error in rows]
+
+    def purge(self, max_age_seconds: float = JOB_QUEUE_RETENTION_SECONDS):
+        """Drop uncollected results and stale job snapshots."""
+        cutoff = time.time() - max_age_seconds
+        conn = self._conn()
+        conn.execute("DELETE FROM tasks WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+        conn.execute("DELETE FROM jobs WHERE updated_at < ?", (cutoff,))
+        conn.execute("DELETE FROM workers WHERE seen_at < ?", (cutoff,))
+
+    # Stage workers, so web workers can tell whether a queued stage is served
+
+    def register_worker(self, worker: str, stages: Iterable[str]):
+        """Record that a stage worker is up and ready for these stages; repeated on every heartbeat."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO workers (id, stage, seen_at) VALUES (?, ?, ?)",
+                [(worker, stage, now) for stage in stages],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def unregister_worker(self, worker: str):
+        self._conn().execute("DELETE FROM workers WHERE id = ?", (worker,))
+
+    def live_workers(self, stage: str) -> int:
+        """Stage workers that served this stage within the last lease period."""
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM workers WHERE stage = ? AND seen_at >= ?",
+            (stage, time.time() - JOB_QUEUE_LEASE_SECONDS),
+        ).fetchone()[0]
+
+    # Job snapshots, so any web worker can answer /api/jobs/{id}
+
+    def save_jobs(self, snapshots: List[Tuple[str, Dict]]):
+        """Write (job id, snapshot) pairs in one transaction."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO jobs (id, snapshot, updated_at) VALUES (?, ?, ?)",
+                [(job_id, _encode(snapshot), now) for job_id, snapshot in snapshots],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def load_job(self, job_id: str) -> Optional[Tuple[Dict, float]]:
+        """(snapshot, updated_at) or None."""
+        row = self._conn().execute("SELECT snapshot, updated_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def stats(self) -> Dict:
+        stages: Dict[str, Dict[str, int]] = {}
+        for stage, status, count in self._conn().execute(
+            "SELECT stage, status, COUNT(*) FROM tasks GROUP BY stage, status"
+        ):
+            stages.setdefault(stage, {})[status] = count
+        return {
+            "enabled": JOB_QUEUE_ENABLED,
+            "queued_stages": sorted(JOB_QUEUE_STAGES) if JOB_QUEUE_ENABLED else [],
+            "stages": stages,
+        }
+
+
+class QueueClient:
+    def __init__(self, queue: JobQueue):
+        """
+        Submits tasks from a web worker and awaits their results. One poller
+        per event loop checks every pending task in a single query.
+        """
+        self.queue = queue
+        self._waiters: Dict[int, asyncio.Future] = {}
+        self._poller: Optional[asyncio.Task] = None
+
+    async def call(self, stage: str, fn: Callable, args: Iterable, kwargs: Dict,
+                   timeout: float = JOB_QUEUE_TIMEOUT_SECONDS) -> Any:
+        loop = asyncio.get_running_loop()
+        task_id = await loop.run_in_executor(None, self.queue.submit, stage, fn.queue_name, args, kwargs)
+        future = self._waiters[task_id] = loop.create_future()
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll())
+        try:
+            status, result, error = await asyncio.wait_for(future, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            self._waiters.pop(task_id, None)
+            await loop.run_in_executor(None, self.queue.cancel, [task_id])
+            raise
+        if status == "failed":
+            raise TaskFailed(error or f"{stage} task failed")
+        return result
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        while self._waiters:
+            await asyncio.sleep(JOB_QUEUE_POLL_SECONDS)
+            try:
+                finished = await loop.run_in_executor(None, self.queue.take_results, list(self._waiters))
+            except sqlite3.Error as e:
+                logger.warning(f"Job queue poll failed: {e}")
+                continue
+            for task_id, status, result, error in finished:
+                future = self._waiters.pop(task_id, None)
+                if future is not None and not future.done():
+                    future.set_result((status, result, error))
+
+
+# Singletons
+_job_queue: Optional[JobQueue] = None
+_queue_clients: Dict[asyncio.AbstractEventLoop, QueueClient] = {}
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
+
+
+def get_queue_client() -> QueueClient:
+    """The client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _queue_clients.get(loop)
+    if client is None:
+        for closed in [l for l in _queue_clients if l.is_closed()]:
+            del _queue_clients[closed]
+        client = _queue_clients[loop] = QueueClient(get_job_queue())
+    return client
+
+
+def _reset_after_fork():
+    # SQLite connections must not be shared across fork; children reconnect lazily
+    global _job_queue, _queue_clients, _job_queue_lock
+    _job_queue = None
+    _queue_clients = {}
+    _job_queue_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
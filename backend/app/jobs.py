@@ -0,0 +1,303 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app.job_queue import JOB_QUEUE_ENABLED, get_job_queue, get_queue_client, is_queued
+from app.metrics import STAGE_SECONDS, record_request_span
+
+logger = logging.getLogger(__name__)
+
+# Bounded worker pool per pipeline stage. CLTK pipelines are not thread-safe,
+# so analysis defaults to a single worker.
+STAGE_WORKERS = {
+    "preprocess": int(os.getenv("PREPROCESS_WORKERS", str(os.cpu_count() or 2))),
+    "layout": int(os.getenv("LAYOUT_WORKERS", str(os.cpu_count() or 2))),
+    "ocr": int(os.getenv("OCR_WORKERS", "8")),
+    "ocr-regions": int(os.getenv("OCR_REGION_WORKERS", "8")),
+    "correct": int(os.getenv("CORRECT_WORKERS", "4")),
+    "correct-chunks": int(os.getenv("CORRECT_CHUNK_WORKERS", "8")),
+    "analyze": int(os.getenv("ANALYZE_WORKERS", "1")),
+    "tts": int(os.getenv("TTS_WORKERS", "4")),
+    "translate": int(os.getenv("TRANSLATE_WORKERS", "4")),
+    "storage": int(os.getenv("STORAGE_WORKERS", "4")),
+    # Single writer for the lemma index
+    "index": 1,
+    # Writes job snapshots to the job queue database, batched
+    "job-share": 1,
+    # Corpus queries read index snapshots, so they neither wait for nor block the writer
+    "index-read": int(os.getenv("INDEX_READ_WORKERS", "4")),
+}
+DEFAULT_STAGE_WORKERS = 2
+
+# Finished jobs are kept around this long so clients can still poll them
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+
+TERMINAL_STATUSES = ("done", "failed")
+
+_pools: Dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def get_stage_pool(stage: str) -> ThreadPoolExecutor:
+    """Return the shared executor for a pipeline stage, creating it on first use."""
+    with _pools_lock:
+        pool = _pools.get(stage)
+        if pool is None:
+            pool = ThreadPoolExecutor(
+                max_workers=STAGE_WORKERS.get(stage, DEFAULT_STAGE_WORKERS),
+                thread_name_prefix=f"stage-{stage}",
+            )
+            _pools[stage] = pool
+        return pool
+
+
+class Job:
+    def __init__(self, stages: List[str], meta: Optional[Dict] = None):
+        """Track status and per-stage timings of one pipeline run."""
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.meta = meta or {}
+        self.stages: Dict[str, Dict] = {
+            name: {"status": "pending", "seconds": None} for name in stages
+        }
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        # Bumped on every change so progress streams know when to emit
+        self.version = 0
+        # Mirrored to the job queue database so every web worker can serve it
+        self.shared = False
+        self._lock = threading.Lock()
+
+    def _share(self):
+        """Queue a snapshot write; never blocks the caller (often the event loop) on SQLite."""
+        if not self.shared:
+            return
+        global _share_scheduled
+        with _share_lock:
+            _share_pending[self.id] = self
+            if _share_scheduled:
+                return
+            _share_scheduled = True
+        get_stage_pool("job-share").submit(_flush_shared_jobs)
+
+    def set_status(self, status: str):
+        with self._lock:
+            self.status = status
+            self.version += 1
+        self._share()
+
+    def set_stage(self, name: str, status: str, seconds: Optional[float] = None):
+        with self._lock:
+            stage = self.stages.setdefault(name, {"status": "pending", "seconds": None})
+            stage["status"] = status
+            if seconds is not None:
+                stage["seconds"] = round(seconds, 4)
+            self.version += 1
+        self._share()
+
+    def set_stage_detail(self, name: str, key: str, value):
+        """Attach extra information (e.g. sub-step timings) to a stage."""
+        with self._lock:
+            self.stages.setdefault(name, {"status": "pending", "seconds": None})[key] = value
+            self.version += 1
+
+    def finish(self, result: Dict):
+        with self._lock:
+            self.result = result
+            self.status = "done"
+            self.finished_at = time.time()
+            self.version += 1
+        self._share()
+
+    def fail(self, error: str):
+        with self._lock:
+            self.error = error
+            self.status = "failed"
+            self.finished_at = time.time()
+            self.version += 1
+        self._share()
+
+    def timings(self) -> Dict[str, Optional[float]]:
+        return {name: stage["seconds"] for name, stage in self.stages.items()}
+
+    def to_dict(self, include_result: bool = True) -> Dict:
+        with self._lock:
+            data = {
+                "job_id": self.id,
+                "status": self.status,
+                "meta": self.meta,
+                "stages": {name: dict(stage) for name, stage in self.stages.items()},
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+                "error": self.error,
+            }
+            if include_result:
+                data["result"] = self.result
+            return data
+
+
+_jobs: Dict[str, Job] = {}
+_jobs_lock = threading.Lock()
+# Jobs changed since their last shared snapshot; one flush writes them all
+_share_pending: Dict[str, Job] = {}
+_share_lock = threading.Lock()
+_share_scheduled = False
+
+
+def _flush_shared_jobs():
+    """Write the latest snapshot of every changed job, until no changes are left."""
+    global _share_pending, _share_scheduled
+    while True:
+        with _share_lock:
+            pending, _share_pending = _share_pending, {}
+            if not pending:
+                _share_scheduled = False
+                return
+        snapshots = [(job.id, job.to_dict(include_result=job.status in TERMINAL_STATUSES)) for job in pending.values()]
+        try:
+            get_job_queue().save_jobs(snapshots)
+        except Exception as e:
+            logger.warning(f"Could not share {len(snapshots)} job(s): {e}")
+
+
+# Strong references to running tasks so they are not garbage collected mid-flight
+_tasks: set = set()
+
+
+def _prune_jobs():
+    cutoff = time.time() - JOB_TTL_SECONDS
+    with _jobs_lock:
+        expired = [
+            job_id for job_id, job in _jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del _jobs[job_id]
+
+
+def create_job(stages: List[str], meta: Optional[Dict] = None) -> Job:
+    _prune_jobs()
+    job = Job(stages, meta)
+    job.shared = JOB_QUEUE_ENABLED
+    with _jobs_lock:
+        _jobs[job.id] = job
+    job._share()
+    return job
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+async def get_job_snapshot(job_id: str) -> Optional[Dict]:
+    """A job's to_dict(), also for jobs running in another web worker when the job queue is on."""
+    job = get_job(job_id)
+    if job is not None:
+        return job.to_dict()
+    if JOB_QUEUE_ENABLED:
+        shared = await asyncio.get_running_loop().run_in_executor(None, get_job_queue().load_job, job_id)
+        if shared is not None:
+            return shared[0]
+    return None
+
+
+async def run_in_stage_pool(stage: str, fn: Callable, *args, **kwargs):
+    """
+    Run a blocking function on a stage's bounded pool without blocking the
+    event loop. With the job queue on, queue tasks (app.job_queue.queue_task)
+    of a queued stage run in a stage worker process instead.
+    """
+    if is_queued(stage) and hasattr(fn, "queue_name"):
+        return await get_queue_client().call(stage, fn, args, kwargs)
+    loop = asyncio.get_running_loop()
+    # Carry context variables (request timing spans) into the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_stage_pool(stage), functools.partial(context.run, fn, *args, **kwargs)
+    )
+
+
+async def run_stage(job: Job, stage: str, fn: Callable, *args, **kwargs):
+    """Run a blocking stage function on its bounded pool and record its timing."""
+    job.set_stage(stage, "running")
+    start = time.perf_counter()
+    try:
+        result = await run_in_stage_pool(stage, fn, *args, **kwargs)
+    except Exception:
+        job.set_stage(stage, "failed", time.perf_counter() - start)
+        raise
+    seconds = time.perf_counter() - start
+    job.set_stage(stage, "done", seconds)
+    STAGE_SECONDS.observe(seconds, stage=stage, language=job.meta.get("language") or "")
+    record_request_span(f"stage.{stage}", seconds)
+    return result
+
+
+async def run_job(job: Job, pipeline: Awaitable[Dict]) -> Dict:
+    """Await a pipeline coroutine, storing its result (or error) on the job."""
+    job.set_status("running")
+    try:
+        result = await pipeline
+    except Exception as e:
+        logger.exception(f"Job {job.id} failed")
+        job.fail(str(e))
+        raise
+    job.finish(result)
+    return result
+
+
+def submit_job(job: Job, pipeline: Awaitable[Dict]) -> asyncio.Task:
+    """Schedule a pipeline in the background and return immediately."""
+    async def runner():
+        try:
+            await run_job(job, pipeline)
+        except Exception:
+            # Already recorded on the job
+            pass
+
+    task = asyncio.create_task(runner())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def stream_job_events(job: Job, poll_interval: float = 0.25) -> AsyncIterator[str]:
+    """Yield Server-Sent Events whenever the job changes, until it finishes."""
+    last_version = -1
+    while True:
+        version = job.version
+        if version != last_version:
+            last_version = version
+            yield f"data: {json.dumps(job.to_dict(include_result=job.status in TERMINAL_STATUSES))}\n\n"
+        if job.status in TERMINAL_STATUSES:
+            break
+        await asyncio.sleep(poll_interval)
+
+
+async def stream_shared_job_events(job_id: str, poll_interval: float = 0.25) -> AsyncIterator[str]:
+    """stream_job_events for a job running in another web worker, read from the job queue database."""
+    queue = get_job_queue()
+    loop = asyncio.get_running_loop()
+    last_update = None
+    while True:
+        shared = await loop.run_in_executor(None, queue.load_job, job_id)
+        if shared is None:
+            break
+        snapshot, updated_at = shared
+        if updated_at != last_update:
+            last_update = updated_at
+            yield f"data: {json.dumps(snapshot)}\n\n"
+        if snapshot["status"] in TERMINAL_STATUSES:
+            break
+        await asyncio.sleep(poll_interval)
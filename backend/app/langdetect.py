@@ -0,0 +1,213 @@
+import math
+import os
+import threading
+import unicodedata
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# One plain-text sample per language, named after the correction language
+SAMPLES_DIR = Path(__file__).parent / "data" / "langdetect"
+NGRAM_ORDER = 3
+# Pages longer than this are scored on evenly spaced windows of WINDOW_CHARS
+LANGDETECT_MAX_CHARS = int(os.getenv("LANGDETECT_MAX_CHARS", "1200"))
+WINDOW_CHARS = 200
+# Auto mode falls back to DEFAULT_LANGUAGE below this confidence
+LANGDETECT_MIN_CONFIDENCE = float(os.getenv("LANGDETECT_MIN_CONFIDENCE", "0.4"))
+DEFAULT_LANGUAGE = "latin"
+# Trigram count at which n-gram evidence is considered conclusive; shorter
+# texts get flatter (less confident) scores
+CONFIDENT_TRIGRAMS = 20
+SMOOTHING = 0.5
+
+# Correction language (the names the frontend sends) -> CLTK code
+LANGUAGES = {
+    "latin": "lat",
+    "greek": "grc",
+    "old_english": "ang",
+    "sanskrit": "san",
+}
+# Scripts each language is written in (Sanskrit also in IAST transliteration)
+LANGUAGE_SCRIPTS = {
+    "latin": ("latin",),
+    "greek": ("greek",),
+    "old_english": ("latin",),
+    "sanskrit": ("devanagari", "latin"),
+}
+SCRIPT_RANGES = (
+    (0x0041, 0x005A, "latin"),
+    (0x0061, 0x007A, "latin"),
+    (0x00C0, 0x024F, "latin"),   # Latin-1 letters, Extended-A/B (æ þ ð ƿ ȝ)
+    (0x1E00, 0x1EFF, "latin"),   # IAST dots below (ṛ ṣ ṭ ḍ ṇ ḥ ṃ)
+    (0xA720, 0xA7FF, "latin"),   # Medieval abbreviation letters
+    (0x0370, 0x03FF, "greek"),
+    (0x1F00, 0x1FFF, "greek"),   # Polytonic
+    (0x0900, 0x097F, "devanagari"),
+    (0xA8E0, 0xA8FF, "devanagari"),
+)
+
+
+@dataclass
+class Detection:
+    language: str
+    confidence: float
+    script: str = ""
+    scores: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def code(self) -> str:
+        return LANGUAGES[self.language]
+
+    def to_dict(self) -> Dict:
+        return {
+            "language": self.language,
+            "code": self.code,
+            "confidence": round(self.confidence, 4),
+            "script": self.script,
+            "scores": {lang: round(score, 4) for lang, score in self.scores.items()},
+        }
+
+
+def script_of(ch: str) -> str:
+    cp = ord(ch)
+    for low, high, script in SCRIPT_RANGES:
+        if low <= cp <= high:
+            return script
+    return ""
+
+
+# char -> (normalized char, script); letters and combining marks (Devanagari
+# vowel signs and virama) are kept, everything else becomes a space
+_char_table: Dict[str, Tuple[str, str]] = {}
+
+
+def _classify(ch: str) -> Tuple[str, str]:
+    entry = _char_table.get(ch)
+    if entry is None:
+        category = unicodedata.category(ch)
+        if category[0] in ("L", "M"):
+            entry = (ch.lower(), script_of(ch))
+        else:
+            entry = (" ", "")
+        _char_table[ch] = entry
+    return entry
+
+
+def _sample(text: str) -> str:
+    """The whole text when short, otherwise evenly spaced windows of it."""
+    if len(text) <= LANGDETECT_MAX_CHARS:
+        return text
+    windows = LANGDETECT_MAX_CHARS // WINDOW_CHARS
+    step = (len(text) - WINDOW_CHARS) // max(windows - 1, 1)
+    return " ".join(text[i * step:i * step + WINDOW_CHARS] for i in range(windows))
+
+
+def _normalize(text: str) -> Tuple[str, Dict[str, int]]:
+    """Lowercased letters with single spaces between words, plus letter counts per script."""
+    chars: List[str] = []
+    scripts: Dict[str, int] = {}
+    for ch in unicodedata.normalize("NFC", text):
+        normalized, script = _classify(ch)
+        if normalized == " ":
+            if chars and chars[-1] != " ":
+                chars.append(" ")
+            continue
+        chars.append(normalized)
+        if script:
+            scripts[script] = scripts.get(script, 0) + 1
+    return " " + "".join(chars).strip() + " ", scripts
+
+
+def _trigrams(text: str) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for i in range(len(text) - NGRAM_ORDER + 1):
+        gram = text[i:i + NGRAM_ORDER]
+        counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+class LanguageDetector:
+    def __init__(self, samples_dir: Path = SAMPLES_DIR):
+        """Character trigram models built from the bundled samples."""
+        # language -> trigram -> log probability, plus the log probability of unseen trigrams
+        self.models: Dict[str, Dict[str, float]] = {}
+        self.unseen: Dict[str, float] = {}
+        for language in LANGUAGES:
+            path = samples_dir / f"{language}.txt"
+            if path.exists():
+                self._train(language, path.read_text(encoding="utf-8"))
+
+    def _train(self, language: str, sample: str):
+        text, _ = _normalize(sample)
+        counts = _trigrams(text)
+        total = sum(counts.values()) + SMOOTHING * (len(counts) + 1)
+        self.models[language] = {gram: math.log((n + SMOOTHING) / total) for gram, n in counts.items()}
+        self.unseen[language] = math.log(SMOOTHING / total)
+
+    def detect(self, text: str) -> Detection:
+        """
+        Score text against each language written in its dominant script.
+        Confidence is the n-gram probability scaled by the script's share of
+        letters, so mixed-script or very short text reports low confidence.
+        """
+        normalized, scripts = _normalize(_sample(text or ""))
+        letters = sum(scripts.values())
+        if not letters:
+            return Detection(DEFAULT_LANGUAGE, 0.0)
+        script = max(scripts, key=scripts.get)
+        script_share = scripts[script] / letters
+        candidates = [lang for lang in self.models if script in LANGUAGE_SCRIPTS[lang]]
+        if not candidates:
+            return Detection(DEFAULT_LANGUAGE, 0.0, script)
+        if len(candidates) == 1:
+            return Detection(candidates[0], script_share, script, {candidates[0]: script_share})
+
+        counts = _trigrams(normalized)
+        n = sum(counts.values())
+        if not n:
+            return Detection(DEFAULT_LANGUAGE, 0.0, script)
+        # Mean log probability per trigram, sharpened by how much evidence there is
+        weight = min(n, CONFIDENT_TRIGRAMS)
+        logits = {}
+        for lang in candidates:
+            model, unseen = self.models[lang], self.unseen[lang]
+            mean = sum(count * model.get(gram, unseen) for gram, count in counts.items()) / n
+            logits[lang] = mean * weight
+        top = max(logits.values())
+        exp = {lang: math.exp(logit - top) for lang, logit in logits.items()}
+        norm = sum(exp.values())
+        scores = {lang: value / norm * script_share for lang, value in exp.items()}
+        language = max(scores, key=scores.get)
+        return Detection(language, scores[language], script, scores)
+
+
+_detector: Optional[LanguageDetector] = None
+_detector_lock = threading.Lock()
+
+
+def get_language_detector() -> LanguageDetector:
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = LanguageDetector()
+    return _detector
+
+
+def detect_language(text: str, min_confidence: float = LANGDETECT_MIN_CONFIDENCE) -> Detection:
+    """Detect the language of text; below min_confidence the default language is returned."""
+    detection = get_language_detector().detect(text)
+    if detection.confidence < min_confidence:
+        detection.language = DEFAULT_LANGUAGE
+    return detection
+
+
+def correction_language(language: Optional[str]) -> str:
+    """Correction language name for a name or CLTK code ("lat" -> "latin")."""
+    language = (language or "").strip().lower().replace(" ", "_")
+    if language in LANGUAGES:
+        return language
+    for name, code in LANGUAGES.items():
+        if code == language:
+            return name
+    return {"ancient_greek": "greek", "english": "old_english"}.get(language, language)
@@ -0,0 +1,316 @@
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.lazy import lazy_import
+from app.metrics import observe_span, size_class
+from app.ocr_words import WordTable, join_tables
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+# Split preprocessed pages into text regions and OCR those instead of the
+# whole page (0 sends the full page as before)
+OCR_LAYOUT = os.getenv("OCR_LAYOUT", "1") not in ("0", "false", "False")
+# Layout is analyzed on a copy no larger than this; boxes are scaled back
+LAYOUT_MAX_SIDE = 1600
+# Gaps closed when merging glyphs into blocks, in estimated glyph heights
+BLOCK_GAP_X = 1.5
+BLOCK_GAP_Y = 2.0
+# Blocks with fewer glyphs than this are specks or edge artifacts
+MIN_BLOCK_GLYPHS = 3
+# Components smaller than this share of a glyph-height square are specks
+MIN_GLYPH_AREA = 0.1
+# Components taller than this many glyph heights are rules, frames or
+# illuminations rather than text
+MAX_GLYPH_HEIGHTS = 6
+# Padding around each crop, in glyph heights
+CROP_PADDING = 0.5
+# zlib level for crops; 9 is several times slower for a few percent
+CROP_PNG_COMPRESSION = 6
+# A row belongs to a text line when this share of the block's width has ink
+LINE_INK_SHARE = 0.01
+# Every region is a separate image to the OCR engine, and Vision bills and
+# rate-limits per image. Pages with more regions than this are OCRed one
+# crop per column instead (full-width blocks stay separate). Set to 0 for no
+# cap.
+OCR_LAYOUT_MAX_REGIONS = int(os.getenv("OCR_LAYOUT_MAX_REGIONS", "4"))
+# Column index of blocks that span several columns (titles, full-width paragraphs)
+SPANNING = -1
+
+LAYOUT_VERSION = 2
+
+Box = Tuple[int, int, int, int]
+
+
+def layout_params() -> Optional[Dict]:
+    """Everything that changes region crops; part of the page OCR cache key (None when off)."""
+    if not OCR_LAYOUT:
+        return None
+    return {
+        "version": LAYOUT_VERSION,
+        "max_side": LAYOUT_MAX_SIDE,
+        "block_gap": (BLOCK_GAP_X, BLOCK_GAP_Y),
+        "min_block_glyphs": MIN_BLOCK_GLYPHS,
+        "min_glyph_area": MIN_GLYPH_AREA,
+        "max_glyph_heights": MAX_GLYPH_HEIGHTS,
+        "crop_padding": CROP_PADDING,
+        "max_regions": OCR_LAYOUT_MAX_REGIONS,
+    }
+
+
+@dataclass
+class Region:
+    # (x, y, width, height) in preprocessed-page pixels
+    bbox: Box
+    # SPANNING for blocks across several columns
+    column: int
+    lines: List[Box] = field(default_factory=list)
+    text: Optional[str] = None
+    error: Optional[str] = None
+    engine: Optional[str] = None
+    # Word confidences and boxes, relative to the crop
+    words: Optional[WordTable] = None
+
+    def to_dict(self) -> Dict:
+        data = {"bbox": list(self.bbox), "column": self.column, "lines": [list(line) for line in self.lines],
+                "text": self.text}
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+@dataclass
+class PageLayout:
+    width: int
+    height: int
+    regions: List[Region]
+    # Encoded crop per region, in reading order
+    crops: List[bytes]
+    page_bytes: int = 0
+
+    def text(self, empty: str = "") -> str:
+        """Region texts in reading order, separated by blank lines."""
+        texts = [r.text.strip() for r in self._text_regions(empty)]
+        return "\n\n".join(texts) if texts else empty
+
+    def words(self, empty: str = "") -> Optional[WordTable]:
+        """Word table for text(), in page coordinates; None if a region has no word data."""
+        regions = self._text_regions(empty)
+        if not regions or any(r.words is None for r in regions):
+            return None
+        return join_tables([r.words.shifted(r.bbox[0], r.bbox[1]) for r in regions], "\n\n")
+
+    def _text_regions(self, empty: str) -> List[Region]:
+        return [r for r in self.regions if r.text and r.text != empty and r.text.strip()]
+
+    def stats(self) -> Dict:
+        return {
+            "regions": len(self.regions),
+            "columns": len({r.column for r in self.regions if r.column != SPANNING}),
+            "lines": sum(len(r.lines) for r in self.regions),
+            "crop_bytes": sum(len(c) for c in self.crops),
+            "page_bytes": self.page_bytes,
+        }
+
+
+def _glyph_mask(ink: "np.ndarray") -> Tuple["np.ndarray", float, "np.ndarray"]:
+    """
+    Ink with specks and oversized components (frames, rules, initials)
+    removed, the median glyph height used to scale every other step, and
+    the centers of the glyphs kept.
+    """
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    candidates = heights[(areas >= 4) & (heights >= 3)]
+    glyph_height = float(np.median(candidates)) if len(candidates) else 10.0
+    kept = (
+        (areas >= max(4.0, MIN_GLYPH_AREA * glyph_height * glyph_height))
+        & (heights <= glyph_height * MAX_GLYPH_HEIGHTS)
+    )
+    keep = np.zeros(count, dtype=np.uint8)
+    keep[1:] = kept.astype(np.uint8) * 255
+    return keep[labels], glyph_height, centroids[1:][kept]
+
+
+def _text_lines(ink: "np.ndarray", box: Box, glyph_height: float) -> List[Box]:
+    """Line boxes inside a block from its horizontal projection profile."""
+    x, y, w, h = box
+    block = ink[y:y + h, x:x + w]
+    rows = np.count_nonzero(block, axis=1) > max(1, w * LINE_INK_SHARE)
+    lines = []
+    start = None
+    # Pad with False so a line touching the bottom edge is closed
+    for i, has_ink in enumerate(np.append(rows, False)):
+        if has_ink and start is None:
+            start = i
+        elif not has_ink and start is not None:
+            if i - start >= max(2, glyph_height * 0.3):
+                cols = np.flatnonzero(np.count_nonzero(block[start:i], axis=0))
+                lines.append((x + int(cols[0]), y + start, int(cols[-1] - cols[0] + 1), i - start))
+            start = None
+    return lines
+
+
+def _overlap_columns(boxes: List[Box], indexes: List[int]) -> Dict[int, int]:
+    """Column per box index: boxes whose horizontal extents overlap share a column."""
+    columns = {}
+    column, right = -1, -1
+    for i in sorted(indexes, key=lambda i: boxes[i][0]):
+        x, _, w, _ = boxes[i]
+        if x > right:
+            column += 1
+            right = x + w
+        else:
+            right = max(right, x + w)
+        columns[i] = column
+    return columns
+
+
+def _assign_columns(boxes: List[Box]) -> List[int]:
+    """
+    Column index per box, or SPANNING for a box whose extent covers
+    narrower blocks of more than one column. Spanning boxes are left out of
+    the column overlap, so a title or full-width paragraph does not join
+    every column below it into one.
+    """
+    def covered(i: int) -> List[int]:
+        x, _, w, _ = boxes[i]
+        return [j for j in range(len(boxes))
+                if boxes[j][2] < w and x < boxes[j][0] + boxes[j][2] and boxes[j][0] < x + w]
+
+    all_boxes = range(len(boxes))
+    spanning = {i for i in all_boxes if len(set(_overlap_columns(boxes, covered(i)).values())) > 1}
+    columns = _overlap_columns(boxes, [i for i in all_boxes if i not in spanning])
+    return [SPANNING if i in spanning else columns[i] for i in all_boxes]
+
+
+def _reading_order(boxes: List[Box], columns: List[int]) -> List[int]:
+    """
+    Spanning boxes cut the page into horizontal bands (one step of an XY
+    cut); each band is read column by column, top to bottom.
+    """
+    tops = sorted(boxes[i][1] for i in range(len(boxes)) if columns[i] == SPANNING)
+
+    def key(i: int):
+        y = boxes[i][1]
+        band = sum(1 for top in tops if top < y)
+        if columns[i] == SPANNING:
+            return (band + 1, 0, 0, y)
+        return (band, 1, columns[i], y)
+
+    return sorted(range(len(boxes)), key=key)
+
+
+def _merge_columns(regions: List[Region], width: int, height: int) -> List[Region]:
+    """
+    Fewer, larger regions: consecutive regions of one column (in reading
+    order) become one, spanning regions stay. The whole page when that is
+    still more than OCR_LAYOUT_MAX_REGIONS.
+    """
+    merged: List[Region] = []
+    for region in regions:
+        last = merged[-1] if merged else None
+        if last is not None and region.column != SPANNING and region.column == last.column:
+            x0, y0 = min(last.bbox[0], region.bbox[0]), min(last.bbox[1], region.bbox[1])
+            x1 = max(last.bbox[0] + last.bbox[2], region.bbox[0] + region.bbox[2])
+            y1 = max(last.bbox[1] + last.bbox[3], region.bbox[1] + region.bbox[3])
+            merged[-1] = Region((x0, y0, x1 - x0, y1 - y0), last.column, last.lines + region.lines)
+        else:
+            merged.append(Region(region.bbox, region.column, list(region.lines)))
+    if len(merged) > OCR_LAYOUT_MAX_REGIONS:
+        return [Region((0, 0, width, height), 0, [line for r in merged for line in r.lines])]
+    return merged
+
+
+def detect_layout(binary: "np.ndarray") -> List[Region]:
+    """
+    Find text blocks, their columns and their lines on a binarized page
+    (dark text on white). Glyphs are merged into blocks by closing gaps
+    proportional to the median glyph height, then blocks are ordered by
+    column and top to bottom. An empty page gives no regions.
+    """
+    height, width = binary.shape[:2]
+    scale = min(1.0, LAYOUT_MAX_SIDE / max(height, width))
+    small = binary if scale == 1.0 else cv2.resize(
+        binary, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA
+    )
+    _, ink = cv2.threshold(small, 127, 255, cv2.THRESH_BINARY_INV)
+    glyphs, glyph_height, centers = _glyph_mask(ink)
+
+    kernel = np.ones((max(1, int(glyph_height * BLOCK_GAP_Y)), max(1, int(glyph_height * BLOCK_GAP_X))), np.uint8)
+    merged = cv2.dilate(glyphs, kernel)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(merged, connectivity=8)
+    boxes: List[Box] = []
+    for i in range(1, count):
+        x, y, w, h, _ = (int(v) for v in stats[i])
+        inside = ((centers[:, 0] >= x) & (centers[:, 0] < x + w) & (centers[:, 1] >= y) & (centers[:, 1] < y + h))
+        if np.count_nonzero(inside) >= MIN_BLOCK_GLYPHS:
+            boxes.append((x, y, w, h))
+    # Glyph clusters without a text line are ornament; one-line clusters on
+    # the page edge are scanner borders and speckle, not text
+    blocks = []
+    small_h, small_w = glyphs.shape
+    for box in boxes:
+        lines = _text_lines(glyphs, box, glyph_height)
+        x, y, w, h = box
+        on_edge = x == 0 or y == 0 or x + w >= small_w or y + h >= small_h
+        if lines and not (on_edge and len(lines) < 2):
+            blocks.append((box, lines))
+    if not blocks:
+        return []
+
+    columns = _assign_columns([box for box, _ in blocks])
+    order = _reading_order([box for box, _ in blocks], columns)
+    pad = glyph_height * CROP_PADDING
+    return [
+        Region(
+            _scale_box(blocks[i][0], scale, width, height, pad), columns[i],
+            [_scale_box(line, scale, width, height) for line in blocks[i][1]],
+        )
+        for i in order
+    ]
+
+
+def _scale_box(box: Box, scale: float, width: int, height: int, pad: float = 0.0) -> Box:
+    """Box on the analysis copy -> full-resolution box, padded and clipped to the page."""
+    x, y, w, h = box
+    x0 = max(0, int((x - pad) / scale))
+    y0 = max(0, int((y - pad) / scale))
+    x1 = min(width, int(np.ceil((x + w + pad) / scale)))
+    y1 = min(height, int(np.ceil((y + h + pad) / scale)))
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def encode_crop(image: "np.ndarray") -> bytes:
+    """Losslessly compressed PNG; bilevel pages are written at one bit per pixel."""
+    params = [cv2.IMWRITE_PNG_COMPRESSION, CROP_PNG_COMPRESSION]
+    if hasattr(cv2, "IMWRITE_PNG_BILEVEL"):
+        params += [cv2.IMWRITE_PNG_BILEVEL, 1]
+    ok, encoded = cv2.imencode(".png", image, params)
+    if not ok:
+        raise ValueError("Unable to encode region crop")
+    return encoded.tobytes()
+
+
+def analyze_layout(image_path: str) -> PageLayout:
+    """Detect the regions of a preprocessed (binarized) page and crop each one."""
+    binary = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if binary is None:
+        raise ValueError(f"Unable to read image: {image_path}")
+    height, width = binary.shape[:2]
+    start = time.perf_counter()
+    regions = detect_layout(binary)
+    if not regions:
+        # Nothing that looks like text: let the OCR engine see the whole page
+        regions = [Region((0, 0, width, height), 0)]
+    elif OCR_LAYOUT_MAX_REGIONS and len(regions) > OCR_LAYOUT_MAX_REGIONS:
+        regions = _merge_columns(regions, width, height)
+    crops = [encode_crop(binary[y:y + h, x:x + w]) for x, y, w, h in (r.bbox for r in regions)]
+    observe_span("layout.detect", time.perf_counter() - start, image_size=size_class(width, height))
+    return PageLayout(width, height, regions, crops, os.path.getsize(image_path))
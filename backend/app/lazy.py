@@ -0,0 +1,31 @@
+import importlib
+import threading
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    def __init__(self, name: str):
+        """
+        Stand-in for a heavy module that imports it on first attribute
+        access, so merely importing app code does not pay for it.
+        """
+        super().__init__(name)
+        self._lazy_lock = threading.Lock()
+        self._lazy_module = None
+
+    def __getattr__(self, attr: str):
+        module = self._lazy_module
+        if module is None:
+            with self._lazy_lock:
+                if self._lazy_module is None:
+                    module = importlib.import_module(self.__name__)
+                    # Later lookups hit the copied namespace directly
+                    self.__dict__.update(module.__dict__)
+                    self._lazy_module = module
+                module = self._lazy_module
+        return getattr(module, attr)
+
+
+def lazy_import(name: str) -> ModuleType:
+    """`cv2 = lazy_import("cv2")` instead of `import cv2`."""
+    return LazyModule(name)
@@ -0,0 +1,373 @@
+import json
+import logging
+import os
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from filelock import FileLock
+
+from app.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = os.getenv("LEMMA_INDEX_DIR", "index")
+# Rebuild the sorted postings once this many tokens sit in the unsorted tail
+INDEX_MERGE_THRESHOLD = int(os.getenv("LEMMA_INDEX_MERGE_THRESHOLD", "200000"))
+
+FIELDS = ("lemma", "form")
+TOKEN_DTYPE = "uint32"
+
+
+def normalize_term(term: str) -> str:
+    """Case- and accent-insensitive key used for search."""
+    decomposed = unicodedata.normalize("NFD", term.strip().lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+class _Snapshot:
+    """
+    Immutable view of the index at one point. Queries read a snapshot
+    without locks while the writer builds the next one; vocab, term_ids,
+    docs and display only ever grow, so snapshots share them.
+    """
+
+    def __init__(self):
+        self.vocab: List[str] = []
+        self.term_ids: Dict[str, int] = {}
+        self.normalized_ids: Dict[str, int] = {}
+        # First spelling seen for each normalized term, by normalized id
+        self.display: List[str] = []
+        self.norm_map = np.zeros(0, dtype=TOKEN_DTYPE)
+        self.docs: List[Dict] = []
+        self.doc_count = 0
+        self.current: Dict[str, int] = {}
+        self.doc_starts = np.zeros(0, dtype=np.int64)
+        self.live = np.zeros(0, dtype=bool)
+        self.token_count = 0
+        self.streams: Dict[str, "np.ndarray"] = {field: np.zeros(0, dtype=TOKEN_DTYPE) for field in FIELDS}
+        self.postings_tokens = 0
+        self.postings: Dict[str, Optional["np.ndarray"]] = {field: None for field in FIELDS}
+        self.offsets: Dict[str, Optional["np.ndarray"]] = {field: None for field in FIELDS}
+        # Bytes of vocab.jsonl and docs.jsonl already read, and the postings.json mtime
+        self.vocab_bytes = 0
+        self.docs_bytes = 0
+        self.postings_mtime = 0.0
+
+    def copy(self) -> "_Snapshot":
+        snapshot = _Snapshot.__new__(_Snapshot)
+        snapshot.__dict__.update(self.__dict__)
+        snapshot.current = dict(self.current)
+        snapshot.streams = dict(self.streams)
+        snapshot.postings = dict(self.postings)
+        snapshot.offsets = dict(self.offsets)
+        return snapshot
+
+
+class LemmaIndex:
+    """
+    Append-only inverted index over every analyzed document.
+
+    On disk (INDEX_DIR):
+      vocab.jsonl          one term per line; the line number is its id
+      docs.jsonl           one entry per indexed document version
+      lemma.u32, form.u32  token streams of term ids, all documents concatenated
+      <field>.postings.npy token positions grouped by normalized term, ascending
+      <field>.offsets.npy  start of each term's postings (CSR layout)
+      postings.json        how many tokens the postings cover
+
+    Token streams and postings are memory-mapped. Tokens appended since the
+    last merge are scanned directly until the tail exceeds
+    INDEX_MERGE_THRESHOLD, then the postings are rebuilt with one stable
+    argsort. Re-indexing a document appends a new version and hides the old one.
+
+    Readers pick up other processes' writes by reading only what was
+    appended to vocab.jsonl and docs.jsonl since the last refresh; queries
+    run on an immutable snapshot, so they never wait for a write or merge.
+    """
+
+    def __init__(self, directory: str = INDEX_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # Serializes writers in this process; readers only take _refresh_lock
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        # Serializes writers across worker processes
+        self._file_lock = FileLock(os.path.join(directory, ".lock"))
+        self._snapshot = _Snapshot()
+        self._refresh()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    # Loading
+
+    def _size(self, name: str) -> int:
+        path = self._path(name)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _read_lines(self, name: str, offset: int) -> Tuple[List, int]:
+        """Complete JSON lines appended after offset, and the new offset."""
+        with open(self._path(name), "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        # A line another process is still writing is picked up next time
+        end = data.rfind(b"\n") + 1
+        return [json.loads(line) for line in data[:end].splitlines()], offset + end
+
+    def _refresh(self) -> _Snapshot:
+        """Bring the snapshot up to date with the files; cheap when nothing changed."""
+        with self._refresh_lock:
+            old = self._snapshot
+            meta_path = self._path("postings.json")
+            postings_mtime = os.path.getmtime(meta_path) if os.path.exists(meta_path) else 0.0
+            vocab_size, docs_size = self._size("vocab.jsonl"), self._size("docs.jsonl")
+            if (vocab_size, docs_size, postings_mtime) == (old.vocab_bytes, old.docs_bytes, old.postings_mtime):
+                return old
+            snapshot = old.copy()
+
+            if vocab_size > old.vocab_bytes:
+                terms, snapshot.vocab_bytes = self._read_lines("vocab.jsonl", old.vocab_bytes)
+                norm_ids = []
+                for term in terms:
+                    snapshot.term_ids[term] = len(snapshot.vocab)
+                    snapshot.vocab.append(term)
+                    key = normalize_term(term)
+                    norm_id = snapshot.normalized_ids.get(key)
+                    if norm_id is None:
+                        norm_id = snapshot.normalized_ids[key] = len(snapshot.display)
+                        snapshot.display.append(term)
+                    norm_ids.append(norm_id)
+                snapshot.norm_map = np.concatenate([old.norm_map, np.asarray(norm_ids, dtype=TOKEN_DTYPE)])
+
+            if docs_size > old.docs_bytes:
+                entries, snapshot.docs_bytes = self._read_lines("docs.jsonl", old.docs_bytes)
+                live = np.concatenate([old.live, np.ones(len(entries), dtype=bool)])
+                for entry in entries:
+                    previous = snapshot.current.get(entry["doc_id"])
+                    if previous is not None:
+                        live[previous] = False
+                    snapshot.current[entry["doc_id"]] = len(snapshot.docs)
+                    snapshot.docs.append(entry)
+                snapshot.doc_count = len(snapshot.docs)
+                snapshot.live = live
+                snapshot.doc_starts = np.concatenate([
+                    old.doc_starts, np.asarray([e["start"] for e in entries], dtype=np.int64)
+                ])
+                last = entries[-1] if entries else None
+                if last is not None:
+                    # Streams are written before the docs entry, so they cover every listed document
+                    snapshot.token_count = last["start"] + last["length"]
+                    snapshot.streams = {
+                        field: self._map(f"{field}.u32", TOKEN_DTYPE, snapshot.token_count) for field in FIELDS
+                    }
+
+            if postings_mtime != old.postings_mtime:
+                with open(meta_path) as f:
+                    snapshot.postings_tokens = json.load(f)["tokens"]
+                for field in FIELDS:
+                    snapshot.postings[field] = np.load(self._path(f"{field}.postings.npy"), mmap_mode="r")
+                    snapshot.offsets[field] = np.load(self._path(f"{field}.offsets.npy"), mmap_mode="r")
+                snapshot.postings_mtime = postings_mtime
+
+            self._snapshot = snapshot
+            return snapshot
+
+    def _map(self, name: str, dtype, count: int) -> "np.ndarray":
+        if not count:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self._path(name), dtype=dtype, mode="r", shape=(count,))
+
+    @property
+    def token_count(self) -> int:
+        return self._snapshot.token_count
+
+    # Writing
+
+    def add_document(self, doc_id: str, analysis: List[Dict], name: Optional[str] = None,
+                     language: Optional[str] = None) -> Optional[Dict]:
+        """
+        Append a document's word/lemma list. A document whose doc_id is
+        already indexed with the same tokens is skipped.
+        """
+        words = [w for w in analysis or [] if "word" in w and "lemma" in w]
+        if not words:
+            return None
+        with self._lock, self._file_lock:
+            snapshot = self._refresh()
+            # Terms not in the vocabulary yet get ids after it; they are only
+            # added to the snapshot once written, by the refresh below
+            new_terms: Dict[str, int] = {}
+
+            def term_id(term: str) -> int:
+                known = snapshot.term_ids.get(term)
+                if known is None:
+                    known = new_terms.setdefault(term, len(snapshot.vocab) + len(new_terms))
+                return known
+
+            lemma_ids = np.fromiter((term_id(w["lemma"]) for w in words), dtype=TOKEN_DTYPE, count=len(words))
+            form_ids = np.fromiter((term_id(w["word"]) for w in words), dtype=TOKEN_DTYPE, count=len(words))
+
+            previous = snapshot.current.get(doc_id)
+            if previous is not None:
+                old = snapshot.docs[previous]
+                span = slice(old["start"], old["start"] + old["length"])
+                if (np.array_equal(snapshot.streams["lemma"][span], lemma_ids)
+                        and np.array_equal(snapshot.streams["form"][span], form_ids)):
+                    return old
+
+            if new_terms:
+                with open(self._path("vocab.jsonl"), "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(term, ensure_ascii=False) + "\n" for term in new_terms)
+            start = snapshot.token_count
+            for field, ids in (("lemma", lemma_ids), ("form", form_ids)):
+                with open(self._path(f"{field}.u32"), "ab") as f:
+                    # Drop a tail left by a writer that died before its docs entry
+                    f.truncate(start * ids.itemsize)
+                    f.write(ids.tobytes())
+            entry = {"doc_id": doc_id, "name": name or doc_id, "language": language,
+                     "start": start, "length": len(words)}
+            with open(self._path("docs.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+            snapshot = self._refresh()
+            if snapshot.token_count - snapshot.postings_tokens >= INDEX_MERGE_THRESHOLD:
+                self._merge()
+            return entry
+
+    def _merge(self):
+        """Rebuild the sorted postings over every token (caller holds the locks)."""
+        snapshot = self._refresh()
+        total = snapshot.token_count
+        vocab_size = len(snapshot.display)
+        for field in FIELDS:
+            normalized = snapshot.norm_map[np.asarray(snapshot.streams[field])]
+            # Stable sort groups positions by term while keeping them ascending
+            postings = np.argsort(normalized, kind="stable").astype(TOKEN_DTYPE)
+            offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+            np.cumsum(np.bincount(normalized, minlength=vocab_size), out=offsets[1:])
+            np.save(self._path(f"{field}.postings.tmp.npy"), postings)
+            np.save(self._path(f"{field}.offsets.tmp.npy"), offsets)
+            os.replace(self._path(f"{field}.postings.tmp.npy"), self._path(f"{field}.postings.npy"))
+            os.replace(self._path(f"{field}.offsets.tmp.npy"), self._path(f"{field}.offsets.npy"))
+        # Readers reload the postings when this file changes, so it is replaced whole
+        with open(self._path("postings.tmp.json"), "w") as f:
+            json.dump({"tokens": total}, f)
+        os.replace(self._path("postings.tmp.json"), self._path("postings.json"))
+        logger.info(f"Lemma index postings rebuilt over {total} tokens")
+        self._refresh()
+
+    # Querying
+
+    @staticmethod
+    def _positions(snapshot: _Snapshot, field: str, term: str) -> "np.ndarray":
+        """Global positions of a term in live documents, ascending."""
+        norm_id = snapshot.normalized_ids.get(normalize_term(term))
+        if norm_id is None:
+            return np.zeros(0, dtype=np.int64)
+        parts = []
+        offsets = snapshot.offsets[field]
+        if offsets is not None and norm_id + 1 < len(offsets):
+            parts.append(np.asarray(snapshot.postings[field][offsets[norm_id]:offsets[norm_id + 1]], dtype=np.int64))
+        tail = np.asarray(snapshot.streams[field][snapshot.postings_tokens:])
+        if len(tail):
+            parts.append(np.flatnonzero(snapshot.norm_map[tail] == norm_id) + snapshot.postings_tokens)
+        positions = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        if len(positions) and not snapshot.live.all():
+            positions = positions[snapshot.live[LemmaIndex._doc_index(snapshot, positions)]]
+        return positions
+
+    @staticmethod
+    def _doc_index(snapshot: _Snapshot, positions: "np.ndarray") -> "np.ndarray":
+        return np.searchsorted(snapshot.doc_starts, positions, side="right") - 1
+
+    @staticmethod
+    def _hit(snapshot: _Snapshot, position: int, doc_index: int, width: int = 0) -> Dict:
+        doc = snapshot.docs[doc_index]
+        vocab = snapshot.vocab
+        local = position - doc["start"]
+        hit = {
+            "doc_id": doc["doc_id"],
+            "name": doc["name"],
+            "language": doc["language"],
+            "position": int(local),
+            "form": vocab[snapshot.streams["form"][position]],
+            "lemma": vocab[snapshot.streams["lemma"][position]],
+        }
+        if width:
+            left_start = max(doc["start"], position - width)
+            right_stop = min(doc["start"] + doc["length"], position + 1 + width)
+            forms = snapshot.streams["form"]
+            hit["left"] = " ".join(vocab[i] for i in forms[left_start:position])
+            hit["keyword"] = hit["form"]
+            hit["right"] = " ".join(vocab[i] for i in forms[position + 1:right_stop])
+        return hit
+
+    def search(self, field: str, term: str, limit: int = 50, offset: int = 0, width: int = 0) -> Dict:
+        """Occurrences of a lemma or form; width > 0 adds KWIC context."""
+        snapshot = self._refresh()
+        positions = self._positions(snapshot, field, term)
+        page = positions[offset:offset + limit]
+        doc_indexes = self._doc_index(snapshot, page)
+        hits = [self._hit(snapshot, int(p), int(d), width) for p, d in zip(page, doc_indexes)]
+        return {"total": int(len(positions)), "offset": offset, "hits": hits}
+
+    def frequency(self, field: str, term: Optional[str] = None, top: int = 50) -> Dict:
+        """Per-document counts for one term, or the most frequent terms overall."""
+        snapshot = self._refresh()
+        if term is not None:
+            positions = self._positions(snapshot, field, term)
+            doc_indexes, counts = np.unique(self._doc_index(snapshot, positions), return_counts=True)
+            return {
+                "term": term,
+                "total": int(len(positions)),
+                "documents": [
+                    {"doc_id": snapshot.docs[d]["doc_id"], "name": snapshot.docs[d]["name"], "count": int(c)}
+                    for d, c in sorted(zip(doc_indexes, counts), key=lambda x: -x[1])
+                ],
+            }
+        live_ranges = [np.asarray(snapshot.streams[field][d["start"]:d["start"] + d["length"]])
+                       for d, alive in zip(snapshot.docs[:snapshot.doc_count], snapshot.live) if alive]
+        if not live_ranges:
+            return {"total_tokens": 0, "terms": []}
+        counts = np.bincount(snapshot.norm_map[np.concatenate(live_ranges)], minlength=len(snapshot.display))
+        top_ids = np.argsort(counts)[::-1][:top]
+        return {
+            "total_tokens": int(counts.sum()),
+            "terms": [{"term": snapshot.display[i], "count": int(counts[i])} for i in top_ids if counts[i]],
+        }
+
+    def stats(self) -> Dict:
+        """
+        lemmas counts distinct (normalized) lemmas in live documents;
+        vocabulary counts every normalized word form and lemma indexed.
+        """
+        snapshot = self._refresh()
+        lemmas = 0
+        if snapshot.live.any():
+            live = [np.asarray(snapshot.streams["lemma"][d["start"]:d["start"] + d["length"]])
+                    for d, alive in zip(snapshot.docs[:snapshot.doc_count], snapshot.live) if alive]
+            counts = np.bincount(snapshot.norm_map[np.concatenate(live)], minlength=len(snapshot.display))
+            lemmas = int(np.count_nonzero(counts))
+        return {
+            "documents": int(snapshot.live.sum()),
+            "tokens": snapshot.token_count,
+            "lemmas": lemmas,
+            "vocabulary": len(snapshot.display),
+            "tokens_in_postings": snapshot.postings_tokens,
+        }
+
+
+# Singleton
+_lemma_index: Optional[LemmaIndex] = None
+_lemma_index_lock = threading.Lock()
+
+
+def get_lemma_index() -> LemmaIndex:
+    global _lemma_index
+    with _lemma_index_lock:
+        if _lemma_index is None:
+            _lemma_index = LemmaIndex()
+        return _lemma_index
@@ -1,11 +1,89 @@
+import asyncio
+import importlib
+import logging
 import os
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+# Before the app modules, which read their settings at import time
+load_dotenv()
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from app.routers import upload
 from app.routers import tts
+from app.routers import jobs
+from app.routers import cache
+from app.routers import correct
+from app.routers import health
+from app.routers import corpus
+from app.routers import storage
+from app.routers import metrics
+from app.routers import documents
+from app.ollama_client import close_clients
+from app.analysis_pool import shutdown_analysis_pool
+from app.jobs import run_in_stage_pool
+from app.job_queue import is_queued
+from app.textProcessor import CLTK_PRELOAD_LANGUAGES, get_text_processor
+from app.tts import get_tts_service
+from app.storage import UPLOAD_DIR, UPLOAD_GC_INTERVAL_SECONDS, run_gc_once
+from app.metrics import (
+    HTTP_SECONDS, TIMING_HEADERS, finish_request_timing, server_timing_header, start_request_timing
+)
+
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Hackathon API")
+async def _collect_upload_garbage():
+    # Apply the upload retention policy periodically
+    while True:
+        try:
+            await run_in_stage_pool("storage", run_gc_once)
+        except Exception as e:
+            logger.warning(f"Upload GC failed: {e}")
+        await asyncio.sleep(UPLOAD_GC_INTERVAL_SECONDS)
+
+def _warm_clients():
+    # Load the heavy SDKs (imported lazily, see app.lazy) and create the
+    # Text-to-Speech client once instead of per request
+    try:
+        get_tts_service().client
+    except Exception as e:
+        logger.warning(f"Text-to-Speech client unavailable: {e}")
+    for name in ("cv2", "numpy"):
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning(f"{name} unavailable: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm CLTK pipelines in the background; already warm when the gunicorn
+    # master preloaded them before forking (see gunicorn.conf.py)
+    processor = get_text_processor()
+    warmup = None
+    # With the job queue, analysis runs in stage workers and this process needs no CLTK
+    if not is_queued("analyze") and any(code not in processor.processors for code in CLTK_PRELOAD_LANGUAGES):
+        # The analyze pool serializes this with request analysis (CLTK is not thread-safe)
+        warmup = asyncio.create_task(run_in_stage_pool("analyze", processor.preload))
+    # Off the startup path, so a new worker answers requests right away
+    clients = asyncio.create_task(run_in_stage_pool("tts", _warm_clients))
+    gc_task = asyncio.create_task(_collect_upload_garbage())
+    yield
+    gc_task.cancel()
+    for task in (warmup, clients):
+        if task is not None and not task.done():
+            task.cancel()
+    # Close pooled HTTP connections and worker processes on shutdown
+    await close_clients()
+    shutdown_analysis_pool()
+
+app = FastAPI(title="Hackathon API", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -16,8 +94,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """
+    Record request latency per route. With TIMING_HEADERS=1, or when the
+    client sends X-Request-Timing: 1, the spans recorded while handling the
+    request are returned in a Server-Timing header.
+    """
+    token = start_request_timing()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        spans = finish_request_timing(token)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    HTTP_SECONDS.observe(
+        elapsed, method=request.method,
+        route=getattr(route, "path", "unmatched"), status=str(response.status_code),
+    )
+    if TIMING_HEADERS or request.headers.get("x-request-timing") == "1":
+        response.headers["X-Response-Time"] = f"{elapsed * 1000:.1f}ms"
+        if spans:
+            response.headers["Server-Timing"] = server_timing_header(spans)
+    return response
+
 # Ensure upload directory exists
-UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # Serve uploaded files
@@ -30,3 +132,11 @@ async def root():
 # Include the upload router
 app.include_router(upload.router)
 app.include_router(tts.router, prefix="/api")
+app.include_router(jobs.router, prefix="/api")
+app.include_router(cache.router, prefix="/api")
+app.include_router(correct.router, prefix="/api")
+app.include_router(health.router, prefix="/api")
+app.include_router(corpus.router, prefix="/api")
+app.include_router(storage.router, prefix="/api")
+app.include_router(documents.router, prefix="/api")
+app.include_router(metrics.router)
@@ -0,0 +1,189 @@
+import contextvars
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Add Server-Timing / X-Response-Time headers to every response
+TIMING_HEADERS = os.getenv("TIMING_HEADERS", "0") not in ("0", "false", "False")
+
+# Seconds; covers sub-millisecond substeps up to multi-minute LLM corrections
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096)
+
+LabelValues = Tuple[str, ...]
+INF_LABEL = 'le="+Inf"'
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        """Cumulative-bucket histogram in the Prometheus text format."""
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., sum, count]
+        self._series: Dict[LabelValues, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = 'le="' + repr(float(bound)) + '"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, INF_LABEL)} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds", "Wall time of each pipeline stage, including pool queueing",
+    ("stage", "language"),
+)
+SPAN_SECONDS = Histogram(
+    "span_seconds", "Timed spans around preprocessing steps and external calls",
+    ("span", "language", "model", "image_size"),
+)
+SPAN_ERRORS = Counter("span_errors_total", "Spans that raised", ("span", "model"))
+LLM_TOKENS = Histogram(
+    "llm_tokens", "Tokens per Ollama generation", ("model", "kind"), buckets=TOKEN_BUCKETS,
+)
+CORRECTION_GATE = Counter(
+    "correction_gate_total",
+    "Correction chunks finished by the rule engine or sent to the LLM, pages with no uncertain words, re-corrected spans",
+    ("language", "outcome"),
+)
+HTTP_SECONDS = Histogram(
+    "http_request_seconds", "Time to the response head, per route", ("method", "route", "status"),
+)
+
+REGISTRY = [STAGE_SECONDS, SPAN_SECONDS, SPAN_ERRORS, LLM_TOKENS, CORRECTION_GATE, HTTP_SECONDS]
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def size_class(width: Optional[int], height: Optional[int]) -> str:
+    """Coarse megapixel class; keeps image size usable as a metric label."""
+    if not width or not height:
+        return ""
+    megapixels = width * height / 1e6
+    for limit in (1, 4, 16, 64):
+        if megapixels <= limit:
+            return f"<={limit}MP"
+    return ">64MP"
+
+
+def image_size_class(content: bytes) -> str:
+    """Size class from a PNG header (preprocessed pages are PNG); empty otherwise."""
+    if content[:8] == b"\x89PNG\r\n\x1a\n" and len(content) >= 24:
+        width, height = struct.unpack(">II", content[16:24])
+        return size_class(width, height)
+    return ""
+
+
+# Spans recorded while handling the current request, for the timing headers
+_request_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_spans", default=None
+)
+
+
+def start_request_timing() -> contextvars.Token:
+    return _request_spans.set([])
+
+
+def finish_request_timing(token: contextvars.Token) -> List[Tuple[str, float]]:
+    spans = _request_spans.get() or []
+    _request_spans.reset(token)
+    return spans
+
+
+def record_request_span(name: str, seconds: float):
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+def observe_span(name: str, seconds: float, language: str = "", model: str = "", image_size: str = ""):
+    SPAN_SECONDS.observe(seconds, span=name, language=language or "", model=model or "", image_size=image_size or "")
+    record_request_span(name, seconds)
+
+
+@contextmanager
+def span(name: str, language: Optional[str] = None, model: Optional[str] = None,
+         image_size: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Time a block into span_seconds. The yielded dict lets the block fill in
+    labels it only learns while running (e.g. span_info["model"] = engine).
+    """
+    info = {"language": language or "", "model": model or "", "image_size": image_size or ""}
+    start = time.perf_counter()
+    try:
+        yield info
+    except Exception:
+        SPAN_ERRORS.inc(span=name, model=info["model"])
+        raise
+    finally:
+        observe_span(name, time.perf_counter() - start, info["language"], info["model"], info["image_size"])
+
+
+def server_timing_header(spans: List[Tuple[str, float]]) -> str:
+    """Server-Timing value, durations summed per span name, in milliseconds."""
+    totals: Dict[str, float] = {}
+    for name, seconds in spans:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name.replace(' ', '_')};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
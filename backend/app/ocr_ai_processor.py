@@ -1,49 +1,77 @@
 import os
 import io
-from google.cloud import vision
-import google.generativeai as genai
-from dotenv import load_dotenv
-import requests
+import re
+import logging
+import httpx
+from typing import Dict, List, Optional, Tuple
+from app.cache import MISS, hash_bytes, lookup_cached, make_key, store_cached
+from app.chunking import split_text_into_chunks, stitch_chunks
+from app.cleanup import CLEANUP_VERSION, apply_rules
+from app.jobs import get_stage_pool
+from app.job_queue import queue_task
+from app.layout import PageLayout
+from app.metrics import CORRECTION_GATE
+from app.ollama_client import OllamaOverloadedError, generate
+from app.ocr_backends import NO_TEXT, OCRResult, get_ocr_backend
+from app.ocr_words import Span, WordTable
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# Google Vision setup
-os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-vision_client = vision.ImageAnnotatorClient()
-
-# Ollama setup
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
+# Ollama setup (connection pooling and per-model limits live in app.ollama_client)
 OLLAMA_MODEL = "llama3.1" #This will default model but qwen will be used for non Latin languages
+NON_LATIN_MODEL = "qwen2.5"
+
+# Bump PROMPT_VERSION whenever a correction prompt changes so stale
+# corrections are not served from the result cache
+PROMPT_VERSION = "2"
+
+# Longest text sent in one correction prompt. Longer pages are split into
+# overlapping chunks corrected in parallel, which keeps each response well
+# inside num_predict. Non-Latin scripts cost more tokens per character.
+CHUNK_MAX_CHARS = int(os.getenv("CORRECTION_CHUNK_MAX_CHARS", "1500"))
+NON_LATIN_CHUNK_MAX_CHARS = int(os.getenv("CORRECTION_NON_LATIN_CHUNK_MAX_CHARS", "700"))
+
+# Chunks whose share of clean-looking words, after the deterministic rules
+# in app.cleanup, reaches this skip the LLM. The word checks flag roughly
+# two in three letter substitutions, so 0.97 lets through pages with about
+# 1% misread words; set it above 1 to always call the LLM.
+CORRECTION_SKIP_QUALITY = float(os.getenv("CORRECTION_SKIP_QUALITY", "0.97"))
+
+# When the OCR engine reports word confidences, only words below
+# CORRECTION_MIN_CONFIDENCE go to the LLM, with CORRECTION_CONTEXT_WORDS
+# words either side; the rest of the page only gets the deterministic rules.
+# The spans of a chunk go out together, as numbered windows in one prompt.
+# Pages with more than CORRECTION_SPAN_MAX_SHARE of their words uncertain,
+# or whose span prompts would be longer than the page's own, are corrected
+# whole.
+CORRECTION_MIN_CONFIDENCE = float(os.getenv("CORRECTION_MIN_CONFIDENCE", "0.8"))
+CORRECTION_CONTEXT_WORDS = int(os.getenv("CORRECTION_CONTEXT_WORDS", "6"))
+CORRECTION_SPAN_MAX_SHARE = float(os.getenv("CORRECTION_SPAN_MAX_SHARE", "0.4"))
+# "[3] corrected words" at the start of a line of a span prompt's answer
+SPAN_MARKER = re.compile(r"^\s*\[(\d+)\]\s*", re.MULTILINE)
 
-def call_ollama(prompt: str, model: str = OLLAMA_MODEL) -> str:
+CORRECTION_MODELS = {
+    "latin": OLLAMA_MODEL,
+    "old_english": OLLAMA_MODEL,
+    "sanskrit": NON_LATIN_MODEL,
+    "greek": NON_LATIN_MODEL,
+}
+
+def call_ollama(prompt: str, model: str = OLLAMA_MODEL) -> Optional[str]:
     """
-    Call Ollama API with a prompt and return the response
+    Call Ollama API with a prompt and return the response, or None when the
+    call failed
     """
     try:
-        payload = {
-            "model": model,
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.3,  # Lower for more deterministic corrections
-                "top_p": 0.9,
-                "num_predict": 2000  
-            }
-        }
-        
-        response = requests.post(OLLAMA_API_URL, json=payload, timeout=120)
-        response.raise_for_status()
-        
-        result = response.json()
-        raw_response = result.get("response", "").strip()
-        
+        raw_response = generate(prompt, model).strip()
+
         # Clean up common LLM preambles and postscripts
         cleaned = clean_llm_response(raw_response)
         return cleaned
-    
-    except requests.exceptions.RequestException as e:
-        print(f"Ollama API error: {e}")
-        return ""
+
+    except (httpx.HTTPError, OllamaOverloadedError) as e:
+        logger.error(f"Ollama API error: {e}")
+        return None
 
 def clean_llm_response(text: str) -> str:
     """
@@ -84,21 +112,83 @@ def clean_llm_response(text: str) -> str:
     
     return result
 
-def extract_text_with_vision(image_path: str) -> str:
+def extract_text(image_path: str, backend: Optional[str] = None,
+                 language: Optional[str] = None) -> Tuple[str, str]:
+    """
+    OCR an image with the named backend (default OCR_BACKEND).
+    Returns (text, engine) where engine is the backend that produced the text.
+    """
     with io.open(image_path, 'rb') as image_file:
         content = image_file.read()
-    
-    image = vision.Image(content=content)
-    response = vision_client.text_detection(image=image)
-    
-    if response.error.message:
-        raise Exception(f'Vision API Error: {response.error.message}')
-    
-    texts = response.text_annotations
-    return texts[0].description if texts else "No text found"
+    return get_ocr_backend(backend).ocr(content, language)
 
-def correct_latin_with_ollama(raw_text: str) -> str:
-    prompt = f"""You are an expert in medieval Latin paleography and manuscript transcription.
+def extract_text_with_words(image_path: str, backend: Optional[str] = None,
+                            language: Optional[str] = None) -> Tuple[str, Optional[WordTable], str]:
+    """Like extract_text, plus the word table (None when the engine has no word confidences)."""
+    with io.open(image_path, 'rb') as image_file:
+        content = image_file.read()
+    return get_ocr_backend(backend).ocr_words(content, language)
+
+def extract_texts(image_paths: List[str], backend: Optional[str] = None,
+                  language: Optional[str] = None) -> List[Tuple[OCRResult, str]]:
+    """OCR many images, batching remote calls where the backend supports it."""
+    contents = []
+    for path in image_paths:
+        with io.open(path, 'rb') as image_file:
+            contents.append(image_file.read())
+    return get_ocr_backend(backend).ocr_many(contents, language)
+
+def extract_layout_texts(layouts: List[PageLayout], backend: Optional[str] = None,
+                         language: Optional[str] = None) -> List[PageLayout]:
+    """
+    OCR the region crops of one or more pages, filling in each region's
+    text (or error) and engine. Batching backends get every crop in as few
+    calls as possible; others OCR the crops in parallel.
+    """
+    ocr_backend = get_ocr_backend(backend)
+    crops = [crop for layout in layouts for crop in layout.crops]
+    if ocr_backend.batch_size > 1:
+        results = ocr_backend.ocr_many(crops, language)
+    else:
+        def ocr_one(content: bytes) -> Tuple[OCRResult, str]:
+            try:
+                text, words, engine = ocr_backend.ocr_words(content, language)
+                return (text, None, words), engine
+            except Exception as e:
+                return (None, str(e), None), ocr_backend.name
+
+        # Runs on its own pool: the caller is usually already an "ocr" stage worker
+        results = list(get_stage_pool("ocr-regions").map(ocr_one, crops))
+
+    regions = [region for layout in layouts for region in layout.regions]
+    for region, ((text, error, words), engine) in zip(regions, results):
+        region.text, region.error, region.words, region.engine = text, error, words, engine
+    return layouts
+
+def layout_ocr_result(layout: PageLayout, backend: Optional[str] = None) -> Tuple[OCRResult, str]:
+    """
+    ((page text, error, words), engine) for an OCR'd layout. Pages where
+    only some regions failed keep the text that was recognized; the engine
+    is the fallback's name if any region needed it.
+    """
+    primary = get_ocr_backend(backend).name
+    errors = [r.error for r in layout.regions if r.error]
+    if errors and len(errors) == len(layout.regions):
+        return (None, errors[0], None), primary
+    engine = next((r.engine for r in layout.regions if r.engine and r.engine != primary), primary)
+    return (layout.text(NO_TEXT), errors[0] if errors else None, layout.words(NO_TEXT)), engine
+
+def extract_text_with_vision(image_path: str) -> Tuple[str, Optional[WordTable]]:
+    """
+    OCR an image with Google Vision: the page text and its word table
+    (pages, blocks, paragraphs, lines, boxes and confidences). Results are
+    cached by image content hash.
+    """
+    text, words, _ = extract_text_with_words(image_path, "google-vision")
+    return text, words
+
+def latin_correction_prompt(raw_text: str) -> str:
+    return f"""You are an expert in medieval Latin paleography and manuscript transcription.
 
 I have OCR output from a medieval Latin manuscript (Vulgate Bible) with errors. Correct it:
 
@@ -114,11 +204,12 @@ RAW OCR:
 
 CRITICAL: Return ONLY the corrected Latin text. No explanations, no "here is", no notes, no commentary. Just the text itself."""
 
-    corrected = call_ollama(prompt)
+def correct_latin_with_ollama(raw_text: str) -> str:
+    corrected = call_ollama(latin_correction_prompt(raw_text))
     return corrected if corrected else raw_text
 
-def correct_old_english_with_ollama(raw_text: str) -> str:
-    prompt = f"""You are an expert in Old English (Anglo-Saxon) paleography and manuscript transcription.
+def old_english_correction_prompt(raw_text: str) -> str:
+    return f"""You are an expert in Old English (Anglo-Saxon) paleography and manuscript transcription.
 
 I have OCR output from an Old English manuscript with errors. Correct it:
 
@@ -136,11 +227,12 @@ RAW OCR:
 
 CRITICAL: Return ONLY the corrected Old English text. No explanations, no "here is", no notes, no commentary. Just the text itself."""
 
-    corrected = call_ollama(prompt)
+def correct_old_english_with_ollama(raw_text: str) -> str:
+    corrected = call_ollama(old_english_correction_prompt(raw_text))
     return corrected if corrected else raw_text
 
-def correct_sanskrit_with_ollama(raw_text: str) -> str:
-    prompt = f"""You are an expert in Sanskrit paleography and manuscript transcription, specializing in Devanagari script.
+def sanskrit_correction_prompt(raw_text: str) -> str:
+    return f"""You are an expert in Sanskrit paleography and manuscript transcription, specializing in Devanagari script.
 
 I have OCR output from a Sanskrit manuscript with errors. Correct it:
 
@@ -159,11 +251,12 @@ RAW OCR:
 
 CRITICAL: Return ONLY the corrected Sanskrit text in Devanagari script. No explanations, no "here is", no notes, no commentary. Just the text itself."""
 
-    corrected = call_ollama(prompt, model="qwen2.5")  # Better for non-Latin scripts
+def correct_sanskrit_with_ollama(raw_text: str) -> str:
+    corrected = call_ollama(sanskrit_correction_prompt(raw_text), model=NON_LATIN_MODEL)  # Better for non-Latin scripts
     return corrected if corrected else raw_text
 
-def correct_greek_with_ollama(raw_text: str) -> str:
-    prompt = f"""You are an expert in Ancient Greek paleography and manuscript transcription.
+def greek_correction_prompt(raw_text: str) -> str:
+    return f"""You are an expert in Ancient Greek paleography and manuscript transcription.
 
 I have OCR output from an Ancient Greek manuscript with errors. Correct it:
 
@@ -183,21 +276,178 @@ RAW OCR:
 
 CRITICAL: Return ONLY the corrected Ancient Greek text. No explanations, no "here is", no notes, no commentary. Just the text itself."""
 
-    corrected = call_ollama(prompt, model="qwen2.5")  # Better for non-Latin scripts
+def correct_greek_with_ollama(raw_text: str) -> str:
+    corrected = call_ollama(greek_correction_prompt(raw_text), model=NON_LATIN_MODEL)  # Better for non-Latin scripts
     return corrected if corrected else raw_text
     
-def correct_text_with_ollama(raw_text: str, language: str) -> str:
-    """
-    Router function that picks the right correction function based on language
-    """
-    if language == "latin":
-        return correct_latin_with_ollama(raw_text)
-    elif language == "old_english":
-        return correct_old_english_with_ollama(raw_text)
-    elif language == "sanskrit":
-        return correct_sanskrit_with_ollama(raw_text)
-    elif language == "greek":
-        return correct_greek_with_ollama(raw_text)
+@queue_task
+def correct_text_with_ollama(raw_text: str, language: str, words: Optional[WordTable] = None) -> str:
+    """
+    Correct OCR text for the given language, reusing cached corrections
+    keyed by text, language, model and prompt version. With the OCR word
+    table only the low-confidence spans are sent to the LLM.
+    """
+    if language not in CORRECTION_MODELS:
+        # Fallback to raw text if language not supported yet
+        return raw_text
+    if isinstance(words, dict):
+        # Sent through the job queue
+        words = WordTable.from_dict(words)
+
+    spans = uncertain_spans(words, language)
+    key = correction_cache_key(raw_text, language, spans)
+    cached = lookup_cached("correct", key)
+    if cached is not MISS:
+        return cached
+
+    if spans is None:
+        corrected, complete = _correct_in_chunks(raw_text, language)
     else:
+        corrected, complete = _correct_spans(words, spans, language)
+    # Skip caching when any chunk fell back to raw text (Ollama failed)
+    if complete:
+        store_cached("correct", key, corrected)
+    return corrected
+
+def _correct_in_chunks(raw_text: str, language: str):
+    """
+    Correct long text as overlapping chunks run concurrently, then stitch.
+    Returns (corrected_text, complete) where complete is False if any chunk
+    fell back to its input because the LLM call failed.
+    """
+    chunks = split_text_into_chunks(raw_text, _chunk_max_chars(language))
+    if len(chunks) == 1:
+        return _correct_chunk(raw_text, language)
+
+    # Runs on its own pool: the caller is usually already a "correct" stage worker
+    pool = get_stage_pool("correct-chunks")
+    results = list(pool.map(lambda chunk: _correct_chunk(chunk, language), chunks))
+    return stitch_chunks([fixed for fixed, _ in results]), all(ok for _, ok in results)
+
+def _chunk_max_chars(language: str) -> int:
+    return CHUNK_MAX_CHARS if CORRECTION_MODELS[language] == OLLAMA_MODEL else NON_LATIN_CHUNK_MAX_CHARS
+
+def uncertain_spans(words: Optional[WordTable], language: str) -> Optional[List[Span]]:
+    """
+    Spans to re-correct, or None when the whole page should be corrected:
+    too many uncertain words, a window longer than a chunk, or span prompts
+    no shorter than the page's.
+    """
+    if not words or language not in CORRECTION_PROMPTS:
+        return None
+    if len(words.uncertain(CORRECTION_MIN_CONFIDENCE)) > CORRECTION_SPAN_MAX_SHARE * len(words):
+        return None
+    spans = words.spans(CORRECTION_MIN_CONFIDENCE, CORRECTION_CONTEXT_WORDS)
+    batches = _span_batches(words, spans, language)
+    # A window longer than a chunk would overrun num_predict like an unchunked page
+    if any(len(window) > _chunk_max_chars(language) for _, windows in batches for window in windows):
+        return None
+    span_chars = sum(len(span_correction_prompt(windows, language)) for _, windows in batches)
+    page_chars = sum(
+        len(build_correction_prompt(chunk, language))
+        for chunk in split_text_into_chunks(words.text(), _chunk_max_chars(language))
+    )
+    return spans if span_chars < page_chars else None
+
+def _span_batches(words: WordTable, spans: List[Span], language: str) -> List[Tuple[List[Span], List[str]]]:
+    """Spans grouped into prompts of at most a chunk's worth of window text, with their windows."""
+    max_chars = _chunk_max_chars(language)
+    batches: List[Tuple[List[Span], List[str]]] = []
+    size = 0
+    for span in spans:
+        # One line per window; splicing only looks at the words
+        window = " ".join(words.words[span[2]:span[3]])
+        if not batches or size + len(window) > max_chars:
+            batches.append(([], []))
+            size = 0
+        batches[-1][0].append(span)
+        batches[-1][1].append(window)
+        size += len(window) + 1
+    return batches
+
+def span_correction_prompt(windows: List[str], language: str) -> str:
+    """The language's correction prompt over numbered excerpts, one per line."""
+    numbered = "\n".join(f"[{n}] {window}" for n, window in enumerate(windows, 1))
+    return build_correction_prompt(numbered, language) + (
+        f"\n\nThe RAW OCR is {len(windows)} separate excerpts, one per line, each starting with its number "
+        f"in brackets. Correct each excerpt on its own and return exactly {len(windows)} lines, "
+        f"each starting with the same [number]."
+    )
+
+def _parse_numbered(text: str, count: int) -> Dict[int, str]:
+    """Answers of a span prompt by excerpt number; excerpts the model dropped are missing."""
+    parts = SPAN_MARKER.split(text)
+    answers: Dict[int, str] = {}
+    for number, answer in zip(parts[1::2], parts[2::2]):
+        n = int(number)
+        if 1 <= n <= count and n not in answers:
+            answers[n] = " ".join(answer.split())
+    return answers
+
+def _correct_spans(words: WordTable, spans: List[Span], language: str) -> Tuple[str, bool]:
+    """
+    Send the uncertain spans, with their context, through the language's
+    correction prompt as numbered windows, a chunk's worth per call, and
+    splice the corrected words back into the page; then apply the
+    deterministic rules to the whole page.
+    Returns (text, complete) like _correct_in_chunks.
+    """
+    if not spans:
+        CORRECTION_GATE.inc(language=language, outcome="confident")
+        return apply_rules(words.text(), language).text, True
+
+    def fix(batch: Tuple[List[Span], List[str]]) -> Tuple[List[Tuple[Span, str]], bool]:
+        batch_spans, windows = batch
+        CORRECTION_GATE.inc(language=language, outcome="span")
+        corrected = call_ollama(span_correction_prompt(windows, language), CORRECTION_MODELS[language])
+        answers = _parse_numbered(corrected or "", len(windows))
+        fixes = [(span, answers[n]) for n, span in enumerate(batch_spans, 1) if answers.get(n)]
+        return fixes, len(fixes) == len(batch_spans)
+
+    # Runs on its own pool: the caller is usually already a "correct" stage worker
+    results = list(get_stage_pool("correct-chunks").map(fix, _span_batches(words, spans, language)))
+    spliced = words.splice([fix for fixes, _ in results for fix in fixes])
+    return apply_rules(spliced, language).text, all(ok for _, ok in results)
+
+def _correct_chunk(chunk: str, language: str) -> Tuple[str, bool]:
+    """
+    Apply the deterministic rules, then the LLM only when the chunk still
+    looks dirty. Returns (text, ok) where ok is False if the LLM call failed.
+    """
+    cleaned = apply_rules(chunk, language)
+    if cleaned.quality >= CORRECTION_SKIP_QUALITY:
+        CORRECTION_GATE.inc(language=language, outcome="rules")
+        return cleaned.text, True
+    CORRECTION_GATE.inc(language=language, outcome="llm")
+    return _route_correction(cleaned.text, language)
+
+def correction_cache_key(raw_text: str, language: str, spans: Optional[List[Span]] = None) -> str:
+    return make_key(
+        "correct", hash_bytes(raw_text.encode("utf-8")),
+        language, CORRECTION_MODELS[language], PROMPT_VERSION, CLEANUP_VERSION, spans
+    )
+
+def build_correction_prompt(raw_text: str, language: str) -> str:
+    """Prompt used by the correction route for the given language."""
+    return CORRECTION_PROMPTS[language](raw_text)
+
+def _route_correction(raw_text: str, language: str) -> Tuple[str, bool]:
+    """
+    Correct with the language's prompt and model. Returns (text, ok) where ok
+    is False, and text the input unchanged, when the LLM call failed or came
+    back empty; an unchanged correction of clean text is still ok.
+    """
+    if language not in CORRECTION_PROMPTS:
         # Fallback to raw text if language not supported yet
-        return raw_text
\ No newline at end of file
+        return raw_text, True
+    corrected = call_ollama(build_correction_prompt(raw_text, language), CORRECTION_MODELS[language])
+    if not corrected:
+        return raw_text, False
+    return corrected, True
+
+CORRECTION_PROMPTS = {
+    "latin": latin_correction_prompt,
+    "old_english": old_english_correction_prompt,
+    "sanskrit": sanskrit_correction_prompt,
+    "greek": greek_correction_prompt,
+}
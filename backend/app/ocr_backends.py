@@ -0,0 +1,297 @@
+import io
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Tuple
+
+from app.cache import MISS, cached_call, hash_bytes, lookup_cached, make_key, store_cached
+from app.lazy import lazy_import
+from app.metrics import image_size_class, span
+from app.ocr_words import WordTable, pack_ocr, unpack_ocr
+from app.ratelimit import RateLimiter
+from app.vision_stub import StubVisionClient
+
+# The Vision SDK (grpc, protobuf) loads on first use, not at startup
+vision = lazy_import("google.cloud.vision")
+
+logger = logging.getLogger(__name__)
+
+# Backend used when a request does not name one: google-vision, tesseract,
+# stub, or fallback (Vision with a local engine when Vision fails or is slow)
+OCR_BACKEND = os.getenv("OCR_BACKEND", "google-vision")
+OCR_FALLBACK_BACKEND = os.getenv("OCR_FALLBACK_BACKEND", "tesseract")
+# Seconds to wait for the remote engine before falling back
+OCR_FALLBACK_TIMEOUT = float(os.getenv("OCR_FALLBACK_TIMEOUT", "30"))
+
+# Google Vision setup ("stub" runs offline, see app.vision_stub)
+VISION_CLIENT = os.getenv("VISION_CLIENT", "google")
+# Images per batch_annotate_images call (the API accepts at most 16)
+VISION_BATCH_SIZE = min(16, int(os.getenv("VISION_BATCH_SIZE", "16")))
+# Images per minute sent to Vision, kept under the project quota
+VISION_IMAGES_PER_MINUTE = float(os.getenv("VISION_IMAGES_PER_MINUTE", "1800"))
+
+# Tesseract traineddata per pipeline language
+TESSERACT_LANGUAGES = {
+    "lat": "lat", "latin": "lat",
+    "grc": "grc", "greek": "grc", "ancient greek": "grc",
+    "ang": "eng", "old_english": "eng", "old english": "eng", "english": "eng",
+    "san": "san", "sanskrit": "san",
+}
+TESSERACT_CONFIG = os.getenv("TESSERACT_CONFIG", "--oem 1 --psm 3")
+
+NO_TEXT = "No text found"
+
+# (text, error, words); words is None for engines without word confidences
+OCRResult = Tuple[Optional[str], Optional[str], Optional[WordTable]]
+
+
+class OCRBackend(ABC):
+    """Turns image bytes into text. Subclasses implement detect_text."""
+    name = "base"
+    batch_size = 1
+
+    @abstractmethod
+    def detect_text(self, content: bytes, language: Optional[str] = None) -> str:
+        ...
+
+    def detect(self, content: bytes, language: Optional[str] = None):
+        """OCR cache value for an image: the text, plus word confidences where the engine has them."""
+        return self.detect_text(content, language)
+
+    def cache_name(self, language: Optional[str] = None) -> str:
+        """Engine identity used in cache keys; include anything that changes output."""
+        return self.name
+
+    def cache_key(self, content: bytes, language: Optional[str] = None) -> str:
+        return make_key("ocr", self.cache_name(language), hash_bytes(content))
+
+    def ocr(self, content: bytes, language: Optional[str] = None) -> Tuple[str, str]:
+        """Cached OCR; returns (text, name of the engine that produced it)."""
+        text, _, engine = self.ocr_words(content, language)
+        return text, engine
+
+    def ocr_words(self, content: bytes, language: Optional[str] = None) -> Tuple[str, Optional[WordTable], str]:
+        """Cached OCR; returns (text, word table or None, engine)."""
+        key = self.cache_key(content, language)
+        text, words = unpack_ocr(cached_call("ocr", key, lambda: self._timed_detect(content, language)))
+        return text, words, self.name
+
+    def _timed_detect(self, content: bytes, language: Optional[str] = None):
+        with span("ocr.detect", language, self.name, image_size_class(content)):
+            return self.detect(content, language)
+
+    def ocr_many(self, contents: List[bytes], language: Optional[str] = None) -> List[Tuple[OCRResult, str]]:
+        """OCR several images; returns ((text, error, words), engine) per image, in order."""
+        results = []
+        for content in contents:
+            try:
+                text, words, engine = self.ocr_words(content, language)
+                results.append(((text, None, words), engine))
+            except Exception as e:
+                results.append(((None, str(e), None), self.name))
+        return results
+
+
+class VisionOCRBackend(OCRBackend):
+    name = "google-vision"
+    batch_size = VISION_BATCH_SIZE
+
+    def __init__(self, client=None, name: Optional[str] = None):
+        """Google Vision text detection. The client is created on first use."""
+        self._client = client
+        self._client_lock = threading.Lock()
+        if name:
+            self.name = name
+        self.rate_limiter = RateLimiter(VISION_IMAGES_PER_MINUTE)
+
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                if VISION_CLIENT == "stub":
+                    self._client = StubVisionClient()
+                else:
+                    self._client = vision.ImageAnnotatorClient()
+            return self._client
+
+    @staticmethod
+    def _annotation_text(response) -> str:
+        texts = response.text_annotations
+        return texts[0].description if texts else NO_TEXT
+
+    @staticmethod
+    def _annotation_value(response):
+        """Text plus the word table flattened from full_text_annotation."""
+        annotation = getattr(response, "full_text_annotation", None)
+        words = WordTable.from_vision(annotation) if annotation is not None and annotation.pages else None
+        return pack_ocr(VisionOCRBackend._annotation_text(response), words)
+
+    def detect(self, content: bytes, language: Optional[str] = None):
+        image = vision.Image(content=content)
+        self.rate_limiter.acquire(1)
+        response = self.client.text_detection(image=image)
+
+        if response.error.message:
+            raise Exception(f'Vision API Error: {response.error.message}')
+
+        return self._annotation_value(response)
+
+    def detect_text(self, content: bytes, language: Optional[str] = None) -> str:
+        return unpack_ocr(self.detect(content, language))[0]
+
+    def ocr_many(self, contents: List[bytes], language: Optional[str] = None) -> List[Tuple[OCRResult, str]]:
+        """
+        Cached images are skipped; the rest go out in batch_annotate_images
+        calls of up to batch_size images.
+        """
+        results: List[Tuple[OCRResult, str]] = [((None, None, None), self.name)] * len(contents)
+        pending = []
+        for i, content in enumerate(contents):
+            key = self.cache_key(content, language)
+            cached = lookup_cached("ocr", key)
+            if cached is not MISS:
+                text, words = unpack_ocr(cached)
+                results[i] = ((text, None, words), self.name)
+            else:
+                pending.append((i, key, content))
+
+        for start in range(0, len(pending), self.batch_size):
+            group = pending[start:start + self.batch_size]
+            requests = [
+                vision.AnnotateImageRequest(
+                    image=vision.Image(content=content),
+                    features=[vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)],
+                )
+                for _, _, content in group
+            ]
+            self.rate_limiter.acquire(len(requests))
+            try:
+                with span("ocr.batch", language, self.name, image_size_class(group[0][2])):
+                    batch = self.client.batch_annotate_images(requests=requests)
+            except Exception as e:
+                for i, _, _ in group:
+                    results[i] = ((None, f"Vision API Error: {e}", None), self.name)
+                continue
+            for (i, key, _), response in zip(group, batch.responses):
+                if response.error.message:
+                    results[i] = ((None, f"Vision API Error: {response.error.message}", None), self.name)
+                    continue
+                value = self._annotation_value(response)
+                store_cached("ocr", key, value)
+                text, words = unpack_ocr(value)
+                results[i] = ((text, None, words), self.name)
+        return results
+
+
+class TesseractOCRBackend(OCRBackend):
+    name = "tesseract"
+
+    def __init__(self, config: str = TESSERACT_CONFIG):
+        """Local CPU OCR through the tesseract binary; no network needed."""
+        self.config = config
+        self._version: Optional[str] = None
+
+    @staticmethod
+    def language_code(language: Optional[str]) -> str:
+        if not language:
+            return "lat"
+        return TESSERACT_LANGUAGES.get(language.strip().lower(), "lat")
+
+    def cache_name(self, language: Optional[str] = None) -> str:
+        if self._version is None:
+            try:
+                import pytesseract
+                self._version = str(pytesseract.get_tesseract_version())
+            except Exception:
+                self._version = "unknown"
+        return f"{self.name}-{self._version}-{self.language_code(language)}-{self.config}"
+
+    def detect_text(self, content: bytes, language: Optional[str] = None) -> str:
+        try:
+            import pytesseract
+            from PIL import Image
+        except ImportError as e:
+            raise RuntimeError("Tesseract OCR requires pytesseract and Pillow") from e
+        with Image.open(io.BytesIO(content)) as image:
+            text = pytesseract.image_to_string(image, lang=self.language_code(language), config=self.config)
+        text = text.strip()
+        return text if text else NO_TEXT
+
+
+class FallbackOCRBackend(OCRBackend):
+    def __init__(self, primary: OCRBackend, fallback: OCRBackend, timeout: float = OCR_FALLBACK_TIMEOUT):
+        """
+        Use `primary`, switching to `fallback` when it raises or takes longer
+        than `timeout` seconds. A slow primary call keeps running in the
+        background and still fills the cache for next time.
+        """
+        self.primary = primary
+        self.fallback = fallback
+        self.timeout = timeout
+        # Page-level caches key on the primary engine; fallback text is only
+        # cached under the fallback engine's own key
+        self.name = primary.name
+        self.batch_size = primary.batch_size
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ocr-primary")
+
+    def cache_name(self, language: Optional[str] = None) -> str:
+        return self.primary.cache_name(language)
+
+    def detect_text(self, content: bytes, language: Optional[str] = None) -> str:
+        return self.ocr(content, language)[0]
+
+    def ocr_words(self, content: bytes, language: Optional[str] = None) -> Tuple[str, Optional[WordTable], str]:
+        future = self._executor.submit(self.primary.ocr_words, content, language)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            logger.warning(f"{self.primary.name} OCR took over {self.timeout}s, using {self.fallback.name}")
+        except Exception as e:
+            logger.warning(f"{self.primary.name} OCR failed ({e}), using {self.fallback.name}")
+        return self.fallback.ocr_words(content, language)
+
+    def ocr_many(self, contents: List[bytes], language: Optional[str] = None) -> List[Tuple[OCRResult, str]]:
+        future = self._executor.submit(self.primary.ocr_many, contents, language)
+        try:
+            results = future.result(timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"{self.primary.name} batch OCR failed or timed out ({e}), using {self.fallback.name}")
+            return self.fallback.ocr_many(contents, language)
+        retry = [i for i, ((_, error, _), _) in enumerate(results) if error]
+        if retry:
+            for i, result in zip(retry, self.fallback.ocr_many([contents[i] for i in retry], language)):
+                results[i] = result
+        return results
+
+
+_backends: Dict[str, OCRBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def _build_backend(name: str) -> OCRBackend:
+    if name in ("google-vision", "vision", "google"):
+        return VisionOCRBackend()
+    if name == "tesseract":
+        return TesseractOCRBackend()
+    if name == "stub":
+        return VisionOCRBackend(client=StubVisionClient(), name="stub")
+    if name == "fallback":
+        return FallbackOCRBackend(get_ocr_backend("google-vision"), get_ocr_backend(OCR_FALLBACK_BACKEND))
+    raise ValueError(f"Unknown OCR backend: {name}")
+
+
+OCR_BACKEND_NAMES = ("google-vision", "vision", "google", "tesseract", "stub", "fallback")
+
+
+def get_ocr_backend(name: Optional[str] = None) -> OCRBackend:
+    """Shared backend instance by name (defaults to OCR_BACKEND)."""
+    name = (name or OCR_BACKEND).strip().lower()
+    with _backends_lock:
+        backend = _backends.get(name)
+    if backend is None:
+        backend = _build_backend(name)
+        with _backends_lock:
+            backend = _backends.setdefault(name, backend)
+    return backend
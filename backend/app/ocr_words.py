@@ -0,0 +1,217 @@
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Sequence, Tuple
+
+Box = Tuple[int, int, int, int]
+# (first uncertain word, end, first context word, context end), word indices
+Span = Tuple[int, int, int, int]
+
+# Text Vision puts after a word, by TextAnnotation.DetectedBreak.BreakType
+# (UNKNOWN, SPACE, SURE_SPACE, EOL_SURE_SPACE, HYPHEN, LINE_BREAK)
+BREAK_TEXT = {0: "", 1: " ", 2: " ", 3: "\n", 4: "-\n", 5: "\n"}
+LINE_ENDING_BREAKS = (3, 4, 5)
+# A re-corrected span whose words match the original less than this is
+# treated as a rewrite (or a hallucination) and dropped
+MIN_SPLICE_SIMILARITY = 0.5
+
+COLUMNS = ("words", "confidence", "symbol_confidence", "bbox", "page", "block", "paragraph", "line", "breaks")
+
+
+@dataclass
+class WordTable:
+    """
+    Vision's page/block/paragraph/word hierarchy, one row per word, stored as
+    parallel columns: compact to cache and serialize, and cheap to scan for
+    uncertain words. `breaks` is the text that follows each word.
+    """
+    words: List[str] = field(default_factory=list)
+    confidence: List[float] = field(default_factory=list)
+    # Confidence of the least certain symbol in the word
+    symbol_confidence: List[float] = field(default_factory=list)
+    bbox: List[Box] = field(default_factory=list)
+    page: List[int] = field(default_factory=list)
+    block: List[int] = field(default_factory=list)
+    paragraph: List[int] = field(default_factory=list)
+    line: List[int] = field(default_factory=list)
+    breaks: List[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    @classmethod
+    def from_vision(cls, annotation) -> "WordTable":
+        """Flatten a Vision full_text_annotation."""
+        table = cls()
+        block = paragraph = line = 0
+        for page_index, page in enumerate(annotation.pages):
+            for vision_block in page.blocks:
+                for vision_paragraph in vision_block.paragraphs:
+                    for word in vision_paragraph.words:
+                        symbols = list(word.symbols)
+                        if not symbols:
+                            continue
+                        break_type = int(symbols[-1].property.detected_break.type_)
+                        table.words.append("".join(s.text for s in symbols))
+                        table.confidence.append(float(word.confidence))
+                        table.symbol_confidence.append(min(float(s.confidence) for s in symbols))
+                        table.bbox.append(_vertices_box(word.bounding_box.vertices))
+                        table.page.append(page_index)
+                        table.block.append(block)
+                        table.paragraph.append(paragraph)
+                        table.line.append(line)
+                        table.breaks.append(BREAK_TEXT.get(break_type, " "))
+                        if break_type in LINE_ENDING_BREAKS:
+                            line += 1
+                    paragraph += 1
+                block += 1
+                # Blocks always end a line, whatever the last break says
+                if table.words and table.line[-1] == line:
+                    line += 1
+                    if not table.breaks[-1].endswith("\n"):
+                        table.breaks[-1] = "\n"
+        return table
+
+    def to_dict(self) -> Dict:
+        data = {name: getattr(self, name) for name in COLUMNS}
+        data["confidence"] = [round(c, 3) for c in self.confidence]
+        data["symbol_confidence"] = [round(c, 3) for c in self.symbol_confidence]
+        data["bbox"] = [list(box) for box in self.bbox]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "WordTable":
+        table = cls(**{name: list(data.get(name, [])) for name in COLUMNS})
+        table.bbox = [tuple(box) for box in table.bbox]
+        return table
+
+    def text(self, start: int = 0, end: Optional[int] = None) -> str:
+        """Words start..end with the breaks between them, as Vision writes the page text."""
+        end = len(self.words) if end is None else end
+        if start >= end:
+            return ""
+        parts = []
+        for i in range(start, end - 1):
+            parts.append(self.words[i])
+            parts.append(self.breaks[i])
+        parts.append(self.words[end - 1])
+        return "".join(parts)
+
+    def shifted(self, dx: int, dy: int) -> "WordTable":
+        """Copy with boxes moved by (dx, dy), e.g. from a region crop into page coordinates."""
+        table = WordTable(**{name: list(getattr(self, name)) for name in COLUMNS})
+        table.bbox = [(x + dx, y + dy, w, h) for x, y, w, h in self.bbox]
+        return table
+
+    def uncertain(self, min_confidence: float) -> List[int]:
+        return [i for i, c in enumerate(self.confidence) if c < min_confidence]
+
+    def spans(self, min_confidence: float, context: int) -> List[Span]:
+        """
+        Runs of words below min_confidence, each with `context` words either
+        side. Runs whose context windows touch are merged into one span.
+        """
+        spans: List[List[int]] = []
+        for i in self.uncertain(min_confidence):
+            lo, hi = max(0, i - context), min(len(self.words), i + 1 + context)
+            if spans and lo <= spans[-1][3]:
+                spans[-1][1] = i + 1
+                spans[-1][3] = hi
+            else:
+                spans.append([i, i + 1, lo, hi])
+        return [tuple(span) for span in spans]
+
+    def splice(self, fixes: Sequence[Tuple[Span, str]]) -> str:
+        """
+        Page text with each span's uncertain words replaced by their
+        counterpart in the corrected window. Context words are aligned, not
+        replaced, so only the words that were in doubt change.
+        """
+        replacements: Dict[int, Tuple[int, str]] = {}
+        for (start, end, lo, hi), corrected in fixes:
+            replacement = _aligned_replacement(self.words[lo:hi], corrected.split(), start - lo, end - lo)
+            if replacement is not None:
+                a, b, words = replacement
+                replacements[lo + a] = (lo + b, " ".join(words))
+
+        parts = []
+        i = 0
+        while i < len(self.words):
+            if i in replacements:
+                end, words = replacements[i]
+                separator = self.breaks[end - 1] if end > i else ""
+                if words:
+                    parts.append(words)
+                    parts.append(separator)
+                elif "\n" in separator:
+                    parts.append("\n")
+                i = max(end, i + 1)
+                continue
+            parts.append(self.words[i])
+            parts.append(self.breaks[i])
+            i += 1
+        return "".join(parts).strip()
+
+
+def _vertices_box(vertices) -> Box:
+    xs = [int(getattr(v, "x", 0) or 0) for v in vertices] or [0]
+    ys = [int(getattr(v, "y", 0) or 0) for v in vertices] or [0]
+    return (min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+
+
+def _aligned_replacement(original: List[str], corrected: List[str], start: int,
+                         end: int) -> Optional[Tuple[int, int, List[str]]]:
+    """
+    (a, b, words): original[a:b] should become `words`. a..b covers start..end,
+    widened to the edges of any edit that straddles them, so a word is never
+    both kept and replaced. None when the correction bears little
+    resemblance to the original window.
+    """
+    matcher = SequenceMatcher(None, original, corrected, autojunk=False)
+    if matcher.ratio() < MIN_SPLICE_SIMILARITY:
+        return None
+    opcodes = matcher.get_opcodes()
+    a, b = start, end
+    widened = True
+    while widened:
+        widened = False
+        for tag, i1, i2, _, _ in opcodes:
+            touches = (i1 < b and a < i2) or (i1 == i2 and a <= i1 <= b)
+            if tag != "equal" and touches and (i1 < a or i2 > b):
+                a, b, widened = min(a, i1), max(b, i2), True
+    ja = next(j1 + (a - i1) if tag == "equal" else j1
+              for tag, i1, i2, j1, _ in opcodes if i1 <= a < i2 or i1 == a)
+    jb = next(j1 + (b - i1) if tag == "equal" else j2
+              for tag, i1, i2, j1, j2 in reversed(opcodes) if i1 < b <= i2 or i2 == b)
+    return a, b, corrected[ja:jb]
+
+
+def join_tables(tables: List[WordTable], separator: str = "\n\n") -> WordTable:
+    """One table for several regions; block, paragraph and line numbers are renumbered to stay unique."""
+    joined = WordTable()
+    for table in tables:
+        if not len(table):
+            continue
+        if len(joined):
+            joined.breaks[-1] = separator
+        offsets = {
+            name: (max(getattr(joined, name)) + 1 if len(joined) else 0)
+            for name in ("block", "paragraph", "line")
+        }
+        for name in COLUMNS:
+            values = getattr(table, name)
+            if name in offsets:
+                values = [v + offsets[name] for v in values]
+            getattr(joined, name).extend(values)
+    return joined
+
+
+def pack_ocr(text: str, words: Optional[WordTable]):
+    """OCR cache value: plain text, or text plus the word table when the engine gives one."""
+    return {"text": text, "words": words.to_dict()} if words is not None else text
+
+
+def unpack_ocr(value) -> Tuple[str, Optional[WordTable]]:
+    if isinstance(value, dict):
+        words = value.get("words")
+        return value["text"], WordTable.from_dict(words) if words is not None else None
+    return value, None
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+
+from app.metrics import LLM_TOKENS, span
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+# Concurrent generations allowed per model, e.g. "llama3.1=2,qwen2.5=1"
+OLLAMA_DEFAULT_CONCURRENCY = int(os.getenv("OLLAMA_CONCURRENCY", "2"))
+OLLAMA_MODEL_CONCURRENCY = os.getenv("OLLAMA_MODEL_CONCURRENCY", "")
+# How long a request waits for a free slot before it is rejected
+OLLAMA_QUEUE_TIMEOUT = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "300"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "16"))
+
+DEFAULT_OPTIONS = {
+    "temperature": 0.3,  # Lower for more deterministic corrections
+    "top_p": 0.9,
+    "num_predict": 2000
+}
+
+
+class OllamaOverloadedError(Exception):
+    """Raised when no generation slot frees up within the queue timeout."""
+
+
+def _parse_model_concurrency(spec: str) -> Dict[str, int]:
+    limits = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        model, limit = item.split("=", 1)
+        limits[model.strip()] = int(limit)
+    return limits
+
+
+class ModelLimiter:
+    def __init__(self, default_limit: int = OLLAMA_DEFAULT_CONCURRENCY,
+                 limits: Optional[Dict[str, int]] = None):
+        """Per-model concurrency limit shared by thread-pool and async callers."""
+        self.default_limit = default_limit
+        self.limits = limits or {}
+        self.waiting: Dict[str, int] = {}
+        self.active: Dict[str, int] = {}
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, model: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._semaphores.get(model)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.limits.get(model, self.default_limit))
+                self._semaphores[model] = sem
+            return sem
+
+    def _count(self, counter: Dict[str, int], model: str, delta: int):
+        with self._lock:
+            counter[model] = counter.get(model, 0) + delta
+
+    def acquire(self, model: str, timeout: float = OLLAMA_QUEUE_TIMEOUT):
+        self._count(self.waiting, model, 1)
+        try:
+            acquired = self._semaphore(model).acquire(timeout=timeout)
+        finally:
+            self._count(self.waiting, model, -1)
+        if not acquired:
+            raise OllamaOverloadedError(f"Ollama model '{model}' is busy, try again later")
+        self._count(self.active, model, 1)
+
+    async def acquire_async(self, model: str, timeout: float = OLLAMA_QUEUE_TIMEOUT,
+                            poll_interval: float = 0.05):
+        # Polling keeps cancellation safe: a cancelled waiter never holds a slot
+        sem = self._semaphore(model)
+        deadline = time.monotonic() + timeout
+        self._count(self.waiting, model, 1)
+        try:
+            while not sem.acquire(blocking=False):
+                if time.monotonic() >= deadline:
+                    raise OllamaOverloadedError(f"Ollama model '{model}' is busy, try again later")
+                await asyncio.sleep(poll_interval)
+        finally:
+            self._count(self.waiting, model, -1)
+        self._count(self.active, model, 1)
+
+    def release(self, model: str):
+        self._count(self.active, model, -1)
+        self._semaphore(model).release()
+
+    @contextmanager
+    def slot(self, model: str):
+        self.acquire(model)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    @asynccontextmanager
+    async def slot_async(self, model: str):
+        await self.acquire_async(model)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            models = sorted(set(self.active) | set(self.waiting) | set(self._semaphores))
+            return {
+                model: {
+                    "limit": self.limits.get(model, self.default_limit),
+                    "active": self.active.get(model, 0),
+                    "waiting": self.waiting.get(model, 0),
+                }
+                for model in models
+            }
+
+
+limiter = ModelLimiter(limits=_parse_model_concurrency(OLLAMA_MODEL_CONCURRENCY))
+
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_client_lock = threading.Lock()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=OLLAMA_MAX_CONNECTIONS,
+        max_keepalive_connections=OLLAMA_MAX_CONNECTIONS,
+    )
+
+
+def get_client() -> httpx.Client:
+    """Shared keep-alive client for calls made from worker threads."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(
+                base_url=OLLAMA_BASE_URL,
+                timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=5.0),
+                limits=_limits(),
+            )
+        return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Shared keep-alive client for streaming calls made on the event loop."""
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            base_url=OLLAMA_BASE_URL,
+            timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=5.0),
+            limits=_limits(),
+        )
+    return _async_client
+
+
+async def close_clients():
+    global _client, _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def _payload(prompt: str, model: str, stream: bool) -> Dict:
+    return {
+        "model": model,
+        "prompt": prompt,
+        "stream": stream,
+        "options": DEFAULT_OPTIONS,
+    }
+
+
+def _record_tokens(model: str, body: Dict):
+    """Token counts Ollama reports on the final response."""
+    if body.get("prompt_eval_count") is not None:
+        LLM_TOKENS.observe(body["prompt_eval_count"], model=model, kind="prompt")
+    if body.get("eval_count") is not None:
+        LLM_TOKENS.observe(body["eval_count"], model=model, kind="completion")
+
+
+def generate(prompt: str, model: str) -> str:
+    """Blocking generation through the pooled client, limited per model."""
+    with limiter.slot(model):
+        with span("llm.generate", model=model):
+            response = get_client().post("/api/generate", json=_payload(prompt, model, stream=False))
+            response.raise_for_status()
+            body = response.json()
+        _record_tokens(model, body)
+        return body.get("response", "")
+
+
+async def generate_stream(prompt: str, model: str) -> AsyncIterator[str]:
+    """
+    Yield response tokens as Ollama produces them.
+    The caller must already hold a slot for the model (see limiter.acquire_async).
+    """
+    client = get_async_client()
+    with span("llm.generate_stream", model=model):
+        async with client.stream("POST", "/api/generate", json=_payload(prompt, model, stream=True)) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise httpx.HTTPError(chunk["error"])
+                token = chunk.get("response", "")
+                if token:
+                    yield token
+                if chunk.get("done"):
+                    _record_tokens(model, chunk)
+                    break
@@ -0,0 +1,390 @@
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from app.cache import MISS, hash_file, lookup_cached, make_key, store_cached
+from app.jobs import STAGE_WORKERS, Job, run_in_stage_pool, run_stage
+from app.job_queue import is_queued, queue_task
+from app.ingest import PDF_RASTER_DPI, count_pages, is_multipage, preprocess_page_to_file
+from app.preprocess import DEFAULT_TIER, PREPROCESS_VERSION, preprocess_params, preprocess_to_file
+from app.layout import OCR_LAYOUT, analyze_layout, layout_params
+from app.ocr_ai_processor import extract_layout_texts, extract_text_with_words, correct_text_with_ollama, layout_ocr_result
+from app.ocr_backends import get_ocr_backend
+from app.ocr_words import WordTable, pack_ocr, unpack_ocr
+from app.langdetect import correction_language, detect_language
+from app.lemma_index import get_lemma_index
+from app.document_store import save_result
+from app.storage import derived_path, file_url
+from app.textProcessor import analyze_text
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_STAGES = ["preprocess", "layout", "ocr", "correct", "analyze"]
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+# Pages of one document processed at the same time
+PAGE_CONCURRENCY = int(os.getenv("PAGE_CONCURRENCY", str(STAGE_WORKERS["preprocess"])))
+
+LANGUAGE_MAP = {
+    "latin": "lat",
+    "lat": "lat",
+    "ancient greek": "grc",
+    "greek": "grc",
+    "grc": "grc",
+    "old english": "ang",
+    "old_english": "ang",
+    "english": "ang",
+    "ang": "ang",
+    "sanskrit": "san",
+    "san": "san",
+}
+
+def normalize_language(lang: str) -> str:
+    lang = lang.strip().lower()
+    return LANGUAGE_MAP.get(lang, "lat")
+
+def upload_ocr_key(source_hash: str, is_image: bool, preprocess_tier: str,
+                   ocr_backend: Optional[str] = None, language: Optional[str] = None) -> str:
+    """Cache key for the OCR text of an uploaded file (preprocessing included)."""
+    engine = get_ocr_backend(ocr_backend).cache_name(language)
+    if not is_image:
+        return make_key("page-ocr", source_hash, None, engine)
+    return make_key("page-ocr", source_hash, preprocess_params(preprocess_tier), engine, layout_params())
+
+def unpack_page_ocr(value) -> Tuple[str, Optional[List[Dict]], Optional[WordTable]]:
+    """(text, regions, words) from a page-ocr cache value; plain text when the page was OCR'd whole."""
+    text, words = unpack_ocr(value)
+    regions = value.get("regions") if isinstance(value, dict) else None
+    return text, regions, words
+
+def pack_page_ocr(text: str, regions: Optional[List[Dict]], words: Optional[WordTable] = None):
+    value = pack_ocr(text, words)
+    if regions is None:
+        return value
+    if not isinstance(value, dict):
+        value = {"text": text}
+    value["regions"] = regions
+    return value
+
+def words_dict(words: Optional[WordTable]) -> Optional[Dict]:
+    """Word table for API results, so clients can highlight uncertain words."""
+    return words.to_dict() if words is not None else None
+
+async def ocr_page(job: Job, image_path: str, use_layout: bool, ocr_backend: Optional[str] = None,
+                   language: Optional[str] = None
+                   ) -> Tuple[str, Optional[WordTable], str, Optional[List[Dict]], bool]:
+    """
+    Layout and OCR stages for one image. With layout on, only the detected
+    text regions are cropped and OCR'd. Returns (text, words, engine,
+    regions, complete), where complete is False if some regions failed.
+    """
+    if is_queued("ocr"):
+        return await _queued_ocr_page(job, image_path, use_layout, ocr_backend, language)
+    if not use_layout:
+        job.set_stage("layout", "skipped")
+        text, words, engine = await run_stage(job, "ocr", extract_text_with_words, image_path, ocr_backend, language)
+        return text, words, engine, None, True
+    layout = await run_stage(job, "layout", analyze_layout, image_path)
+    job.set_stage_detail("layout", "stats", layout.stats())
+    await run_stage(job, "ocr", extract_layout_texts, [layout], ocr_backend, language)
+    (text, error, words), engine = layout_ocr_result(layout, ocr_backend)
+    if text is None:
+        raise RuntimeError(error)
+    if error:
+        job.set_stage_detail("ocr", "region_errors", sum(1 for r in layout.regions if r.error))
+    return text, words, engine, [r.to_dict() for r in layout.regions], error is None
+
+@queue_task
+def ocr_image(image_path: str, use_layout: bool, ocr_backend: Optional[str] = None,
+              language: Optional[str] = None) -> Dict:
+    """
+    Layout and OCR of one image in a single call, for stage workers: the
+    layout and its region crops never leave the worker process.
+    """
+    if not use_layout:
+        text, words, engine = extract_text_with_words(image_path, ocr_backend, language)
+        return {"text": text, "words": words_dict(words), "engine": engine, "regions": None, "complete": True}
+    start = time.perf_counter()
+    layout = analyze_layout(image_path)
+    layout_seconds = time.perf_counter() - start
+    extract_layout_texts([layout], ocr_backend, language)
+    (text, error, words), engine = layout_ocr_result(layout, ocr_backend)
+    if text is None:
+        raise RuntimeError(error)
+    return {
+        "text": text,
+        "words": words_dict(words),
+        "engine": engine,
+        "regions": [r.to_dict() for r in layout.regions],
+        "complete": error is None,
+        "layout_seconds": layout_seconds,
+        "layout_stats": layout.stats(),
+        "region_errors": sum(1 for r in layout.regions if r.error),
+    }
+
+async def _queued_ocr_page(job: Job, image_path: str, use_layout: bool, ocr_backend: Optional[str],
+                           language: Optional[str]) -> Tuple[str, Optional[WordTable], str, Optional[List[Dict]], bool]:
+    """ocr_page through the job queue; the layout stage runs inside the OCR task."""
+    result = await run_stage(job, "ocr", ocr_image, image_path, use_layout, ocr_backend, language)
+    if use_layout:
+        job.set_stage("layout", "done", result["layout_seconds"])
+        job.set_stage_detail("layout", "stats", result["layout_stats"])
+        if result["region_errors"]:
+            job.set_stage_detail("ocr", "region_errors", result["region_errors"])
+    else:
+        job.set_stage("layout", "skipped")
+    words = WordTable.from_dict(result["words"]) if result["words"] is not None else None
+    return result["text"], words, result["engine"], result["regions"], result["complete"]
+
+def preprocessed_name(preprocess_tier: str, page: Optional[int] = None) -> str:
+    """File name of a preprocessed artifact inside the original's derived directory."""
+    prefix = f"page{page:04d}-{PDF_RASTER_DPI}dpi-" if page is not None else ""
+    return f"{prefix}preprocessed-{preprocess_tier}-v{PREPROCESS_VERSION}.png"
+
+def is_primary_engine(ocr_backend: Optional[str], engine: str) -> bool:
+    """False when a fallback engine produced the text; such text is not page-cached."""
+    return engine == get_ocr_backend(ocr_backend).name
+
+async def correct_and_analyze(job: Job, raw_text: str, language: str, doc_id: Optional[str] = None,
+                              doc_name: Optional[str] = None,
+                              words: Optional[WordTable] = None) -> Tuple[str, str, Optional[List[Dict]]]:
+    """
+    Run the correction and analysis stages; returns (language, corrected, analysis).
+    With the OCR word table only low-confidence spans are re-corrected.
+    With a doc_id the analysis is also added to the corpus lemma index.
+    """
+    # Auto-detect on the OCR text so the right correction prompt and model are used
+    if not language or language == "auto":
+        detection = detect_language(raw_text)
+        job.set_stage_detail("correct", "detected_language", detection.to_dict())
+        language = detection.language
+
+    # Correct text with Ollama (clean up OCR errors)
+    corrected_text = await run_stage(
+        job, "correct", correct_text_with_ollama, raw_text, correction_language(language), words
+    )
+
+    # Analyze corrected text with CLTK for lemmas/POS
+    language = normalize_language(language)
+    try:
+        text_analysis = await run_stage(job, "analyze", analyze_text, corrected_text, language)
+    except Exception as e:
+        logger.warning(f"Text analysis failed for {language}: {e}")
+        text_analysis = None
+
+    if doc_id and text_analysis:
+        try:
+            await run_in_stage_pool("index", get_lemma_index().add_document, doc_id, text_analysis, doc_name, language)
+        except Exception as e:
+            logger.warning(f"Lemma indexing failed for {doc_id}: {e}")
+    return language, corrected_text, text_analysis
+
+async def run_upload_pipeline(job: Job, file_path: Path, language: str,
+                              preprocess_tier: str = DEFAULT_TIER,
+                              ocr_backend: Optional[str] = None, source_hash: Optional[str] = None) -> Dict:
+    """
+    Preprocess, OCR, correct and analyze one uploaded file.
+    Every blocking stage runs on its own bounded pool (see app.jobs).
+    Derived images are stored by the original's content hash (app.storage),
+    so concurrent uploads never share an output path.
+    """
+    if source_hash is None:
+        source_hash = await run_in_stage_pool("preprocess", hash_file, str(file_path))
+    if is_multipage(str(file_path)):
+        result = await _run_document_pipeline(job, file_path, language, preprocess_tier, ocr_backend, source_hash)
+        return await store_document(job.id, source_hash, result, preprocess_tier, ocr_backend)
+
+    filename = file_path.name
+
+    ext = file_path.suffix.lower()
+    is_image = ext in IMAGE_EXTENSIONS
+    preprocessed_path = str(derived_path(source_hash, preprocessed_name(preprocess_tier))) if is_image else None
+
+    # A repeat upload of the same bytes skips both preprocessing and OCR
+    ocr_key = upload_ocr_key(source_hash, is_image, preprocess_tier, ocr_backend, language)
+    cached = await run_in_stage_pool("storage", lookup_cached, "page-ocr", ocr_key)
+
+    if cached is not MISS:
+        raw_text, regions, words = unpack_page_ocr(cached)
+        job.set_stage("preprocess", "cached")
+        job.set_stage("layout", "cached")
+        job.set_stage("ocr", "cached")
+    else:
+        # Preprocess images (reusing the output of an earlier upload of the same bytes)
+        if is_image and os.path.exists(preprocessed_path):
+            job.set_stage("preprocess", "cached")
+        elif is_image:
+            _, substeps = await run_stage(
+                job, "preprocess", preprocess_to_file, str(file_path), preprocess_tier, preprocessed_path
+            )
+            job.set_stage_detail("preprocess", "substeps", substeps)
+        else:
+            job.set_stage("preprocess", "skipped")
+
+        # Extract text (Google Vision unless another OCR backend is chosen)
+        raw_text, words, engine, regions, complete = await ocr_page(
+            job, preprocessed_path or str(file_path), is_image and OCR_LAYOUT, ocr_backend, language
+        )
+        job.set_stage_detail("ocr", "engine", engine)
+        if complete and is_primary_engine(ocr_backend, engine):
+            await run_in_stage_pool(
+                "storage", store_cached, "page-ocr", ocr_key, pack_page_ocr(raw_text, regions, words)
+            )
+
+    language, corrected_text, text_analysis = await correct_and_analyze(
+        job, raw_text, language, doc_id=source_hash, doc_name=filename, words=words
+    )
+
+    result = {
+        "success": True,
+        "language": language,
+        "original_filename": filename,
+        "file_url": file_url(file_path),
+        "preprocessed_file": file_url(preprocessed_path) if is_image and os.path.exists(preprocessed_path) else None,
+        "raw_ocr_text": raw_text,
+        "regions": regions,
+        "ocr_words": words_dict(words),
+        "accurate_text": corrected_text,
+        "text_analysis": text_analysis,
+        "detected_language": language,
+        "message": "OCR and linguistic analysis complete"
+    }
+    return await store_document(job.id, source_hash, result, preprocess_tier, ocr_backend)
+
+async def store_document(document_id: str, source_hash: str, result: Dict,
+                         preprocess_tier: str = DEFAULT_TIER, ocr_backend: Optional[str] = None) -> Dict:
+    """Save a result in the document store (app.document_store); adds its document_id."""
+    result["document_id"] = await run_in_stage_pool(
+        "storage", save_result, document_id, source_hash, result,
+        preprocess_tier=preprocess_tier, ocr_backend=ocr_backend
+    )
+    return result
+
+async def process_page(file_path: Path, source_hash: str, index: int, language: str,
+                       preprocess_tier: str = DEFAULT_TIER, ocr_backend: Optional[str] = None) -> Dict:
+    """Rasterize, preprocess, OCR, correct and analyze a single page of a document."""
+    page_job = Job(PIPELINE_STAGES, {"page": index + 1})
+    try:
+        ocr_key = make_key(
+            "page-ocr", source_hash, index, PDF_RASTER_DPI, preprocess_params(preprocess_tier),
+            get_ocr_backend(ocr_backend).cache_name(language), layout_params()
+        )
+        cached = await run_in_stage_pool("storage", lookup_cached, "page-ocr", ocr_key)
+        output_path = str(derived_path(source_hash, preprocessed_name(preprocess_tier, index + 1)))
+
+        if cached is not MISS:
+            raw_text, regions, words = unpack_page_ocr(cached)
+            page_job.set_stage("preprocess", "cached")
+            page_job.set_stage("layout", "cached")
+            page_job.set_stage("ocr", "cached")
+        else:
+            if os.path.exists(output_path):
+                page_job.set_stage("preprocess", "cached")
+            else:
+                _, substeps = await run_stage(
+                    page_job, "preprocess", preprocess_page_to_file,
+                    str(file_path), index, output_path, preprocess_tier
+                )
+                page_job.set_stage_detail("preprocess", "substeps", substeps)
+            raw_text, words, engine, regions, complete = await ocr_page(
+                page_job, output_path, OCR_LAYOUT, ocr_backend, language
+            )
+            page_job.set_stage_detail("ocr", "engine", engine)
+            if complete and is_primary_engine(ocr_backend, engine):
+                await run_in_stage_pool(
+                    "storage", store_cached, "page-ocr", ocr_key, pack_page_ocr(raw_text, regions, words)
+                )
+
+        page_language, corrected_text, text_analysis = await correct_and_analyze(
+            page_job, raw_text, language,
+            doc_id=f"{source_hash}:{index + 1}", doc_name=f"{file_path.name} p.{index + 1}", words=words
+        )
+        return {
+            "page": index + 1,
+            "success": True,
+            "language": page_language,
+            "preprocessed_file": file_url(output_path) if os.path.exists(output_path) else None,
+            "raw_ocr_text": raw_text,
+            "regions": regions,
+            "ocr_words": words_dict(words),
+            "accurate_text": corrected_text,
+            "text_analysis": text_analysis,
+            "stages": page_job.to_dict(include_result=False)["stages"],
+        }
+    except Exception as e:
+        logger.exception(f"Page {index + 1} of {file_path} failed")
+        return {"page": index + 1, "success": False, "error": str(e)}
+
+async def iter_document_pages(file_path: Path, language: str, preprocess_tier: str = DEFAULT_TIER,
+                              ocr_backend: Optional[str] = None,
+                              concurrency: int = PAGE_CONCURRENCY,
+                              source_hash: Optional[str] = None) -> AsyncIterator[Dict]:
+    """
+    Yield per-page results as pages finish. At most `concurrency` pages are
+    in flight, so memory stays flat however long the document is.
+    """
+    if source_hash is None:
+        source_hash = await run_in_stage_pool("preprocess", hash_file, str(file_path))
+    page_count = await run_in_stage_pool("preprocess", count_pages, str(file_path))
+    yield {"page_count": page_count, "original_filename": file_path.name}
+
+    pending = set()
+    next_index = 0
+    try:
+        while next_index < page_count or pending:
+            while next_index < page_count and len(pending) < concurrency:
+                pending.add(asyncio.create_task(
+                    process_page(file_path, source_hash, next_index, language, preprocess_tier, ocr_backend)
+                ))
+                next_index += 1
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        # Client went away or the consumer stopped early
+        for task in pending:
+            task.cancel()
+
+async def _run_document_pipeline(job: Job, file_path: Path, language: str, preprocess_tier: str,
+                                 ocr_backend: Optional[str] = None, source_hash: Optional[str] = None) -> Dict:
+    """Process every page of a PDF/TIFF and combine them into one upload result."""
+    pages: List[Dict] = []
+    page_count = 0
+    job.set_stage("pages", "running")
+    async for item in iter_document_pages(
+        file_path, language, preprocess_tier, ocr_backend, source_hash=source_hash
+    ):
+        if "page" not in item:
+            page_count = item["page_count"]
+            job.set_stage_detail("pages", "total", page_count)
+            continue
+        pages.append(item)
+        job.set_stage_detail("pages", "completed", len(pages))
+    job.set_stage("pages", "done")
+
+    pages.sort(key=lambda p: p["page"])
+    ok_pages = [p for p in pages if p["success"]]
+    for stage in PIPELINE_STAGES:
+        seconds = sum((p["stages"][stage]["seconds"] or 0) for p in ok_pages)
+        job.set_stage(stage, "done", seconds)
+
+    language = ok_pages[0]["language"] if ok_pages else normalize_language(language or "lat")
+    text_analysis = [
+        {**entry, "page": p["page"]}
+        for p in ok_pages for entry in (p["text_analysis"] or [])
+    ]
+    return {
+        "success": bool(ok_pages),
+        "language": language,
+        "original_filename": file_path.name,
+        "file_url": file_url(file_path),
+        "preprocessed_file": None,
+        "page_count": page_count,
+        "pages": pages,
+        "raw_ocr_text": "\n\n".join(p["raw_ocr_text"] for p in ok_pages),
+        "accurate_text": "\n\n".join(p["accurate_text"] for p in ok_pages),
+        "text_analysis": text_analysis,
+        "detected_language": language,
+        "message": f"OCR and linguistic analysis complete for {len(ok_pages)} of {page_count} pages"
+    }
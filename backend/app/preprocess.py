@@ -1,62 +1,275 @@
-import cv2
-import numpy as np
+import logging
 import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from app.job_queue import queue_task
+from app.lazy import lazy_import
+from app.metrics import observe_span, size_class
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+# Fixed parameters of the preprocessing chain
+CLAHE_CLIP_LIMIT = 3.0
+CLAHE_TILE_GRID = (8, 8)
+THRESHOLD_BLOCK_SIZE = 35
+THRESHOLD_C = 15
+SHADOW_DILATE_KERNEL = 7
+SHADOW_BLUR_KERNEL = 21
+# OpenCV interpolation flags (cv2.INTER_*), spelled out so the tier table
+# below can be built without loading OpenCV
+INTER_LINEAR = 1
+INTER_CUBIC = 2
+INTER_AREA = 3
+
+# Quality tiers. "fast" and "balanced" cap the working resolution (OCR gains
+# little beyond a few thousand pixels per side), estimate the
+# shadow background and the skew angle on small copies, and use cheaper
+# denoising. "archival" keeps full resolution and full non-local means.
+PREPROCESS_TIERS = {
+    "fast": {
+        "max_side": 2500,
+        "shadow_scale": 0.25,
+        "denoise": "median",
+        "denoise_h": 20,
+        "nlm_search_window": 0,
+        "skew_max_side": 800,
+        "skew_fine_step": 0.1,
+        "interpolation": INTER_LINEAR,
+    },
+    "balanced": {
+        "max_side": 3500,
+        "shadow_scale": 0.25,
+        "denoise": "nlm",
+        "denoise_h": 20,
+        "nlm_search_window": 11,
+        "skew_max_side": 1000,
+        "skew_fine_step": 0.1,
+        "interpolation": INTER_LINEAR,
+    },
+    "archival": {
+        "max_side": None,
+        "shadow_scale": 1.0,
+        "denoise": "nlm",
+        "denoise_h": 20,
+        "nlm_search_window": 21,
+        "skew_max_side": 2000,
+        "skew_fine_step": 0.05,
+        "interpolation": INTER_CUBIC,
+    },
+}
+
+def _normalize_tier(tier: str) -> str:
+    normalized = tier.strip().lower()
+    if normalized not in PREPROCESS_TIERS:
+        raise ValueError(f"Unknown preprocessing tier: {tier} (one of {', '.join(PREPROCESS_TIERS)})")
+    return normalized
+
+# Checked at import so a typo in PREPROCESS_TIER fails at startup, not per upload
+DEFAULT_TIER = _normalize_tier(os.getenv("PREPROCESS_TIER", "balanced"))
+
+# Skew search range and coarse step (degrees) for the projection profile
+SKEW_ANGLE_RANGE = 10.0
+SKEW_COARSE_STEP = 1.0
+# Rotations smaller than this are not worth a full-resolution warp
+SKEW_MIN_ANGLE = 0.05
+
+PREPROCESS_VERSION = 2
+
+def preprocess_params(tier: str = DEFAULT_TIER) -> Dict:
+    """
+    Everything that affects the preprocessed output for a tier; part of the
+    OCR cache key so a change here never serves text recognized from
+    differently processed images.
+    """
+    return {
+        "version": PREPROCESS_VERSION,
+        "tier": resolve_tier(tier),
+        **PREPROCESS_TIERS[resolve_tier(tier)],
+        "clahe_clip_limit": CLAHE_CLIP_LIMIT,
+        "clahe_tile_grid": CLAHE_TILE_GRID,
+        "threshold_block_size": THRESHOLD_BLOCK_SIZE,
+        "threshold_c": THRESHOLD_C,
+        "shadow_dilate_kernel": SHADOW_DILATE_KERNEL,
+        "shadow_blur_kernel": SHADOW_BLUR_KERNEL,
+    }
+
+def resolve_tier(tier: Optional[str]) -> str:
+    """The canonical (lowercase) tier name, DEFAULT_TIER when none is given."""
+    if not tier:
+        return DEFAULT_TIER
+    return _normalize_tier(tier)
+
+def _odd(n: float) -> int:
+    n = max(3, int(round(n)))
+    return n if n % 2 else n + 1
+
+def _scale_to(img, max_side: Optional[int], interpolation=INTER_AREA):
+    """Downscale so the longest side is at most max_side; returns (img, scale)."""
+    h, w = img.shape[:2]
+    if not max_side or max(h, w) <= max_side:
+        return img, 1.0
+    scale = max_side / max(h, w)
+    return cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=interpolation), scale
 
 def load_image(path):
     if not os.path.exists(path):
         raise FileNotFoundError(f"Image not found: {path}")
-    img = cv2.imread(path)
+    # Decode straight to grayscale; no 3-channel buffer at full resolution
+    img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
     if img is None:
         raise ValueError(f"Unable to read image: {path}")
-    print(f" Loaded image: {path}")
+    logger.debug(f"Loaded image: {path}")
     return img
 
 def to_gray(img):
+    if img.ndim == 2:
+        return img
     return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
-def denoise(img):
-    return cv2.fastNlMeansDenoising(img, h=20)
+def denoise(img, method: str = "nlm", h: int = 20, search_window: int = 21):
+    if method == "median":
+        return cv2.medianBlur(img, 3)
+    return cv2.fastNlMeansDenoising(img, h=h, templateWindowSize=7, searchWindowSize=search_window)
 
 def enhance_contrast(img):
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+    clahe = cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID)
     return clahe.apply(img)
 
-def deskew(image):
-    coords = np.column_stack(np.where(image > 0))
-    if len(coords) == 0:
+def estimate_skew(image, max_side: int = 1000, angle_range: float = SKEW_ANGLE_RANGE,
+                  coarse_step: float = SKEW_COARSE_STEP, fine_step: float = 0.1) -> float:
+    """
+    Estimate the rotation (degrees) that makes text lines horizontal, using a
+    projection profile on a downscaled copy: text rows are sharpest, so the
+    variance of the row sums peaks, at the right angle.
+    """
+    small, _ = _scale_to(image, max_side)
+    _, ink = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    h, w = ink.shape
+    center = (w / 2, h / 2)
+
+    def score(angle: float) -> float:
+        M = cv2.getRotationMatrix2D(center, angle, 1.0)
+        rotated = cv2.warpAffine(ink, M, (w, h), flags=cv2.INTER_NEAREST, borderValue=0)
+        profile = cv2.reduce(rotated, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S)
+        return float(np.var(profile))
+
+    coarse = np.arange(-angle_range, angle_range + coarse_step / 2, coarse_step)
+    best = max(coarse, key=score)
+    fine = np.arange(best - coarse_step, best + coarse_step + fine_step / 2, fine_step)
+    return float(max(fine, key=score))
+
+def deskew(image, angle: Optional[float] = None, interpolation=INTER_CUBIC, **skew_kwargs):
+    if angle is None:
+        angle = estimate_skew(image, **skew_kwargs)
+    if abs(angle) < SKEW_MIN_ANGLE:
         return image
-    angle = cv2.minAreaRect(coords)[-1]
-    if angle < -45:
-        angle = -(90 + angle)
-    else:
-        angle = -angle
     (h, w) = image.shape[:2]
     center = (w // 2, h // 2)
     M = cv2.getRotationMatrix2D(center, angle, 1.0)
-    return cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+    return cv2.warpAffine(image, M, (w, h), flags=interpolation, borderMode=cv2.BORDER_REPLICATE)
 
 def adaptive_binarize(img):
     return cv2.adaptiveThreshold(
         img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-        cv2.THRESH_BINARY, 35, 15
+        cv2.THRESH_BINARY, THRESHOLD_BLOCK_SIZE, THRESHOLD_C
     )
 
-def remove_shadows(img):
-    dilated_img = cv2.dilate(img, np.ones((7, 7), np.uint8))
-    bg_img = cv2.medianBlur(dilated_img, 21)
-    diff_img = 255 - cv2.absdiff(img, bg_img)
-    norm_img = cv2.normalize(diff_img, None, 0, 255, cv2.NORM_MINMAX)
-    return norm_img
+def remove_shadows(img, bg_scale: float = 1.0):
+    """
+    Flatten uneven illumination by subtracting a blurred background estimate.
+    With bg_scale < 1 the background is estimated on a small copy and scaled
+    back up, which is much cheaper and visually identical (it is smooth).
+    """
+    h, w = img.shape[:2]
+    if bg_scale < 1.0:
+        small = cv2.resize(img, (max(1, int(w * bg_scale)), max(1, int(h * bg_scale))), interpolation=cv2.INTER_AREA)
+        dilate_k = _odd(SHADOW_DILATE_KERNEL * bg_scale)
+        blur_k = _odd(SHADOW_BLUR_KERNEL * bg_scale)
+    else:
+        small = img
+        dilate_k, blur_k = SHADOW_DILATE_KERNEL, SHADOW_BLUR_KERNEL
+
+    bg_img = cv2.dilate(small, np.ones((dilate_k, dilate_k), np.uint8))
+    bg_img = cv2.medianBlur(bg_img, blur_k, dst=bg_img)
+    if bg_scale < 1.0:
+        bg_img = cv2.resize(bg_img, (w, h), interpolation=cv2.INTER_LINEAR)
+
+    # 255 - |img - bg|, then stretch to the full range, all in the bg buffer
+    cv2.absdiff(img, bg_img, dst=bg_img)
+    cv2.bitwise_not(bg_img, dst=bg_img)
+    return cv2.normalize(bg_img, bg_img, 0, 255, cv2.NORM_MINMAX)
+
+def preprocess_array(img, tier: str = DEFAULT_TIER, timings: Optional[Dict[str, float]] = None):
+    """
+    Run the preprocessing chain on a decoded image and return the binarized
+    page. Per-step timings (seconds) are written into `timings` if given.
+    """
+    tier = resolve_tier(tier)
+    params = PREPROCESS_TIERS[tier]
+    timings = timings if timings is not None else {}
+    image_size = size_class(img.shape[1], img.shape[0])
+    start = time.perf_counter()
+
+    def mark(step: str):
+        nonlocal start
+        now = time.perf_counter()
+        timings[step] = round(now - start, 4)
+        # The tier is what varies per "model" for preprocessing spans
+        observe_span(f"preprocess.{step}", now - start, model=tier, image_size=image_size)
+        start = now
 
-def preprocess_image(path):
-    img = load_image(path)
     gray = to_gray(img)
-    no_shadow = remove_shadows(gray)
-    denoised = denoise(no_shadow)
+    gray, _ = _scale_to(gray, params["max_side"])
+    mark("resize")
+    no_shadow = remove_shadows(gray, params["shadow_scale"])
+    mark("remove_shadows")
+    denoised = denoise(no_shadow, params["denoise"], params["denoise_h"], params["nlm_search_window"])
+    mark("denoise")
     enhanced = enhance_contrast(denoised)
-    deskewed = deskew(enhanced)
+    mark("enhance_contrast")
+    angle = estimate_skew(enhanced, max_side=params["skew_max_side"], fine_step=params["skew_fine_step"])
+    deskewed = deskew(enhanced, angle, interpolation=params["interpolation"])
+    mark("deskew")
     binary = adaptive_binarize(deskewed)
-    output_path = os.path.join(os.path.dirname(path), "preprocessed_clean.png")
-    cv2.imwrite(output_path, binary)
-    print(f" Saved preprocessed image at: {output_path}")
-    return output_path
\ No newline at end of file
+    mark("binarize")
+    return binary
+
+def write_image(output_path: str, img):
+    """
+    Write via a temporary file and rename, so a concurrent reader of the
+    same derived path never sees a half-written image.
+    """
+    root, ext = os.path.splitext(output_path)
+    tmp_path = f"{root}.{os.getpid()}-{threading.get_ident()}.tmp{ext}"
+    if not cv2.imwrite(tmp_path, img):
+        raise ValueError(f"Unable to write image: {output_path}")
+    os.replace(tmp_path, output_path)
+    return output_path
+
+def preprocess_image(path, tier: str = DEFAULT_TIER, timings: Optional[Dict[str, float]] = None,
+                     output_path: Optional[str] = None):
+    start = time.perf_counter()
+    img = load_image(path)
+    if timings is not None:
+        timings["load"] = round(time.perf_counter() - start, 4)
+    binary = preprocess_array(img, tier, timings)
+    if output_path is None:
+        # Next to the input, which lives in its job's directory; never a shared path
+        root, _ = os.path.splitext(path)
+        output_path = f"{root}.preprocessed-{resolve_tier(tier)}.png"
+    start = time.perf_counter()
+    write_image(output_path, binary)
+    if timings is not None:
+        timings["save"] = round(time.perf_counter() - start, 4)
+    logger.debug(f"Saved preprocessed image at: {output_path}")
+    return output_path
+
+@queue_task
+def preprocess_to_file(path: str, tier: str, output_path: str) -> Tuple[str, Dict[str, float]]:
+    """preprocess_image returning its sub-step timings, so it can run in a stage worker."""
+    timings: Dict[str, float] = {}
+    return preprocess_image(path, tier, timings, output_path), timings
@@ -0,0 +1,90 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+# The profiler endpoints refuse to start unless this is set
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") not in ("0", "false", "False")
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "10"))
+# A forgotten profiler stops itself after this long
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "300"))
+
+
+class SamplingProfiler:
+    def __init__(self):
+        """
+        Wall-clock sampling profiler: a background thread records every other
+        thread's stack at a fixed interval. Output is in the collapsed
+        ("folded") format that flamegraph.pl and speedscope read.
+        """
+        self._stacks: Counter = Counter()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.samples = 0
+        self.interval = PROFILER_INTERVAL_MS / 1000
+        self.started_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: float = PROFILER_INTERVAL_MS, max_seconds: float = PROFILER_MAX_SECONDS) -> bool:
+        with self._lock:
+            if self.running:
+                return False
+            self._stacks.clear()
+            self.samples = 0
+            self.interval = max(interval_ms, 1.0) / 1000
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(max_seconds,), name="sampling-profiler", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def stop(self) -> str:
+        """Stop sampling and return the folded stacks."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+        return self.folded()
+
+    def _run(self, max_seconds: float):
+        own = threading.get_ident()
+        names = {}
+        deadline = time.monotonic() + max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self._stacks.most_common())
+
+    def status(self) -> Dict:
+        return {
+            "enabled": PROFILER_ENABLED,
+            "running": self.running,
+            "interval_ms": round(self.interval * 1000, 3),
+            "samples": self.samples,
+            "started_at": self.started_at,
+            "distinct_stacks": len(self._stacks),
+        }
+
+
+profiler = SamplingProfiler()
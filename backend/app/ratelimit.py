@@ -0,0 +1,35 @@
+import threading
+import time
+
+
+class RateLimiter:
+    def __init__(self, rate_per_minute: float, burst: float = None):
+        """
+        Thread-safe token bucket. Callers block in acquire() until enough
+        tokens are available, so a remote API quota is never exceeded.
+        A rate of 0 disables limiting.
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1.0, rate_per_minute / 60.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens: float = 1.0):
+        if self.rate <= 0:
+            return
+        # Requests larger than the bucket wait for a full bucket and go negative
+        needed = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= needed:
+                    self.tokens -= tokens
+                    return
+                wait = (needed - self.tokens) / self.rate
+            time.sleep(wait)
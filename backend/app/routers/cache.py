@@ -0,0 +1,9 @@
+from fastapi import APIRouter
+from app.cache import get_result_cache
+
+router = APIRouter(tags=["Cache"])
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters per stage plus size of the result cache."""
+    return get_result_cache().stats()
@@ -0,0 +1,66 @@
+from typing import Optional
+from fastapi import APIRouter, Query
+from fastapi.responses import JSONResponse
+from app.jobs import run_in_stage_pool
+from app.lemma_index import get_lemma_index
+
+router = APIRouter(tags=["Corpus"])
+
+def _field_and_term(lemma: Optional[str], form: Optional[str]):
+    if bool(lemma) == bool(form):
+        return None
+    return ("lemma", lemma) if lemma else ("form", form)
+
+@router.get("/corpus/search")
+async def search_corpus(
+    lemma: Optional[str] = None,
+    form: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    """Every occurrence of a lemma (all inflected forms) or of one surface form."""
+    query = _field_and_term(lemma, form)
+    if query is None:
+        return JSONResponse(status_code=400, content={"error": "Pass exactly one of lemma or form"})
+    field, term = query
+    result = await run_in_stage_pool("index-read", get_lemma_index().search, field, term, limit, offset)
+    return {field: term, **result}
+
+@router.get("/corpus/concordance")
+async def concordance(
+    lemma: Optional[str] = None,
+    form: Optional[str] = None,
+    width: int = Query(5, ge=1, le=50),
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    """Keyword-in-context lines: `width` words either side of each hit."""
+    query = _field_and_term(lemma, form)
+    if query is None:
+        return JSONResponse(status_code=400, content={"error": "Pass exactly one of lemma or form"})
+    field, term = query
+    result = await run_in_stage_pool("index-read", get_lemma_index().search, field, term, limit, offset, width)
+    return {field: term, "width": width, **result}
+
+@router.get("/corpus/frequency")
+async def frequency(
+    lemma: Optional[str] = None,
+    form: Optional[str] = None,
+    field: str = Query("lemma", pattern="^(lemma|form)$"),
+    top: int = Query(50, ge=1, le=1000),
+):
+    """
+    Per-document counts for one lemma or form; without either, the `top`
+    most frequent lemmas (or forms, with field=form) across the corpus.
+    """
+    if lemma and form:
+        return JSONResponse(status_code=400, content={"error": "Pass at most one of lemma or form"})
+    index = get_lemma_index()
+    if lemma or form:
+        return await run_in_stage_pool("index-read", index.frequency, "lemma" if lemma else "form", lemma or form)
+    return await run_in_stage_pool("index-read", index.frequency, field, None, top)
+
+@router.get("/corpus/stats")
+async def corpus_stats():
+    """Size of the lemma index."""
+    return await run_in_stage_pool("index-read", get_lemma_index().stats)
@@ -0,0 +1,86 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel
+import httpx
+import logging
+from app.cache import MISS, lookup_cached, store_cached
+from app.jobs import run_in_stage_pool
+from app.cleanup import apply_rules
+from app.metrics import CORRECTION_GATE
+from app.ocr_ai_processor import (
+    CORRECTION_MODELS, CORRECTION_SKIP_QUALITY, build_correction_prompt, clean_llm_response,
+    correction_cache_key
+)
+from app.ollama_client import OllamaOverloadedError, generate_stream, limiter
+
+router = APIRouter(tags=["Correction"])
+logger = logging.getLogger(__name__)
+
+class CorrectionRequest(BaseModel):
+    text: str
+    language: str = "latin"
+
+@router.post("/correct/stream")
+async def stream_correction(request: CorrectionRequest):
+    """
+    Stream corrected text token by token as Ollama generates it.
+    Languages: latin, old_english, greek, sanskrit
+    """
+    if not request.text.strip():
+        return JSONResponse(status_code=400, content={"error": "Text cannot be empty"})
+    if request.language not in CORRECTION_MODELS:
+        return JSONResponse(status_code=400, content={"error": f"Language '{request.language}' not supported"})
+
+    key = correction_cache_key(request.text, request.language)
+    cached = await run_in_stage_pool("storage", lookup_cached, "correct", key)
+    if cached is not MISS:
+        return StreamingResponse(iter([cached]), media_type="text/plain; charset=utf-8")
+
+    # Text the deterministic rules already clean up needs no generation
+    cleaned = apply_rules(request.text, request.language)
+    if cleaned.quality >= CORRECTION_SKIP_QUALITY:
+        CORRECTION_GATE.inc(language=request.language, outcome="rules")
+        return StreamingResponse(iter([cleaned.text]), media_type="text/plain; charset=utf-8")
+    CORRECTION_GATE.inc(language=request.language, outcome="llm")
+
+    model = CORRECTION_MODELS[request.language]
+    # Take the slot before responding so overload surfaces as 503, not a broken stream
+    try:
+        await limiter.acquire_async(model)
+    except OllamaOverloadedError as e:
+        return JSONResponse(status_code=503, content={"error": str(e)}, headers={"Retry-After": "5"})
+
+    prompt = build_correction_prompt(cleaned.text, request.language)
+    released = False
+
+    def release():
+        # Runs from the generator and again as a background task, so the slot
+        # is freed even when the client leaves before the body is iterated
+        nonlocal released
+        if not released:
+            released = True
+            limiter.release(model)
+
+    async def tokens():
+        generated = []
+        try:
+            async for token in generate_stream(prompt, model):
+                generated.append(token)
+                yield token
+        except httpx.HTTPError as e:
+            logger.error(f"Ollama API error: {e}")
+            return
+        finally:
+            release()
+        # Only reached when the generation completed; an unchanged text is a valid correction
+        corrected = clean_llm_response("".join(generated).strip())
+        if corrected:
+            await run_in_stage_pool("storage", store_cached, "correct", key, corrected)
+
+    return StreamingResponse(tokens(), media_type="text/plain; charset=utf-8", background=BackgroundTask(release))
+
+@router.get("/correct/stats")
+async def correction_stats():
+    """Active and queued generations per Ollama model."""
+    return limiter.stats()
@@ -0,0 +1,93 @@
+from typing import Optional
+from fastapi import APIRouter, Query
+from fastapi.responses import JSONResponse
+from app.jobs import run_in_stage_pool
+from app.document_store import (
+    DEFAULT_PAGE_FIELDS, DOCUMENT_FIELDS, PAGE_FIELDS, TRANSLATIONS_FIELD,
+    get_document_store, parse_fields
+)
+
+router = APIRouter(tags=["Documents"])
+
+DOCUMENT_FIELD_NAMES = list(DOCUMENT_FIELDS) + [TRANSLATIONS_FIELD]
+PAGE_FIELD_NAMES = list(PAGE_FIELDS) + [TRANSLATIONS_FIELD]
+
+FIELDS_HELP = "Comma-separated fields to return"
+
+@router.get("/documents")
+async def list_documents(
+    language: Optional[str] = None,
+    sha256: Optional[str] = None,
+    filename: Optional[str] = None,
+    status: Optional[str] = Query(None, pattern="^(running|done|partial|failed)$"),
+    created_after: Optional[float] = None,
+    created_before: Optional[float] = None,
+    fields: Optional[str] = Query(None, description=FIELDS_HELP),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+):
+    """
+    Stored documents, newest first. Pass next_cursor back as `cursor` for
+    the following page. Only metadata fields are returned by default.
+    """
+    try:
+        selected = parse_fields(fields, DOCUMENT_FIELD_NAMES, list(DOCUMENT_FIELDS))
+        documents, next_cursor = await run_in_stage_pool(
+            "storage", get_document_store().list_documents, selected, limit, cursor,
+            language=language, sha256=sha256, filename=filename, status=status,
+            created_after=created_after, created_before=created_before,
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return {"documents": documents, "next_cursor": next_cursor}
+
+@router.get("/documents/{document_id}")
+async def get_document(document_id: str, fields: Optional[str] = Query(None, description=FIELDS_HELP)):
+    """One document's metadata (and its translations with fields=...,translations)."""
+    try:
+        selected = parse_fields(fields, DOCUMENT_FIELD_NAMES, list(DOCUMENT_FIELDS))
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    document = await run_in_stage_pool("storage", get_document_store().get_document, document_id, selected)
+    if document is None:
+        return JSONResponse(status_code=404, content={"error": "Document not found"})
+    return document
+
+@router.get("/documents/{document_id}/pages")
+async def list_pages(
+    document_id: str,
+    fields: Optional[str] = Query(None, description=FIELDS_HELP),
+    limit: int = Query(20, ge=1, le=500),
+    cursor: Optional[str] = None,
+):
+    """
+    A document's pages in order. By default the page texts without the
+    analysis, regions and OCR word tables; request those through `fields`.
+    """
+    store = get_document_store()
+    try:
+        selected = parse_fields(fields, PAGE_FIELD_NAMES, DEFAULT_PAGE_FIELDS)
+        if not await run_in_stage_pool("storage", store.exists, document_id):
+            return JSONResponse(status_code=404, content={"error": "Document not found"})
+        pages, next_cursor = await run_in_stage_pool("storage", store.list_pages, document_id, selected, limit, cursor)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return {"document_id": document_id, "pages": pages, "next_cursor": next_cursor}
+
+@router.get("/documents/{document_id}/pages/{page}")
+async def get_page(document_id: str, page: int, fields: Optional[str] = Query(None, description=FIELDS_HELP)):
+    try:
+        selected = parse_fields(fields, PAGE_FIELD_NAMES, DEFAULT_PAGE_FIELDS)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    result = await run_in_stage_pool("storage", get_document_store().get_page, document_id, page, selected)
+    if result is None:
+        return JSONResponse(status_code=404, content={"error": "Page not found"})
+    return result
+
+@router.delete("/documents/{document_id}")
+async def delete_document(document_id: str):
+    """Remove a document with its pages and translations (the uploaded file is kept)."""
+    if not await run_in_stage_pool("storage", get_document_store().delete_document, document_id):
+        return JSONResponse(status_code=404, content={"error": "Document not found"})
+    return {"success": True, "document_id": document_id}
@@ -0,0 +1,30 @@
+import asyncio
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.job_queue import get_job_queue, is_queued
+from app.textProcessor import CLTK_PRELOAD_LANGUAGES, get_text_processor
+
+router = APIRouter(tags=["Health"])
+
+@router.get("/ready")
+async def readiness():
+    """
+    Report which CLTK pipelines are warm and how long each took to load.
+    Returns 503 until every preloaded language is warm. With analysis in
+    stage workers (app.stage_worker) the pipelines live there, so this web
+    worker is ready once at least one analyze worker is up.
+    """
+    if is_queued("analyze"):
+        loop = asyncio.get_running_loop()
+        workers = await loop.run_in_executor(None, get_job_queue().live_workers, "analyze")
+        ready = workers > 0
+        return JSONResponse(
+            status_code=200 if ready else 503,
+            content={"ready": ready, "preload": CLTK_PRELOAD_LANGUAGES, "analyze_workers": workers}
+        )
+    pipelines = get_text_processor().pipeline_status()
+    ready = all(pipelines.get(code, {}).get("state") == "warm" for code in CLTK_PRELOAD_LANGUAGES)
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "preload": CLTK_PRELOAD_LANGUAGES, "pipelines": pipelines}
+    )
@@ -0,0 +1,39 @@
+import asyncio
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.jobs import get_job, get_job_snapshot, stream_job_events, stream_shared_job_events
+from app.job_queue import JOB_QUEUE_ENABLED, get_job_queue
+
+router = APIRouter(tags=["Jobs"])
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Return status, per-stage timings and (when finished) the result of a job."""
+    snapshot = await get_job_snapshot(job_id)
+    if snapshot is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return JSONResponse(content=snapshot)
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_status(job_id: str):
+    """Server-Sent Events stream of job progress, closed once the job finishes."""
+    job = get_job(job_id)
+    if job is not None:
+        events = stream_job_events(job)
+    elif await get_job_snapshot(job_id) is not None:
+        # Running in another web worker
+        events = stream_shared_job_events(job_id)
+    else:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@router.get("/queue/stats")
+async def queue_stats():
+    """Tasks per stage and status in the shared job queue."""
+    if not JOB_QUEUE_ENABLED:
+        return {"enabled": False}
+    return await asyncio.get_running_loop().run_in_executor(None, get_job_queue().stats)
@@ -0,0 +1,37 @@
+import asyncio
+from fastapi import APIRouter, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.metrics import render_metrics
+from app.profiler import PROFILER_ENABLED, PROFILER_MAX_SECONDS, profiler
+
+router = APIRouter(tags=["Metrics"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage and span latency histograms in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.get("/api/debug/profiler")
+async def profiler_status():
+    return profiler.status()
+
+@router.post("/api/debug/profiler/start")
+async def start_profiler(
+    interval_ms: float = Query(10, ge=1, le=1000),
+    max_seconds: float = Query(60, gt=0, le=PROFILER_MAX_SECONDS),
+):
+    """Start sampling every thread's stack (requires PROFILER_ENABLED=1)."""
+    if not PROFILER_ENABLED:
+        return JSONResponse(status_code=403, content={"error": "Profiler is disabled; set PROFILER_ENABLED=1"})
+    if not profiler.start(interval_ms, max_seconds):
+        return JSONResponse(status_code=409, content={"error": "Profiler is already running"})
+    return profiler.status()
+
+@router.post("/api/debug/profiler/stop", response_class=PlainTextResponse)
+async def stop_profiler():
+    """Stop sampling and return folded stacks, ready for flamegraph.pl or speedscope."""
+    if not PROFILER_ENABLED:
+        return JSONResponse(status_code=403, content={"error": "Profiler is disabled; set PROFILER_ENABLED=1"})
+    # stop() joins the sampling thread, which can take up to one interval
+    folded = await asyncio.get_running_loop().run_in_executor(None, profiler.stop)
+    return PlainTextResponse(folded)
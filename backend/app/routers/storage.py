@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from app.jobs import run_in_stage_pool
+from app.storage import storage_stats
+
+router = APIRouter(tags=["Storage"])
+
+@router.get("/storage/stats")
+async def upload_storage_stats():
+    """Size of the content-addressed upload store and its limits."""
+    return await run_in_stage_pool("storage", storage_stats)
@@ -1,38 +1,58 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from google.cloud import texttospeech
-from google.oauth2 import service_account
+from app.tts import TTS_LANGUAGE_CODE, TTS_VOICE_NAME, get_tts_service
 import base64
 
 router = APIRouter()
 
 class TTSRequest(BaseModel):
     text: str
+    language_code: str = TTS_LANGUAGE_CODE
+    voice_name: str = TTS_VOICE_NAME
 
 @router.post("/tts")
 async def text_to_speech(request: TTSRequest):
+    """Whole passage as base64 MP3 in JSON (kept for existing clients; prefer /tts/stream)."""
     try:
-        # Load credentials from another service account
-        credentials = service_account.Credentials.from_service_account_file("credentials2.json")
-        client = texttospeech.TextToSpeechClient(credentials=credentials)
-
-        synthesis_input = texttospeech.SynthesisInput(text=request.text)
-        voice = texttospeech.VoiceSelectionParams(
-            language_code="en-US",
-            name="en-US-Standard-C"
-        )
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3
-        )
-
-        response = client.synthesize_speech(
-            input=synthesis_input,
-            voice=voice,
-            audio_config=audio_config
-        )
-
-        audio_base64 = base64.b64encode(response.audio_content).decode("utf-8")
+        audio = await get_tts_service().synthesize_all(request.text, request.language_code, request.voice_name)
+        audio_base64 = base64.b64encode(audio).decode("utf-8")
         return {"audio": audio_base64}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+async def _stream_audio(text: str, language_code: str, voice_name: str) -> StreamingResponse:
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="Text cannot be empty")
+    chunks = get_tts_service().iter_audio(text, language_code, voice_name)
+    # Synthesize the first segment before answering so failures still get a 500
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = b""
+    except Exception as e:
+        await chunks.aclose()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def body():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(body(), media_type="audio/mpeg")
+
+@router.post("/tts/stream")
+async def text_to_speech_stream(request: TTSRequest):
+    """Raw audio/mpeg, sent segment by segment so playback starts early."""
+    return await _stream_audio(request.text, request.language_code, request.voice_name)
+
+@router.get("/tts/stream")
+async def text_to_speech_stream_get(text: str, language_code: str = TTS_LANGUAGE_CODE,
+                                    voice_name: str = TTS_VOICE_NAME):
+    """Same as POST /tts/stream; usable directly as an <audio> src."""
+    return await _stream_audio(text, language_code, voice_name)
+
+@router.get("/tts/stats")
+async def tts_stats():
+    return get_tts_service().cache.stats()
@@ -1,127 +1,270 @@
 from fastapi import APIRouter, UploadFile, File, Form, Body
-from fastapi.responses import JSONResponse, FileResponse 
-from pathlib import Path
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 import shutil
+import json
+import logging
+import sqlite3
+import uuid
+from typing import List, Optional
 from pydantic import BaseModel
-from app.preprocess import preprocess_image
-from app.ocr_ai_processor import extract_text_with_vision, correct_text_with_ollama
-from deep_translator import GoogleTranslator
 from app.textProcessor import get_text_processor
+from app.analysis_pool import analyze_documents
+from app.jobs import create_job, run_job, submit_job, run_in_stage_pool
+from app.pipeline import PIPELINE_STAGES, iter_document_pages, run_upload_pipeline
+from app.batch import BATCH_MAX_FILES, iter_batch_results, save_batch_upload
+from app.preprocess import DEFAULT_TIER, resolve_tier
+from app.ocr_backends import OCR_BACKEND_NAMES
+from app.translation import get_translator
+from app.storage import UPLOAD_DIR, UploadTooLargeError, file_url, job_dir, save_upload
+from app.document_store import DOCUMENT_STORE_ENABLED, get_document_store
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api", tags=["Upload & Preprocess"])
 
-UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
-LANGUAGE_MAP = {
-    "latin": "lat",
-    "lat": "lat",
-    "ancient greek": "grc",
-    "greek": "grc",
-    "old english": "ang",
-    "english": "ang"
-}
-
-def normalize_language(lang: str) -> str:
-    lang = lang.strip().lower()
-    return LANGUAGE_MAP.get(lang, "lat")
 
 # Pydantic model for text analysis requests
 class TextAnalysisRequest(BaseModel):
     text: str
     language: str = "lat"
+    # Re-analyze only the lines/sentences that changed since the last call;
+    # worth it for repeated edits of one text, not for one-off analysis
+    incremental: bool = False
+
+class BatchAnalysisDocument(BaseModel):
+    id: Optional[str] = None
+    text: str
+    language: str = "lat"
 
-@router.get("/files/{filename}")
+class BatchAnalysisRequest(BaseModel):
+    documents: List[BatchAnalysisDocument]
+    incremental: bool = False
+
+@router.get("/files/{filename:path}")
 async def get_file(filename: str):
     file_path = UPLOAD_DIR / filename
-    if not file_path.exists():
+    # Batch uploads live in sub-directories; never serve anything outside UPLOAD_DIR
+    if UPLOAD_DIR.resolve() not in file_path.resolve().parents or not file_path.is_file():
         return JSONResponse({"error": "File not found"}, status_code=404)
     return FileResponse(file_path)
 
+async def _store(document_id: str, method: str, *args, **kwargs) -> bool:
+    # Document store writes must not break the response they belong to
+    if not DOCUMENT_STORE_ENABLED:
+        return False
+    try:
+        await run_in_stage_pool("storage", getattr(get_document_store(), method), document_id, *args, **kwargs)
+        return True
+    except sqlite3.Error as e:
+        logger.warning(f"Could not store document {document_id}: {e}")
+        return False
+
 @router.post("/files/translation")
 async def translate_text(
     text: str = Body(..., embed=True),
     source_lang: str = Body("auto"),
-    target_lang: str = Body("en")
+    target_lang: str = Body("en"),
+    backend: Optional[str] = Body(None),
+    document_id: Optional[str] = Body(None),
+    page: Optional[int] = Body(None)
 ):
+    """
+    Translate line by line; lines translated before come from the segment cache.
+    With a document_id the translation is saved with that stored document
+    (one page of it when page is given).
+    """
     if not text.strip():
         return JSONResponse(
             status_code=400,
             content={"error": "Text cannot be empty"}
         )
-    translator = GoogleTranslator(source=source_lang, target=target_lang)
-    translated_text = translator.translate(text)
+    if document_id and DOCUMENT_STORE_ENABLED and not await run_in_stage_pool(
+        "storage", get_document_store().exists, document_id
+    ):
+        return JSONResponse(status_code=404, content={"error": "Document not found"})
+    try:
+        translator = get_translator(backend)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    try:
+        translated_text, segments = await translator.translate(text, source_lang, target_lang)
+    except Exception as e:
+        return JSONResponse(status_code=502, content={"error": f"Translation failed: {e}"})
+    if document_id:
+        await _store(document_id, "save_translation", page, source_lang, target_lang, translated_text)
     return JSONResponse(content={
         "success": True,
         "message": f"Translated from {source_lang} to {target_lang}",
         "original_text": text,
         "translated_text": translated_text,
         "source_lang": source_lang,
-        "target_lang": target_lang
+        "target_lang": target_lang,
+        "segments": segments
     })
 
 @router.post("/upload")
 async def upload_and_preprocess(
     file: UploadFile = File(...),
-    language: str = Form("lat")
+    language: str = Form("lat"),
+    background: bool = Form(False),
+    preprocess_tier: str = Form(DEFAULT_TIER),
+    ocr_backend: Optional[str] = Form(None)
 ):
     """
     Upload an image or PDF, preprocess if image, extract text, and analyze.
     Languages: lat (Latin), grc (Greek), ang (Old English)
+    preprocess_tier: fast, balanced (default) or archival
+    ocr_backend: google-vision, tesseract, fallback or stub (default from OCR_BACKEND)
+    With background=true the pipeline runs as a job and a job id is returned
+    immediately; poll /api/jobs/{job_id} or stream /api/jobs/{job_id}/events.
     """
     try:
-        # Save original file
-        file_path = UPLOAD_DIR / file.filename
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Preprocess images
-        ext = file_path.suffix.lower()
-        if ext in [".jpg", ".jpeg", ".png"]:
-            preprocessed_path = preprocess_image(str(file_path))
-        else:
-            preprocessed_path = str(file_path)
-        
-        # Extract text using Google Vision
-        raw_text = extract_text_with_vision(preprocessed_path)
-        
-        # Correct text with Gemini (clean up OCR errors)
-        corrected_text = correct_text_with_ollama(raw_text, language)
-        
-        # Analyze corrected text with CLTK for lemmas/POS
-        processor = get_text_processor()
-        
-        # Auto-detect language if needed
-        if not language or language == "auto":
-            language = processor.detect_language(corrected_text)
-        
-        # Get linguistic analysis (lemma + POS)
-        language = normalize_language(language)
-        try:
-           text_analysis = processor.analyze_text(corrected_text, language)
-        except Exception as e:
-            print(f" Text analysis failed for {language}: {e}")
-            text_analysis = None 
-        
+        preprocess_tier = resolve_tier(preprocess_tier)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    if ocr_backend and ocr_backend not in OCR_BACKEND_NAMES:
+        return JSONResponse(status_code=400, content={"error": f"Unknown ocr_backend '{ocr_backend}'"})
 
-        
-        return JSONResponse(content={
-            "success": True,
-            "language": language,
-            "original_filename": file.filename,
-            "file_url": f"/api/files/{file.filename}",
-            "preprocessed_file": f"/api/files/preprocessed_clean.png" if ext in [".jpg", ".jpeg", ".png"] else None,
-            "raw_ocr_text": raw_text,
-            "accurate_text": corrected_text,
-            "text_analysis": text_analysis,
-            "detected_language": language,
-            "message": "OCR and linguistic analysis complete"
+    job = None
+    try:
+        job = create_job(PIPELINE_STAGES, {
+            "filename": file.filename, "language": language,
+            "preprocess_tier": preprocess_tier, "ocr_backend": ocr_backend
         })
+        # Stream the original into content-addressed storage, linked into the job's directory
+        try:
+            stored = await run_in_stage_pool("storage", save_upload, file.file, file.filename, job.id)
+        except UploadTooLargeError as e:
+            # Finished jobs are pruned after JOB_TTL_SECONDS; a queued one would stay forever
+            job.fail(str(e))
+            return JSONResponse(status_code=413, content={"error": str(e)})
+        job.meta["sha256"] = stored.sha256
+        pipeline = run_upload_pipeline(job, stored.path, language, preprocess_tier, ocr_backend, stored.sha256)
+
+        if background:
+            submit_job(job, pipeline)
+            return JSONResponse(status_code=202, content={
+                "success": True,
+                "job_id": job.id,
+                "status_url": f"/api/jobs/{job.id}",
+                "events_url": f"/api/jobs/{job.id}/events",
+                "message": "Upload accepted, processing in background"
+            })
+
+        result = await run_job(job, pipeline)
+        return JSONResponse(content={**result, "job_id": job.id, "timings": job.timings()})
 
     except Exception as e:
         import traceback
         traceback.print_exc()  # Print full error for debugging
+        if job is not None and job.finished_at is None:
+            job.fail(str(e))
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+@router.post("/upload/pages")
+async def upload_document_pages(
+    file: UploadFile = File(...),
+    language: str = Form("lat"),
+    preprocess_tier: str = Form(DEFAULT_TIER),
+    ocr_backend: Optional[str] = Form(None)
+):
+    """
+    Upload a multi-page PDF or TIFF (or a single image) and stream results
+    page by page as NDJSON. The first line carries the page count and the
+    document_id; every following line is one page, in completion order,
+    tagged with its number. Pages are saved in the document store as they finish.
+    """
+    try:
+        preprocess_tier = resolve_tier(preprocess_tier)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    if ocr_backend and ocr_backend not in OCR_BACKEND_NAMES:
+        return JSONResponse(status_code=400, content={"error": f"Unknown ocr_backend '{ocr_backend}'"})
+
+    document_id = uuid.uuid4().hex
+    try:
+        stored = await run_in_stage_pool("storage", save_upload, file.file, file.filename, document_id)
+    except UploadTooLargeError as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
+
+    async def lines():
+        saved = False
+        languages = []
+        try:
+            async for item in iter_document_pages(
+                stored.path, language, preprocess_tier, ocr_backend, source_hash=stored.sha256
+            ):
+                if "page" not in item:
+                    saved = await _store(
+                        document_id, "save_document", stored.sha256, item["original_filename"], [],
+                        status="running", page_count=item["page_count"], file_url=file_url(stored.path),
+                        preprocess_tier=preprocess_tier, ocr_backend=ocr_backend
+                    )
+                    item["document_id"] = document_id if saved else None
+                else:
+                    if saved:
+                        await _store(document_id, "save_pages", [item])
+                    if item.get("success"):
+                        languages.append((item["page"], item["language"]))
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"success": False, "error": str(e)}) + "\n"
+        finally:
+            if saved:
+                await _store(document_id, "finish_document", min(languages)[1] if languages else None)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@router.post("/upload/batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    language: str = Form("lat"),
+    preprocess_tier: str = Form(DEFAULT_TIER),
+    ocr_backend: Optional[str] = Form(None)
+):
+    """
+    Upload many images, PDFs or TIFFs (or zip archives of them) at once.
+    Images are OCRed through Vision batch requests. Results stream back as
+    NDJSON: a header line, one line per file as it finishes, then a summary.
+    """
+    try:
+        preprocess_tier = resolve_tier(preprocess_tier)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    if ocr_backend and ocr_backend not in OCR_BACKEND_NAMES:
+        return JSONResponse(status_code=400, content={"error": f"Unknown ocr_backend '{ocr_backend}'"})
+
+    batch_id = uuid.uuid4().hex
+    stored = []
+    try:
+        for upload in files:
+            stored.extend(await run_in_stage_pool(
+                "storage", save_batch_upload, upload.filename, upload.file, f"batch_{batch_id}",
+                BATCH_MAX_FILES - len(stored)
+            ))
+    except UploadTooLargeError as e:
+        shutil.rmtree(job_dir(f"batch_{batch_id}"), ignore_errors=True)
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    except Exception as e:
+        shutil.rmtree(job_dir(f"batch_{batch_id}"), ignore_errors=True)
+        return JSONResponse(status_code=400, content={"error": f"Could not read upload: {e}"})
+    if not stored:
+        return JSONResponse(status_code=400, content={"error": "No supported files in upload"})
+
+    async def lines():
+        yield json.dumps({"batch_id": batch_id, "file_count": len(stored)}) + "\n"
+        succeeded = failed = 0
+        async for result in iter_batch_results(stored, language, preprocess_tier, ocr_backend):
+            if result.get("success"):
+                succeeded += 1
+            else:
+                failed += 1
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+        yield json.dumps({"batch_id": batch_id, "done": True, "succeeded": succeeded, "failed": failed}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @router.post("/analyze-text")
 async def analyze_text(request: TextAnalysisRequest):
     """
@@ -130,11 +273,28 @@ async def analyze_text(request: TextAnalysisRequest):
     """
     try:
         processor = get_text_processor()
-        analysis = processor.analyze_text(request.text, request.language)
+        analyze = processor.analyze_text_incremental if request.incremental else processor.analyze_text
+        analysis = await run_in_stage_pool("analyze", analyze, request.text, request.language)
         return JSONResponse(content={
             "success": True,
             "text_analysis": analysis,
             "language": request.language
         })
     except Exception as e:
-        return JSONResponse(status_code=500, content={"error": str(e)})
\ No newline at end of file
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.post("/analyze-text/batch")
+async def analyze_text_batch(request: BatchAnalysisRequest):
+    """
+    Analyze many documents at once on a pool of worker processes,
+    so several cores run CLTK in parallel.
+    """
+    if not request.documents:
+        return JSONResponse(status_code=400, content={"error": "No documents to analyze"})
+    try:
+        results = await analyze_documents(
+            [doc.model_dump() for doc in request.documents], request.incremental
+        )
+        return JSONResponse(content={"success": True, "results": results})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
@@ -0,0 +1,165 @@
+"""
+Stage worker: runs pipeline stages taken from the shared job queue
+(app.job_queue), so web workers only accept requests and wait for results.
+
+    cd backend
+    JOB_QUEUE_ENABLED=1 gunicorn -c gunicorn.conf.py app.main:app
+    python -m app.stage_worker --stages preprocess --concurrency 4
+    python -m app.stage_worker --stages ocr,correct --concurrency 8
+    python -m app.stage_worker --stages analyze
+
+Start as many workers per stage as the load needs; each claims tasks on its
+own, so CPU preprocessing, OCR, LLM correction and CLTK analysis scale
+independently. Tasks pass file paths, so workers must share the web
+workers' working directory (or UPLOAD_DIR, RESULT_CACHE_PATH and
+JOB_QUEUE_PATH).
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.job_queue import (
+    JOB_QUEUE_HEARTBEAT_SECONDS, JOB_QUEUE_POLL_SECONDS, JOB_QUEUE_STAGES, get_job_queue, resolve_task
+)
+from app.jobs import STAGE_WORKERS
+
+logger = logging.getLogger("app.stage_worker")
+
+# Idle workers back off to this poll interval
+MAX_IDLE_POLL_SECONDS = 0.25
+PURGE_INTERVAL_SECONDS = 60
+
+# Task id -> worker id of every task running in this process, for the heartbeat
+_running: Dict[int, str] = {}
+_running_lock = threading.Lock()
+
+
+def work(stages: List[str], worker_id: str, stop: threading.Event):
+    """Claim and run tasks of the given stages until stop is set."""
+    queue = get_job_queue()
+    idle = JOB_QUEUE_POLL_SECONDS
+    while not stop.is_set():
+        try:
+            task = queue.claim(stages, worker_id)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not claim a task: {e}")
+            task = None
+        if task is None:
+            stop.wait(idle)
+            idle = min(idle * 2, MAX_IDLE_POLL_SECONDS)
+            continue
+        idle = JOB_QUEUE_POLL_SECONDS
+        task_id, name, args, kwargs = task
+        start = time.perf_counter()
+        with _running_lock:
+            _running[task_id] = worker_id
+        try:
+            stored = queue.complete(task_id, resolve_task(name)(*args, **kwargs), worker_id)
+        except Exception as e:
+            logger.exception(f"Task {task_id} ({name}) failed")
+            stored = queue.fail(task_id, f"{type(e).__name__}: {e}", worker_id)
+        finally:
+            with _running_lock:
+                _running.pop(task_id, None)
+        if not stored:
+            # The lease expired and the task went to another worker; its result wins
+            logger.warning(f"Task {task_id} ({name}) lost its lease; result dropped")
+        logger.debug(f"Task {task_id} ({name}) took {time.perf_counter() - start:.3f}s")
+
+
+def heartbeat(name: str, stages: List[str], stop: threading.Event):
+    """
+    Renew the leases of running tasks, so only dead workers' tasks are
+    handed out again, and keep this worker listed as up for its stages.
+    """
+    while not stop.wait(JOB_QUEUE_HEARTBEAT_SECONDS):
+        try:
+            get_job_queue().register_worker(name, stages)
+        except sqlite3.Error as e:
+            logger.warning(f"Worker registration failed: {e}")
+        with _running_lock:
+            by_worker: Dict[str, List[int]] = {}
+            for task_id, worker_id in _running.items():
+                by_worker.setdefault(worker_id, []).append(task_id)
+        for worker_id, task_ids in by_worker.items():
+            try:
+                held = get_job_queue().heartbeat(task_ids, worker_id)
+            except sqlite3.Error as e:
+                logger.warning(f"Lease renewal failed: {e}")
+                continue
+            for task_id in set(task_ids) - set(held):
+                logger.warning(f"Task {task_id} is no longer held by {worker_id}")
+
+
+def purge(stop: threading.Event):
+    while not stop.wait(PURGE_INTERVAL_SECONDS):
+        try:
+            get_job_queue().purge()
+        except Exception as e:
+            logger.warning(f"Job queue purge failed: {e}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", required=True,
+                        help=f"comma-separated stages to run (queued: {', '.join(sorted(JOB_QUEUE_STAGES))})")
+    parser.add_argument("--concurrency", type=int,
+                        help="tasks run at once (default: the stages' STAGE_WORKERS; always 1 with analyze)")
+    parser.add_argument("--name", default=f"{socket.gethostname()}:{os.getpid()}", help="worker id in the queue")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in JOB_QUEUE_STAGES]
+    if unknown:
+        parser.error(f"not in JOB_QUEUE_STAGES: {', '.join(unknown)}")
+    concurrency = args.concurrency or min(STAGE_WORKERS.get(s, 1) for s in stages)
+
+    if "analyze" in stages:
+        if concurrency > 1:
+            parser.error("CLTK is not thread-safe: run analyze with --concurrency 1, "
+                         "and start more analyze workers to scale it")
+        # CLTK pipelines are built once per worker, before taking tasks
+        from app.textProcessor import get_text_processor
+        logger.info(f"CLTK preload: {get_text_processor().preload()}")
+
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+    threads = [
+        threading.Thread(target=work, args=(stages, f"{args.name}/{i}", stop), name=f"worker-{i}")
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    threading.Thread(target=purge, args=(stop,), name="purge", daemon=True).start()
+    threading.Thread(target=heartbeat, args=(args.name, stages, stop), name="heartbeat", daemon=True).start()
+    # Web workers report ready once every queued stage has a worker (see /api/ready)
+    get_job_queue().register_worker(args.name, stages)
+    logger.info(f"Stage worker {args.name}: {', '.join(stages)} x{concurrency}")
+    while not stop.wait(1):
+        pass
+    # Tasks in flight finish before the worker exits
+    for thread in threads:
+        thread.join()
+    get_job_queue().unregister_worker(args.name)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
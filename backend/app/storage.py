@@ -0,0 +1,219 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Layout under UPLOAD_DIR:
+#   objects/ab/<sha256><ext>   originals, stored once per distinct content
+#   derived/<sha256>/<name>    artifacts computed from an original (preprocessed pages)
+#   jobs/<job id>/<filename>   per-job view: hard links to the originals it used
+#   tmp/                       uploads being streamed in
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "uploads"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Largest single upload (or zip member) accepted
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(200 * 1024 * 1024)))
+# Job directories, and originals no job links to, are removed after this long
+UPLOAD_RETENTION_SECONDS = int(os.getenv("UPLOAD_RETENTION_SECONDS", str(7 * 24 * 3600)))
+# Unreferenced originals are removed oldest first while storage exceeds this
+UPLOAD_MAX_TOTAL_BYTES = int(os.getenv("UPLOAD_MAX_TOTAL_BYTES", str(20 * 1024 * 1024 * 1024)))
+UPLOAD_GC_INTERVAL_SECONDS = int(os.getenv("UPLOAD_GC_INTERVAL_SECONDS", "3600"))
+# Originals and partial uploads younger than this are never collected: an
+# upload is stored before it is linked into its job, so it briefly has no link
+UPLOAD_GC_GRACE_SECONDS = int(os.getenv("UPLOAD_GC_GRACE_SECONDS", "3600"))
+
+OBJECTS_DIR = UPLOAD_DIR / "objects"
+DERIVED_DIR = UPLOAD_DIR / "derived"
+JOBS_DIR = UPLOAD_DIR / "jobs"
+TMP_DIR = UPLOAD_DIR / "tmp"
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds UPLOAD_MAX_BYTES."""
+
+
+@dataclass
+class StoredFile:
+    sha256: str
+    path: Path
+    size: int
+    filename: str
+    deduplicated: bool
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    """Client file name without any directory parts."""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    return name if name not in ("", ".", "..") else "upload"
+
+
+def object_path(sha256: str, ext: str) -> Path:
+    return OBJECTS_DIR / sha256[:2] / f"{sha256}{ext.lower()}"
+
+
+def derived_path(sha256: str, name: str) -> Path:
+    """Path of an artifact derived from an original; the directory is created."""
+    directory = DERIVED_DIR / sha256
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / name
+
+
+def file_url(path: Path) -> str:
+    return f"/api/files/{Path(path).relative_to(UPLOAD_DIR).as_posix()}"
+
+
+def store_stream(stream: BinaryIO, filename: Optional[str], max_bytes: int = UPLOAD_MAX_BYTES) -> StoredFile:
+    """
+    Copy a stream to disk in chunks while hashing it, then move it into the
+    content-addressed store. Identical content is kept once; the second copy
+    is discarded and the existing object reused.
+    """
+    filename = safe_filename(filename)
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = TMP_DIR / f"{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as out:
+            while chunk := stream.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"{filename} exceeds {max_bytes} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+        sha256 = digest.hexdigest()
+        target = object_path(sha256, Path(filename).suffix)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        deduplicated = target.exists()
+        if deduplicated:
+            os.remove(tmp_path)
+            # Refresh the age retention is measured from
+            os.utime(target)
+        else:
+            os.replace(tmp_path, target)
+        return StoredFile(sha256, target, size, filename, deduplicated)
+    except BaseException:
+        if tmp_path.exists():
+            os.remove(tmp_path)
+        raise
+
+
+def job_dir(job_id: str) -> Path:
+    directory = JOBS_DIR / job_id
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def link_into_job(stored: StoredFile, job_id: str) -> Path:
+    """
+    Expose a stored original under its client name inside the job directory.
+    Hard links cost no extra disk and count as references for GC.
+    """
+    directory = job_dir(job_id)
+    target = directory / stored.filename
+    n = 1
+    while target.exists():
+        target = directory / f"{Path(stored.filename).stem}_{n}{Path(stored.filename).suffix}"
+        n += 1
+    try:
+        os.link(stored.path, target)
+    except OSError:
+        shutil.copyfile(stored.path, target)
+    return target
+
+
+def save_upload(stream: BinaryIO, filename: Optional[str], job_id: str) -> StoredFile:
+    """Store an upload and link it into the job's directory; returns the job-local path."""
+    stored = store_stream(stream, filename)
+    stored.path = link_into_job(stored, job_id)
+    return stored
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def collect_garbage(now: Optional[float] = None) -> Dict:
+    """
+    Apply the retention policy: drop expired job directories and stale
+    partial uploads, then originals no job links to once they are past
+    retention or storage is over UPLOAD_MAX_TOTAL_BYTES, along with their
+    derived artifacts. Nothing younger than UPLOAD_GC_GRACE_SECONDS is removed.
+    """
+    now = now or time.time()
+    removed = {"jobs": 0, "objects": 0, "tmp": 0, "bytes": 0}
+    cutoff = now - UPLOAD_RETENTION_SECONDS
+
+    if JOBS_DIR.exists():
+        for directory in JOBS_DIR.iterdir():
+            if directory.is_dir() and directory.stat().st_mtime < cutoff:
+                # Originals are hard links; their bytes are freed below once unreferenced
+                shutil.rmtree(directory, ignore_errors=True)
+                removed["jobs"] += 1
+    if TMP_DIR.exists():
+        for part in TMP_DIR.iterdir():
+            if part.stat().st_mtime < now - UPLOAD_GC_GRACE_SECONDS:
+                part.unlink(missing_ok=True)
+                removed["tmp"] += 1
+
+    objects = []
+    total = 0
+    if OBJECTS_DIR.exists():
+        for path in OBJECTS_DIR.rglob("*"):
+            if not path.is_file():
+                continue
+            st = path.stat()
+            derived = DERIVED_DIR / path.stem
+            size = st.st_size + (_dir_size(derived) if derived.exists() else 0)
+            total += size
+            # A link count above one means a job directory still uses it
+            if st.st_nlink <= 1 and st.st_mtime < now - UPLOAD_GC_GRACE_SECONDS:
+                objects.append((st.st_mtime, path, derived, size))
+
+    for mtime, path, derived, size in sorted(objects, key=lambda o: o[0]):
+        if mtime >= cutoff and total <= UPLOAD_MAX_TOTAL_BYTES:
+            continue
+        path.unlink(missing_ok=True)
+        shutil.rmtree(derived, ignore_errors=True)
+        total -= size
+        removed["objects"] += 1
+        removed["bytes"] += size
+
+    if removed["jobs"] or removed["objects"]:
+        logger.info(f"Upload GC removed {removed}")
+    return removed
+
+
+def storage_stats() -> Dict:
+    def count(path: Path) -> int:
+        return sum(1 for f in path.rglob("*") if f.is_file()) if path.exists() else 0
+
+    return {
+        "objects": count(OBJECTS_DIR),
+        "object_bytes": _dir_size(OBJECTS_DIR) if OBJECTS_DIR.exists() else 0,
+        "derived_bytes": _dir_size(DERIVED_DIR) if DERIVED_DIR.exists() else 0,
+        "jobs": sum(1 for _ in JOBS_DIR.iterdir()) if JOBS_DIR.exists() else 0,
+        "max_upload_bytes": UPLOAD_MAX_BYTES,
+        "max_total_bytes": UPLOAD_MAX_TOTAL_BYTES,
+        "retention_seconds": UPLOAD_RETENTION_SECONDS,
+    }
+
+
+_gc_lock = threading.Lock()
+
+
+def run_gc_once() -> Optional[Dict]:
+    """collect_garbage, skipped if a collection is already running."""
+    if not _gc_lock.acquire(blocking=False):
+        return None
+    try:
+        return collect_garbage()
+    finally:
+        _gc_lock.release()
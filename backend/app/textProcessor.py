@@ -1,9 +1,37 @@
 import logging
+import os
 import re
-from typing import Dict, List
+import threading
+import time
+from bisect import bisect_right
+from typing import Dict, Iterable, List
+from app.cache import MISS, cached_call, hash_bytes, lookup_cached, make_key, store_cached
+from app.job_queue import queue_task
+from app.langdetect import detect_language
+from app.metrics import span
 
 logger = logging.getLogger(__name__)
 
+# Languages whose pipelines are built at startup (comma separated, empty for none)
+CLTK_PRELOAD_LANGUAGES = [
+    code.strip() for code in os.getenv("CLTK_PRELOAD_LANGUAGES", "lat,grc,ang").split(",") if code.strip()
+]
+# After a failed load, wait this long before retrying, doubling on every failure
+CLTK_RETRY_BASE_SECONDS = float(os.getenv("CLTK_RETRY_BASE_SECONDS", "30"))
+CLTK_RETRY_MAX_SECONDS = float(os.getenv("CLTK_RETRY_MAX_SECONDS", "3600"))
+
+# Incremental analysis works on lines; longer lines are split into sentences
+SEGMENT_MAX_CHARS = int(os.getenv("ANALYSIS_SEGMENT_MAX_CHARS", "400"))
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.;!?\u00b7\u0387\u037e])\s+")
+
+# A short sentence per language, analyzed once so every process in the
+# pipeline (and its model files) is loaded, not just the pipeline object
+WARMUP_TEXTS = {
+    "lat": "Gallia est omnis divisa in partes tres.",
+    "grc": "ἐν ἀρχῇ ἦν ὁ λόγος.",
+    "ang": "Hwæt we Gardena in geardagum.",
+}
+
 class TextProcessor:
     def __init__(self):
         """Initialize minimal CLTK processors for supported languages."""
@@ -13,6 +41,11 @@ class TextProcessor:
             "grc": "Ancient Greek",
             "ang": "Old English",
         }
+        self.load_seconds: Dict[str, float] = {}
+        # language -> {"error", "attempts", "retry_at"}
+        self.load_failures: Dict[str, Dict] = {}
+        self.loading: set = set()
+        self._load_lock = threading.Lock()
         logger.info("TextProcessor initialized.")
 
     def _load_processor(self, language_code: str):
@@ -21,31 +54,123 @@ class TextProcessor:
             logger.error(f"Unsupported language: {language_code}")
             return None
 
-        if language_code not in self.processors:
+        if language_code in self.processors:
+            return self.processors[language_code]
+
+        with self._load_lock:
+            if language_code in self.processors:
+                return self.processors[language_code]
+
+            # Don't hammer a broken install on every request; back off instead
+            failure = self.load_failures.get(language_code)
+            if failure and time.time() < failure["retry_at"]:
+                return None
+
+            self.loading.add(language_code)
+            start = time.perf_counter()
             try:
                 from cltk import NLP
                 logger.info(f"Loading CLTK pipeline for {self.supported_languages[language_code]}...")
                 nlp = NLP(language_code, suppress_banner=True)
                 _ = nlp.pipeline.processes  # Ensure pipeline built
+                if language_code in WARMUP_TEXTS:
+                    nlp.analyze(WARMUP_TEXTS[language_code])
                 self.processors[language_code] = nlp
-                logger.info(f"Successfully loaded {language_code} NLP pipeline.")
+                self.load_seconds[language_code] = round(time.perf_counter() - start, 3)
+                self.load_failures.pop(language_code, None)
+                logger.info(f"Successfully loaded {language_code} NLP pipeline in {self.load_seconds[language_code]}s.")
             except Exception as e:
                 logger.exception(f"Failed to load CLTK for {language_code}: {e}")
+                attempts = (failure["attempts"] if failure else 0) + 1
+                delay = min(CLTK_RETRY_MAX_SECONDS, CLTK_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+                self.load_failures[language_code] = {
+                    "error": str(e),
+                    "attempts": attempts,
+                    "retry_at": time.time() + delay,
+                }
                 return None
+            finally:
+                self.loading.discard(language_code)
 
         return self.processors[language_code]
 
+    def preload(self, languages: Iterable[str] = None) -> Dict[str, Dict]:
+        """Build (and warm up) pipelines ahead of the first request."""
+        for code in languages if languages is not None else CLTK_PRELOAD_LANGUAGES:
+            self._load_processor(code)
+        return self.pipeline_status()
+
+    def pipeline_status(self) -> Dict[str, Dict]:
+        """Warm/cold/loading/failed state and load time per supported language."""
+        status = {}
+        now = time.time()
+        for code in self.supported_languages:
+            if code in self.processors:
+                status[code] = {"state": "warm", "load_seconds": self.load_seconds.get(code)}
+            elif code in self.loading:
+                status[code] = {"state": "loading"}
+            elif code in self.load_failures:
+                failure = self.load_failures[code]
+                status[code] = {
+                    "state": "failed",
+                    "error": failure["error"],
+                    "attempts": failure["attempts"],
+                    "retry_in_seconds": max(0, round(failure["retry_at"] - now)),
+                }
+            else:
+                status[code] = {"state": "cold"}
+        return status
+
     def analyze_text(self, text: str, language: str = "lat") -> List[Dict]:
-        """Analyze text and return only word and lemma."""
+        """Analyze text and return only word and lemma, reusing cached results."""
         if language not in self.supported_languages:
             return [{"error": f"Language '{language}' not supported"}]
 
+        key = make_key("analyze", hash_bytes(text.encode("utf-8")), language, _cltk_version())
+        return cached_call(
+            "analyze", key,
+            lambda: self._analyze_uncached(text, language),
+            should_store=lambda results: not any("error" in r for r in results)
+        )
+
+    def analyze_text_incremental(self, text: str, language: str = "lat") -> List[Dict]:
+        """
+        Analyze text segment by segment (lines, or sentences of long lines),
+        caching each segment's words and lemmas by hash. After an edit only
+        the changed segments go through CLTK again, together in one call.
+        """
+        if language not in self.supported_languages:
+            return [{"error": f"Language '{language}' not supported"}]
+
+        version = _cltk_version()
+        segments = split_segments(text)
+        keys = [make_key("analyze-segment", hash_bytes(s.encode("utf-8")), language, version) for s in segments]
+        cached = {key: lookup_cached("analyze-segment", key) for key in keys}
+        misses = list(dict.fromkeys(s for s, key in zip(segments, keys) if cached[key] is MISS))
+
+        if misses:
+            # One CLTK call for every changed segment; its words are mapped back by position
+            words = self._analyze_uncached("\n".join(misses), language)
+            if any("error" in w for w in words):
+                return words
+            for segment, segment_words in zip(misses, _split_words(words, misses, "\n")):
+                key = make_key("analyze-segment", hash_bytes(segment.encode("utf-8")), language, version)
+                cached[key] = segment_words
+                store_cached("analyze-segment", key, segment_words)
+
+        results: List[Dict] = []
+        for key in keys:
+            results.extend(cached[key])
+        return results
+
+    def _analyze_uncached(self, text: str, language: str) -> List[Dict]:
         nlp = self._load_processor(language)
         if not nlp:
             return [{"error": f"Failed to load NLP pipeline for '{language}'"}]
 
         try:
-            doc = nlp.analyze(text)
+            with span("cltk.analyze", language=language):
+                doc = nlp.analyze(text)
             results = []
             for word in getattr(doc, "words", []):
                 lemma = getattr(word, "lemma", None)
@@ -61,20 +186,63 @@ class TextProcessor:
             return [{"error": str(e)}]
 
     def detect_language(self, text: str) -> str:
-        """Simple heuristic language detector."""
-        t = text.lower()
-        if any(w in t for w in ["et", "est", "sum", "sunt", "sed", "enim"]):
-            return "lat"
-        if any(w in t for w in ["kai", "ho", "tou", "te", "en"]):
-            return "grc"
-        if any(w in t for w in ["þæt", "and", "se", "heo", "his"]):
-            return "ang"
-        return "lat"
+        """CLTK code of the detected language (see app.langdetect)."""
+        return detect_language(text).code
 
     def get_supported_languages(self) -> Dict[str, str]:
         return self.supported_languages
     
 
+def split_segments(text: str, max_chars: int = SEGMENT_MAX_CHARS) -> List[str]:
+    """Split text into non-empty lines, breaking long lines at sentence ends."""
+    segments = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if len(line) <= max_chars:
+            segments.append(line)
+        else:
+            segments.extend(part for part in SENTENCE_BOUNDARY.split(line) if part)
+    return segments
+
+
+def _split_words(words: List[Dict], segments: List[str], separator: str) -> List[List[Dict]]:
+    """
+    Assign the words of an analysis of separator.join(segments) to the
+    segment each was found in, searching forward from the previous word.
+    A word the tokenizer altered stays with the segment of the last match.
+    """
+    text = separator.join(segments)
+    starts, offset = [], 0
+    for segment in segments:
+        starts.append(offset)
+        offset += len(segment) + len(separator)
+    grouped: List[List[Dict]] = [[] for _ in segments]
+    cursor = index = 0
+    for word in words:
+        found = text.find(word["word"], cursor) if word["word"] else -1
+        if found >= 0:
+            cursor = found + len(word["word"])
+            index = bisect_right(starts, found) - 1
+        grouped[index].append(word)
+    return grouped
+
+
+_cltk_version_cache: str | None = None
+
+def _cltk_version() -> str:
+    """CLTK version, part of the analysis cache key so upgrades invalidate it."""
+    global _cltk_version_cache
+    if _cltk_version_cache is None:
+        try:
+            from importlib.metadata import version
+            _cltk_version_cache = version("cltk")
+        except Exception:
+            _cltk_version_cache = "unknown"
+    return _cltk_version_cache
+
+
 # Singleton
 _text_processor: TextProcessor | None = None
 
@@ -85,6 +253,12 @@ def get_text_processor():
     return _text_processor
 
 
+@queue_task
+def analyze_text(text: str, language: str = "lat") -> List[Dict]:
+    """TextProcessor.analyze_text on the shared processor; runs in a stage worker when the job queue is on."""
+    return get_text_processor().analyze_text(text, language)
+
+
 def clean_text(text: str) -> str:
     """
     Clean OCR text for frontend display:
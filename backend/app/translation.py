@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+from app.cache import hash_bytes, lookup_cached_many, make_key, store_cached
+from app.jobs import run_in_stage_pool
+from app.metrics import span
+from app.ratelimit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# google (deep-translator) or stub (offline, see StubTranslationBackend)
+TRANSLATION_BACKEND = os.getenv("TRANSLATION_BACKEND", "google")
+# Requests per minute sent to the translation service
+TRANSLATION_REQUESTS_PER_MINUTE = float(os.getenv("TRANSLATION_REQUESTS_PER_MINUTE", "120"))
+# Segments are packed into requests of at most this many characters
+# (the Google endpoint used by deep-translator accepts up to 5000)
+TRANSLATION_BATCH_MAX_CHARS = int(os.getenv("TRANSLATION_BATCH_MAX_CHARS", "4500"))
+TRANSLATION_STUB_LATENCY = float(os.getenv("TRANSLATION_STUB_LATENCY", "0"))
+
+SENTENCE_END = re.compile(r"(?<=[.;!?\u00b7\u0387\u037e])\s+")
+
+
+def split_segments(text: str, max_chars: int = TRANSLATION_BATCH_MAX_CHARS) -> List[List[str]]:
+    """
+    Per line, the segments to translate: [] for a blank line, one segment
+    for a normal line, sentences (then word runs) for a line over max_chars.
+    Line-level segments mean an edit only invalidates the lines it touched.
+    """
+    lines = []
+    for line in text.split("\n"):
+        line = line.strip()
+        if len(line) <= max_chars:
+            lines.append([line] if line else [])
+            continue
+        pieces = []
+        for sentence in SENTENCE_END.split(line):
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                pieces.append(sentence[:cut])
+                sentence = sentence[cut:].strip()
+            if sentence:
+                pieces.append(sentence)
+        lines.append(pieces)
+    return lines
+
+
+class TranslationBackend(ABC):
+    """
+    Translates a list of segments; subclasses implement translate_batch and
+    call self.rate_limiter.acquire() before every request they send.
+    """
+    name = "base"
+
+    def __init__(self, requests_per_minute: float = TRANSLATION_REQUESTS_PER_MINUTE):
+        self.rate_limiter = RateLimiter(requests_per_minute)
+
+    @abstractmethod
+    def translate_batch(self, segments: List[str], source: str, target: str) -> List[str]:
+        ...
+
+
+class GoogleTranslationBackend(TranslationBackend):
+    name = "google"
+
+    def __init__(self):
+        super().__init__()
+        # GoogleTranslator keeps per-call state, so instances are per thread
+        self._local = threading.local()
+
+    def _translator(self, source: str, target: str):
+        from deep_translator import GoogleTranslator
+
+        translators = getattr(self._local, "translators", None)
+        if translators is None:
+            translators = self._local.translators = {}
+        translator = translators.get((source, target))
+        if translator is None:
+            translator = translators[(source, target)] = GoogleTranslator(source=source, target=target)
+        return translator
+
+    def translate_batch(self, segments: List[str], source: str, target: str) -> List[str]:
+        """One request for the whole batch, newline-separated; per segment if lines come back merged."""
+        translator = self._translator(source, target)
+        if len(segments) > 1:
+            self.rate_limiter.acquire(1)
+            joined = translator.translate("\n".join(segments)) or ""
+            lines = joined.split("\n")
+            if len(lines) == len(segments):
+                return [line.strip() for line in lines]
+            logger.info("Batched translation changed the line count, translating segments one by one")
+        translated = []
+        for segment in segments:
+            # Each fallback request counts against the quota on its own
+            self.rate_limiter.acquire(1)
+            translated.append(translator.translate(segment) or "")
+        return translated
+
+
+class StubTranslationBackend(TranslationBackend):
+    name = "stub"
+
+    def __init__(self, latency: float = TRANSLATION_STUB_LATENCY):
+        """Offline stand-in: tags each segment with the target language."""
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+        self.segments = 0
+
+    def translate_batch(self, segments: List[str], source: str, target: str) -> List[str]:
+        self.rate_limiter.acquire(1)
+        self.calls += 1
+        self.segments += len(segments)
+        time.sleep(self.latency)
+        return [f"[{target}] {segment}" for segment in segments]
+
+
+class Translator:
+    def __init__(self, backend: TranslationBackend):
+        """Segment-level cached translation; only cache misses reach the backend."""
+        self.backend = backend
+
+    def cache_key(self, segment: str, source: str, target: str) -> str:
+        return make_key("translation", self.backend.name, source, target, hash_bytes(segment.encode("utf-8")))
+
+    def _translate_batch(self, segments: List[str], source: str, target: str) -> List[str]:
+        with span("translate.batch", language=f"{source}-{target}", model=self.backend.name):
+            translated = self.backend.translate_batch(segments, source, target)
+        for segment, result in zip(segments, translated):
+            # An empty result is a failed request, not a translation; retry it next time
+            if result and result.strip():
+                store_cached("translation", self.cache_key(segment, source, target), result)
+        return translated
+
+    @staticmethod
+    def _batches(segments: List[str], max_chars: int) -> List[List[str]]:
+        batches, current, size = [], [], 0
+        for segment in segments:
+            if current and size + len(segment) + 1 > max_chars:
+                batches.append(current)
+                current, size = [], 0
+            current.append(segment)
+            size += len(segment) + 1
+        if current:
+            batches.append(current)
+        return batches
+
+    async def translate(self, text: str, source: str = "auto", target: str = "en") -> Tuple[str, Dict]:
+        """
+        Translate text line by line. Returns (translation, stats) where stats
+        counts segments served from the cache and sent to the backend.
+        """
+        lines = split_segments(text)
+        unique = list(dict.fromkeys(segment for line in lines for segment in line))
+        keys = {segment: self.cache_key(segment, source, target) for segment in unique}
+        # One read transaction for every segment, off the event loop
+        cached = await run_in_stage_pool("translate", lookup_cached_many, "translation", list(keys.values()))
+        translations = {segment: cached[key] for segment, key in keys.items() if key in cached}
+        misses = [segment for segment in unique if segment not in translations]
+
+        batches = self._batches(misses, TRANSLATION_BATCH_MAX_CHARS)
+        results = await asyncio.gather(*(
+            run_in_stage_pool("translate", self._translate_batch, batch, source, target) for batch in batches
+        ))
+        for batch, translated in zip(batches, results):
+            translations.update(zip(batch, translated))
+
+        output = "\n".join(" ".join(translations[segment] for segment in line) for line in lines)
+        stats = {
+            "segments": len(unique),
+            "cached": len(unique) - len(misses),
+            "translated": len(misses),
+            "requests": len(batches),
+        }
+        return output, stats
+
+
+_translators: Dict[str, Translator] = {}
+_translators_lock = threading.Lock()
+
+
+def _build_backend(name: str) -> TranslationBackend:
+    if name == "google":
+        return GoogleTranslationBackend()
+    if name == "stub":
+        return StubTranslationBackend()
+    raise ValueError(f"Unknown translation backend: {name}")
+
+
+def get_translator(name: Optional[str] = None) -> Translator:
+    """Shared translator by backend name (defaults to TRANSLATION_BACKEND)."""
+    name = (name or TRANSLATION_BACKEND).strip().lower()
+    with _translators_lock:
+        translator = _translators.get(name)
+        if translator is None:
+            translator = _translators[name] = Translator(_build_backend(name))
+        return translator
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.cache import make_key
+from app.jobs import run_in_stage_pool
+from app.lazy import lazy_import
+from app.metrics import span
+from app.tts_stub import StubTTSClient
+
+texttospeech = lazy_import("google.cloud.texttospeech")
+service_account = lazy_import("google.oauth2.service_account")
+
+logger = logging.getLogger(__name__)
+
+# Service account used for Text-to-Speech ("stub" client runs offline, see app.tts_stub)
+TTS_CREDENTIALS = os.getenv("TTS_CREDENTIALS", "credentials2.json")
+TTS_CLIENT = os.getenv("TTS_CLIENT", "google")
+TTS_LANGUAGE_CODE = os.getenv("TTS_LANGUAGE_CODE", "en-US")
+TTS_VOICE_NAME = os.getenv("TTS_VOICE_NAME", "en-US-Standard-C")
+
+# Text is synthesized in sentence groups of about this size, concurrently.
+# The API accepts up to 5000 bytes per request; smaller first groups mean
+# playback starts sooner.
+TTS_SEGMENT_MAX_CHARS = int(os.getenv("TTS_SEGMENT_MAX_CHARS", "400"))
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join("cache", "tts"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+SENTENCE_END = re.compile(r"(?<=[.;:!?\u00b7\u0387\u037e])\s+")
+
+
+def split_sentences(text: str, max_chars: int = TTS_SEGMENT_MAX_CHARS) -> List[str]:
+    """Group sentences into segments of at most max_chars; overlong sentences split at spaces."""
+    segments: List[str] = []
+    current = ""
+    for sentence in SENTENCE_END.split(" ".join(text.split())):
+        pieces = [sentence]
+        if len(sentence) > max_chars:
+            pieces, piece = [], ""
+            for word in sentence.split(" "):
+                if piece and len(piece) + 1 + len(word) > max_chars:
+                    pieces.append(piece)
+                    piece = word
+                else:
+                    piece = f"{piece} {word}" if piece else word
+            pieces.append(piece)
+        for piece in pieces:
+            if current and len(current) + 1 + len(piece) > max_chars:
+                segments.append(current)
+                current = piece
+            else:
+                current = f"{current} {piece}" if current else piece
+    if current:
+        segments.append(current)
+    return segments
+
+
+class AudioCache:
+    def __init__(self, directory: str = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_MAX_BYTES):
+        """
+        Synthesized audio on disk, one file per segment, evicted least
+        recently used first (file mtime is bumped on every hit).
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def set(self, key: str, data: bytes):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            # Overwriting a segment replaces its bytes rather than adding to them
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            self._total += len(data) - replaced
+            over = self._total > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = sorted(
+                (e for e in os.scandir(self.directory) if e.is_file() and e.name.endswith(".mp3")),
+                key=lambda e: e.stat().st_mtime,
+            )
+            total = sum(e.stat().st_size for e in entries)
+            for entry in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+            self._total = total
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "bytes": self._total, "max_bytes": self.max_bytes}
+
+
+class TTSService:
+    def __init__(self, client=None, cache: Optional[AudioCache] = None):
+        """Shared Text-to-Speech client plus the audio cache; the client is created once."""
+        self._client = client
+        self._client_lock = threading.Lock()
+        self.cache = cache or AudioCache()
+
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                if TTS_CLIENT == "stub":
+                    self._client = StubTTSClient()
+                else:
+                    credentials = service_account.Credentials.from_service_account_file(TTS_CREDENTIALS)
+                    self._client = texttospeech.TextToSpeechClient(credentials=credentials)
+            return self._client
+
+    @staticmethod
+    def cache_key(text: str, language_code: str, voice_name: str) -> str:
+        return make_key("tts", text, language_code, voice_name, "mp3")
+
+    def synthesize(self, text: str, language_code: str = TTS_LANGUAGE_CODE,
+                   voice_name: str = TTS_VOICE_NAME) -> bytes:
+        """MP3 for one segment, from the cache when possible."""
+        key = self.cache_key(text, language_code, voice_name)
+        audio = self.cache.get(key)
+        if audio is not None:
+            return audio
+        start = time.perf_counter()
+        with span("tts.synthesize", language=language_code, model=voice_name):
+            response = self.client.synthesize_speech(
+                input=texttospeech.SynthesisInput(text=text),
+                voice=texttospeech.VoiceSelectionParams(language_code=language_code, name=voice_name),
+                audio_config=texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3),
+            )
+        logger.debug(f"Synthesized {len(text)} chars in {time.perf_counter() - start:.2f}s")
+        self.cache.set(key, response.audio_content)
+        return response.audio_content
+
+    async def iter_audio(self, text: str, language_code: str = TTS_LANGUAGE_CODE,
+                         voice_name: str = TTS_VOICE_NAME) -> AsyncIterator[bytes]:
+        """
+        Yield MP3 audio segment by segment, in order. All segments are
+        synthesized concurrently on the tts pool; MP3 frames concatenate, so
+        the chunks form one playable stream.
+        """
+        tasks = [
+            asyncio.create_task(run_in_stage_pool("tts", self.synthesize, segment, language_code, voice_name))
+            for segment in split_sentences(text)
+        ]
+        try:
+            for task in tasks:
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def synthesize_all(self, text: str, language_code: str = TTS_LANGUAGE_CODE,
+                             voice_name: str = TTS_VOICE_NAME) -> bytes:
+        return b"".join([chunk async for chunk in self.iter_audio(text, language_code, voice_name)])
+
+
+# Singleton
+_tts_service: Optional[TTSService] = None
+_tts_service_lock = threading.Lock()
+
+
+def get_tts_service() -> TTSService:
+    global _tts_service
+    with _tts_service_lock:
+        if _tts_service is None:
+            _tts_service = TTSService()
+        return _tts_service
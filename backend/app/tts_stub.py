@@ -0,0 +1,40 @@
+import hashlib
+import os
+import struct
+import time
+from types import SimpleNamespace
+
+# Offline stand-in for google.cloud.texttospeech.TextToSpeechClient.
+# Enable with TTS_CLIENT=stub; it returns silent MP3 frames, more for longer text.
+STUB_LATENCY = float(os.getenv("TTS_STUB_LATENCY", "0"))
+
+# One MPEG-1 Layer III frame: 128 kbps, 44.1 kHz, mono, no padding (417 bytes)
+_FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0xC4])
+_FRAME = _FRAME_HEADER + bytes(417 - len(_FRAME_HEADER))
+# Roughly 26 ms of audio per frame; about one frame per character
+CHARS_PER_FRAME = 1
+
+
+def _id3_tag(owner: bytes, data: bytes) -> bytes:
+    """ID3v2.3 tag holding one PRIV frame, prepended so the output stays a valid MP3."""
+    body = owner + b"\x00" + data
+    frame = b"PRIV" + struct.pack(">I", len(body)) + b"\x00\x00" + body
+    # The tag size is syncsafe: 7 bits per byte
+    size = bytes((len(frame) >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    return b"ID3\x03\x00\x00" + size + frame
+
+
+class StubTTSClient:
+    def __init__(self, latency: float = STUB_LATENCY):
+        self.latency = latency
+        self.calls = 0
+        self.characters = 0
+
+    def synthesize_speech(self, input=None, voice=None, audio_config=None, **kwargs):
+        self.calls += 1
+        self.characters += len(input.text)
+        time.sleep(self.latency)
+        frames = max(1, len(input.text) // CHARS_PER_FRAME)
+        # Deterministic per text so cache behaviour is observable
+        digest = hashlib.sha256(input.text.encode("utf-8")).digest()[:8]
+        return SimpleNamespace(audio_content=_id3_tag(b"tts-stub", digest) + _FRAME * frames)
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import time
+from types import SimpleNamespace
+
+# Offline stand-in for google.cloud.vision.ImageAnnotatorClient.
+# Enable with VISION_CLIENT=stub; it returns deterministic text per image.
+STUB_LATENCY = float(os.getenv("VISION_STUB_LATENCY", "0"))
+STUB_TEXT = os.getenv("VISION_STUB_TEXT", "in principio erat verbum et verbum erat apud deum")
+
+
+# Share of stub words reported with low confidence
+STUB_UNCERTAIN_SHARE = float(os.getenv("VISION_STUB_UNCERTAIN_SHARE", "0.1"))
+SPACE, EOL_SURE_SPACE = 1, 3
+
+
+def _word(text: str, x: int, y: int, confidence: float, break_type: int) -> SimpleNamespace:
+    symbols = [
+        SimpleNamespace(
+            text=ch, confidence=confidence,
+            property=SimpleNamespace(detected_break=SimpleNamespace(type_=0)),
+        )
+        for ch in text
+    ]
+    symbols[-1].property.detected_break.type_ = break_type
+    vertices = [SimpleNamespace(x=x, y=y), SimpleNamespace(x=x + 10 * len(text), y=y + 20)]
+    return SimpleNamespace(symbols=symbols, confidence=confidence, bounding_box=SimpleNamespace(vertices=vertices))
+
+
+def _full_text(lines, digest: str) -> SimpleNamespace:
+    """full_text_annotation with one block per line; a fixed share of words comes back uncertain."""
+    blocks = []
+    for row, line in enumerate(lines):
+        words, x = [], 0
+        tokens = line.split()
+        for i, token in enumerate(tokens):
+            roll = int(hashlib.sha256(f"{digest}:{row}:{i}".encode()).hexdigest()[:4], 16) / 0xFFFF
+            confidence = 0.55 if roll < STUB_UNCERTAIN_SHARE else 0.97
+            words.append(_word(token, x, row * 30, confidence, EOL_SURE_SPACE if i == len(tokens) - 1 else SPACE))
+            x += 10 * (len(token) + 1)
+        blocks.append(SimpleNamespace(paragraphs=[SimpleNamespace(words=words)]))
+    return SimpleNamespace(pages=[SimpleNamespace(blocks=blocks)])
+
+
+def _annotation(content: bytes) -> SimpleNamespace:
+    digest = hashlib.sha256(content).hexdigest()[:8]
+    text = f"{STUB_TEXT}\n{digest}"
+    return SimpleNamespace(
+        text_annotations=[SimpleNamespace(description=text)],
+        full_text_annotation=_full_text(text.split("\n"), digest),
+        error=SimpleNamespace(message=""),
+    )
+
+
+class StubVisionClient:
+    def __init__(self, latency: float = STUB_LATENCY):
+        self.latency = latency
+        self.calls = 0
+        self.images = 0
+
+    def text_detection(self, image=None, **kwargs):
+        self.calls += 1
+        self.images += 1
+        time.sleep(self.latency)
+        return _annotation(image.content)
+
+    def batch_annotate_images(self, requests=None, **kwargs):
+        # One round trip for the whole batch, like the real API
+        self.calls += 1
+        self.images += len(requests)
+        time.sleep(self.latency)
+        return SimpleNamespace(responses=[_annotation(r.image.content) for r in requests])
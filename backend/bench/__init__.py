@@ -0,0 +1 @@
+"""Benchmark harness for the OCR pipeline; see bench/run.py."""
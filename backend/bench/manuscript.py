@@ -0,0 +1,82 @@
+import random
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Page sizes the benchmarks run at: phone photo, A4 at 300 dpi, A3 at 400 dpi
+RESOLUTIONS: Dict[str, Tuple[int, int]] = {
+    "small": (1240, 1754),
+    "a4-300dpi": (2480, 3508),
+    "a3-400dpi": (4677, 6614),
+}
+
+LATIN_WORDS = (
+    "in principio erat verbum et verbum erat apud deum et deus erat verbum hoc erat "
+    "in principio apud deum omnia per ipsum facta sunt et sine ipso factum est nihil "
+    "quod factum est in ipso vita erat et vita erat lux hominum et lux in tenebris lucet "
+    "dominus vobiscum et cum spiritu tuo gloria patri et filio et spiritui sancto"
+).split()
+
+
+def manuscript_text(words: int, seed: int = 0, line_words: int = 9) -> str:
+    """Latin-looking text with line breaks, deterministic per seed."""
+    rng = random.Random(seed)
+    chosen = [rng.choice(LATIN_WORDS) for _ in range(words)]
+    return "\n".join(" ".join(chosen[i:i + line_words]) for i in range(0, len(chosen), line_words))
+
+
+def generate_manuscript(width: int, height: int, seed: int = 0, skew: float = 1.5,
+                        shadow: bool = True, noise: float = 8.0) -> np.ndarray:
+    """
+    Grayscale page of dark text lines on parchment-toned paper with an
+    illumination gradient, sensor noise and a slight rotation, so every
+    preprocessing step has real work to do.
+    """
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width), 214, dtype=np.uint8)
+
+    scale = width / 1240
+    margin = int(90 * scale)
+    line_height = int(52 * scale)
+    font_scale = 1.05 * scale
+    thickness = max(1, int(2 * scale))
+    words = iter(manuscript_text(10_000, seed).split())
+    y = margin + line_height
+    while y < height - margin:
+        x = margin
+        while True:
+            word = next(words)
+            (w, _), _ = cv2.getTextSize(word, cv2.FONT_HERSHEY_COMPLEX, font_scale, thickness)
+            if x + w > width - margin:
+                break
+            cv2.putText(page, word, (x, y), cv2.FONT_HERSHEY_COMPLEX, font_scale, 40, thickness, cv2.LINE_AA)
+            x += w + int(18 * scale)
+        y += line_height
+
+    if shadow:
+        # Darker toward one corner, like a page photographed under a lamp
+        gx = np.linspace(0.65, 1.0, width, dtype=np.float32)
+        gy = np.linspace(0.8, 1.0, height, dtype=np.float32)
+        page = (page.astype(np.float32) * np.outer(gy, gx)).astype(np.uint8)
+    if noise:
+        grain = rng.normal(0, noise, page.shape).astype(np.float32)
+        page = np.clip(page.astype(np.float32) + grain, 0, 255).astype(np.uint8)
+    if skew:
+        M = cv2.getRotationMatrix2D((width / 2, height / 2), skew, 1.0)
+        page = cv2.warpAffine(page, M, (width, height), borderMode=cv2.BORDER_REPLICATE)
+    return page
+
+
+def write_manuscript(path: str, resolution: str = "a4-300dpi", seed: int = 0,
+                     size: Optional[Tuple[int, int]] = None) -> str:
+    width, height = size or RESOLUTIONS[resolution]
+    cv2.imwrite(path, generate_manuscript(width, height, seed))
+    return path
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    ok, buffer = cv2.imencode(".png", image)
+    if not ok:
+        raise ValueError("Unable to encode image")
+    return buffer.tobytes()
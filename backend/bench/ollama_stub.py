@@ -0,0 +1,78 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+# Text following the "RAW OCR:"/"OCR TEXT:" header of the correction prompts
+_OCR_BLOCK = re.compile(r"^[A-Z ]*OCR[^\n]*:\n(.*?)(?:\n\n[A-Z]{4,}[^\n]*:|\Z)", re.S | re.M)
+
+
+def _echo_text(prompt: str) -> str:
+    """Return the OCR text embedded in a correction prompt, as a perfect model would."""
+    matches = _OCR_BLOCK.findall(prompt)
+    return matches[-1].strip() if matches else prompt.strip()
+
+
+class OllamaStubServer:
+    def __init__(self, latency: float = 0.0, token_latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        """
+        Local HTTP stand-in for Ollama's /api/generate (streaming and not).
+        Each call waits `latency` seconds, then `token_latency` per word.
+        """
+        self.latency = latency
+        self.token_latency = token_latency
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if self.path != "/api/generate":
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                stub.requests += 1
+                tokens = re.findall(r"\S+\s*", _echo_text(body.get("prompt", "")))
+                time.sleep(stub.latency)
+                if not body.get("stream", True):
+                    time.sleep(stub.token_latency * len(tokens))
+                    payload = json.dumps({"model": body.get("model"), "response": "".join(tokens), "done": True}).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in tokens + [None]:
+                    time.sleep(stub.token_latency if token else 0)
+                    line = json.dumps({"response": token or "", "done": token is None}).encode() + b"\n"
+                    self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "OllamaStubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="ollama-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
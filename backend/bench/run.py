@@ -0,0 +1,425 @@
+"""
+Benchmark the OCR pipeline against local stand-ins for Vision, Ollama,
+Text-to-Speech and translation.
+
+    cd backend
+    python -m bench.run                                   # every suite, print a report
+    python -m bench.run --suites preprocess,pipeline --resolutions small
+    python -m bench.run --save bench/baselines/local.json
+    python -m bench.run --compare bench/baselines/local.json --tolerance 0.2
+
+Reports per-stage latency percentiles, throughput under concurrency and
+peak memory. --compare exits with status 1 when a p50/p90 latency grew,
+or a throughput dropped, by more than the tolerance. Baselines are
+machine-specific and not committed; record one locally first.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+SUITES = ("preprocess", "ocr", "correct", "analyze", "translate", "tts", "pipeline")
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds."""
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p90_ms": round(percentile(samples, 0.90) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Process resident-set high-water mark (not available on Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def timed(fn: Callable, iterations: int) -> Dict:
+    """Run fn repeatedly; latency summary plus the Python heap peak (tracemalloc)."""
+    samples = []
+    tracemalloc.start()
+    try:
+        for i in range(iterations):
+            start = time.perf_counter()
+            fn(i)
+            samples.append(time.perf_counter() - start)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"latency": summarize(samples), "peak_python_mb": round(peak / (1024 * 1024), 2)}
+
+
+def configure_environment(args, workdir: str, ollama_url: str):
+    """Point every external service at its stand-in; must run before app modules are imported."""
+    defaults = {
+        "RESULT_CACHE_ENABLED": "0",
+        "OCR_BACKEND": "stub",
+        "VISION_CLIENT": "stub",
+        "VISION_STUB_LATENCY": str(args.vision_latency),
+        "VISION_IMAGES_PER_MINUTE": "0",
+        "OLLAMA_BASE_URL": ollama_url,
+        "TTS_CLIENT": "stub",
+        "TTS_STUB_LATENCY": str(args.tts_latency),
+        "TTS_CACHE_DIR": os.path.join(workdir, "tts"),
+        "TRANSLATION_BACKEND": "stub",
+        "TRANSLATION_STUB_LATENCY": str(args.translation_latency),
+        "TRANSLATION_REQUESTS_PER_MINUTE": "0",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "LEMMA_INDEX_DIR": os.path.join(workdir, "index"),
+        "DOCUMENT_STORE_PATH": os.path.join(workdir, "documents.sqlite3"),
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+# Suites
+
+def bench_preprocess(args) -> Dict:
+    from bench.manuscript import RESOLUTIONS, generate_manuscript
+    from app.preprocess import PREPROCESS_TIERS, preprocess_array
+
+    results = {}
+    for resolution in args.resolutions:
+        image = generate_manuscript(*RESOLUTIONS[resolution], seed=1)
+        for tier in PREPROCESS_TIERS:
+            substeps: Dict[str, List[float]] = {}
+
+            def run(_):
+                timings: Dict[str, float] = {}
+                preprocess_array(image, tier, timings)
+                for step, seconds in timings.items():
+                    substeps.setdefault(step, []).append(seconds)
+
+            result = timed(run, args.iterations)
+            result["substeps"] = {step: summarize(values) for step, values in substeps.items()}
+            results[f"preprocess/{resolution}/{tier}"] = result
+    return results
+
+
+def bench_ocr(args) -> Dict:
+    from bench.manuscript import RESOLUTIONS, encode_png, generate_manuscript
+    from app.ocr_backends import get_ocr_backend
+
+    backend = get_ocr_backend("stub")
+    width, height = RESOLUTIONS[args.resolutions[0]]
+    page = encode_png(generate_manuscript(width, height, seed=2))
+    results = {"ocr/single": timed(lambda i: backend.detect_text(page + bytes([i % 256])), args.iterations)}
+    batch = [page + bytes([i]) for i in range(backend.batch_size)]
+    results[f"ocr/batch{len(batch)}"] = timed(lambda _: backend.ocr_many(batch), max(1, args.iterations // 2))
+    return results
+
+
+def _word_table(text: str, uncertain_share: float, seed: int):
+    """Word table for synthetic text with a fixed share of low-confidence words."""
+    import random
+    from app.ocr_words import WordTable
+
+    rng = random.Random(seed)
+    words = text.split()
+    confidence = [0.5 if rng.random() < uncertain_share else 0.95 for _ in words]
+    zeros = [0] * len(words)
+    return WordTable(words, confidence, confidence, [(0, 0, 0, 0)] * len(words), zeros, zeros, zeros, zeros,
+                     [" "] * len(words))
+
+
+def bench_correct(args) -> Dict:
+    from bench.manuscript import manuscript_text
+    from app.ocr_ai_processor import correct_text_with_ollama
+
+    from app import ocr_ai_processor
+    from app.cleanup import apply_rules
+
+    results = {}
+    for words in (60, 600, 2400):
+        results[f"correct/rules-{words}-words"] = timed(
+            lambda i: apply_rules(manuscript_text(words, seed=i), "latin"), args.iterations
+        )
+        # With OCR word confidences only the uncertain spans (3% of words) reach the LLM
+        results[f"correct/spans-{words}-words"] = timed(
+            lambda i: correct_text_with_ollama(
+                manuscript_text(words, seed=i), "latin", _word_table(manuscript_text(words, seed=i), 0.03, i)
+            ),
+            args.iterations,
+        )
+        # Clean synthetic pages pass the default quality gate
+        results[f"correct/gated-{words}-words"] = timed(
+            lambda i: correct_text_with_ollama(manuscript_text(words, seed=i), "latin"), args.iterations
+        )
+        skip_quality = ocr_ai_processor.CORRECTION_SKIP_QUALITY
+        try:
+            # The plain LLM path, with the gate off
+            ocr_ai_processor.CORRECTION_SKIP_QUALITY = 2.0
+            results[f"correct/{words}-words"] = timed(
+                lambda i: correct_text_with_ollama(manuscript_text(words, seed=i), "latin"), args.iterations
+            )
+        finally:
+            ocr_ai_processor.CORRECTION_SKIP_QUALITY = skip_quality
+    return results
+
+
+def bench_analyze(args) -> Dict:
+    from bench.manuscript import manuscript_text
+    from app.textProcessor import get_text_processor
+
+    processor = get_text_processor()
+    start = time.perf_counter()
+    processor.preload(["lat"])
+    results = {"analyze/load-lat": {"latency": summarize([time.perf_counter() - start])}}
+    for words in (60, 600):
+        results[f"analyze/{words}-words"] = timed(
+            lambda i: processor.analyze_text(manuscript_text(words, seed=i), "lat"), args.iterations
+        )
+    return results
+
+
+def bench_translate(args) -> Dict:
+    from bench.manuscript import manuscript_text
+    from app.translation import get_translator
+
+    translator = get_translator("stub")
+    return {
+        f"translate/{words}-words": timed(
+            lambda i: asyncio.run(translator.translate(manuscript_text(words, seed=i), "la", "en")),
+            args.iterations,
+        )
+        for words in (60, 600)
+    }
+
+
+def bench_tts(args) -> Dict:
+    from bench.manuscript import manuscript_text
+    from app.tts import get_tts_service
+
+    service = get_tts_service()
+    results = {}
+    for words in (30, 300):
+        # Seeds past the iteration count keep every passage a cache miss
+        results[f"tts/{words}-words"] = timed(
+            lambda i: asyncio.run(service.synthesize_all(manuscript_text(words, seed=10_000 + words + i))),
+            args.iterations,
+        )
+
+    async def first_chunk(text: str) -> float:
+        start = time.perf_counter()
+        chunks = service.iter_audio(text)
+        try:
+            await chunks.__anext__()
+        finally:
+            await chunks.aclose()
+        return time.perf_counter() - start
+
+    samples = [asyncio.run(first_chunk(manuscript_text(300, seed=20_000 + i))) for i in range(args.iterations)]
+    results["tts/300-words-first-chunk"] = {"latency": summarize(samples)}
+    return results
+
+
+def bench_pipeline(args) -> Dict:
+    import httpx
+    from bench.manuscript import RESOLUTIONS, encode_png, generate_manuscript
+    from app.main import app
+
+    width, height = RESOLUTIONS[args.resolutions[0]]
+    results = {}
+
+    async def run_level(concurrency: int, offset: int) -> Dict:
+        requests = max(concurrency, args.iterations)
+        # Distinct pages so no request is served from storage or caches
+        pages = [encode_png(generate_manuscript(width, height, seed=offset + i)) for i in range(requests)]
+        latencies: List[float] = []
+        stages: Dict[str, List[float]] = {}
+        failures = 0
+        semaphore = asyncio.Semaphore(concurrency)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def one(i: int):
+                nonlocal failures
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post(
+                        "/api/upload",
+                        files={"file": (f"page{i}.png", pages[i], "image/png")},
+                        data={"language": "lat"},
+                    )
+                    latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    failures += 1
+                    return
+                for stage, seconds in (response.json().get("timings") or {}).items():
+                    if seconds is not None:
+                        stages.setdefault(stage, []).append(seconds)
+
+            tracemalloc.start()
+            wall = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(requests)))
+            wall = time.perf_counter() - wall
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return {
+            "latency": summarize(latencies),
+            "throughput_rps": round(requests / wall, 3),
+            "failures": failures,
+            "stages": {stage: summarize(values) for stage, values in stages.items()},
+            "peak_python_mb": round(peak / (1024 * 1024), 2),
+        }
+
+    for n, concurrency in enumerate(args.concurrency):
+        results[f"pipeline/{args.resolutions[0]}/c{concurrency}"] = asyncio.run(run_level(concurrency, 1000 * (n + 1)))
+    return results
+
+
+SUITE_FUNCTIONS = {
+    "preprocess": bench_preprocess,
+    "ocr": bench_ocr,
+    "correct": bench_correct,
+    "analyze": bench_analyze,
+    "translate": bench_translate,
+    "tts": bench_tts,
+    "pipeline": bench_pipeline,
+}
+
+
+# Baselines
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Metrics that regressed by more than `tolerance` (a fraction) against the baseline."""
+    regressions = []
+    for name, current in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or "latency" not in current or "latency" not in previous:
+            continue
+        for metric in ("p50_ms", "p90_ms"):
+            old, new = previous["latency"].get(metric), current["latency"].get(metric)
+            if old and new > old * (1 + tolerance):
+                regressions.append(f"{name} {metric}: {old:.1f} -> {new:.1f} (+{(new / old - 1) * 100:.0f}%)")
+        old, new = previous.get("throughput_rps"), current.get("throughput_rps")
+        if old and new is not None and new < old * (1 - tolerance):
+            regressions.append(f"{name} throughput_rps: {old:.2f} -> {new:.2f} ({(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_report(report: Dict):
+    print(f"{'benchmark':<44} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'rps':>8} {'peak MB':>8}")
+    for name, result in report["results"].items():
+        if "skipped" in result:
+            print(f"{name:<44} skipped: {result['skipped']}")
+            continue
+        latency = result["latency"]
+        rps = result.get("throughput_rps")
+        peak = result.get("peak_python_mb")
+        print(
+            f"{name:<44} {latency['p50_ms']:>10.1f} {latency['p90_ms']:>10.1f} {latency['p99_ms']:>10.1f} "
+            f"{rps if rps is not None else '':>8} {peak if peak is not None else '':>8}"
+        )
+    print(f"peak RSS: {report['meta']['peak_rss_mb']} MB")
+
+
+def parse_args(argv=None):
+    from bench.manuscript import RESOLUTIONS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suites", default=",".join(SUITES), help="comma-separated subset of " + ", ".join(SUITES))
+    parser.add_argument("--resolutions", default="small,a4-300dpi", help="comma-separated subset of " + ", ".join(RESOLUTIONS))
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--concurrency", default="1,4,16", help="pipeline concurrency levels")
+    parser.add_argument("--vision-latency", type=float, default=0.3, help="seconds per Vision call")
+    parser.add_argument("--ollama-latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--ollama-token-latency", type=float, default=0.005, help="seconds per generated token")
+    parser.add_argument("--tts-latency", type=float, default=0.2, help="seconds per synthesis call")
+    parser.add_argument("--translation-latency", type=float, default=0.2, help="seconds per translation request")
+    parser.add_argument("--save", help="write the report as a JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a regression is reported")
+    args = parser.parse_args(argv)
+    args.suites = [s for s in args.suites.split(",") if s]
+    args.resolutions = [r for r in args.resolutions.split(",") if r]
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+    unknown = [s for s in args.suites if s not in SUITES] + [r for r in args.resolutions if r not in RESOLUTIONS]
+    if unknown:
+        parser.error(f"unknown suite or resolution: {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None) -> int:
+    from bench.ollama_stub import OllamaStubServer
+
+    args = parse_args(argv)
+    ollama = OllamaStubServer(args.ollama_latency, args.ollama_token_latency).start()
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        configure_environment(args, workdir, ollama.url)
+        report = {
+            "meta": {
+                "revision": _git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "args": {k: v for k, v in vars(args).items() if k not in ("save", "compare")},
+            },
+            "results": {},
+        }
+        for suite in args.suites:
+            print(f"running {suite}...", file=sys.stderr)
+            try:
+                report["results"].update(SUITE_FUNCTIONS[suite](args))
+            except Exception as e:
+                # Missing optional pieces (e.g. CLTK models) skip a suite, not the run
+                report["results"][suite] = {"skipped": f"{type(e).__name__}: {e}"}
+        report["meta"]["peak_rss_mb"] = peak_rss_mb()
+    ollama.stop()
+
+    print_report(report)
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline written to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"no regressions beyond {args.tolerance:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""
+Load test for the multi-worker deployment: uploads through the HTTP API
+while the pipeline stages run in stage workers taken from the shared job
+queue (app.job_queue, app.stage_worker), once per stage worker count.
+
+    cd backend
+    python -m bench.scale                                  # 1, 2 and 4 workers per stage
+    python -m bench.scale --workers 1,2,4,8 --documents 48 --clients 16
+    python -m bench.scale --scale ocr,correct              # scale only these stages
+    python -m bench.scale --min-speedup 1.5                # exit 1 when scaling falls short
+
+Every run gets a fresh working directory (uploads, caches, queue), local
+stand-ins for Vision and Ollama with the given latencies, `--web-workers`
+uvicorn processes and, for each queued stage, N stage worker processes
+(1 for stages not in --scale). Documents are distinct synthetic pages, so
+nothing is served from a cache. With --in-process the same load is also
+run with the queue off, as the single-host baseline.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from bench.run import summarize
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUEUED_STAGES = ("preprocess", "ocr", "correct", "analyze")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _environment(args, workdir: str, ollama_url: str, queue: bool) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")])),
+        "JOB_QUEUE_ENABLED": "1" if queue else "0",
+        "JOB_QUEUE_PATH": os.path.join(workdir, "queue.sqlite3"),
+        "RESULT_CACHE_ENABLED": "0",
+        "OCR_BACKEND": "stub",
+        "VISION_CLIENT": "stub",
+        "VISION_STUB_LATENCY": str(args.vision_latency),
+        "VISION_IMAGES_PER_MINUTE": "0",
+        "OLLAMA_BASE_URL": ollama_url,
+        "TTS_CLIENT": "stub",
+        "TRANSLATION_BACKEND": "stub",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "TTS_CACHE_DIR": os.path.join(workdir, "tts"),
+        "LEMMA_INDEX_DIR": os.path.join(workdir, "index"),
+        "DOCUMENT_STORE_PATH": os.path.join(workdir, "documents.sqlite3"),
+        "LOG_LEVEL": "WARNING",
+    })
+    return env
+
+
+def _wait_ready(url: str, server: subprocess.Popen, timeout: float = 60.0):
+    import httpx
+
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("web server exited during startup")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise TimeoutError(f"no response on {url} within {timeout}s")
+
+
+def _stop(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run_load(args, images: List[bytes], workers: int, queue: bool) -> Dict:
+    """Start a deployment, upload every image with args.clients at a time, return throughput and latency."""
+    import httpx
+    from bench.ollama_stub import OllamaStubServer
+
+    ollama = OllamaStubServer(args.ollama_latency, args.ollama_token_latency).start()
+    processes: List[subprocess.Popen] = []
+    with tempfile.TemporaryDirectory(prefix="bench-scale-") as workdir:
+        env = _environment(args, workdir, ollama.url, queue)
+        port = _free_port()
+        try:
+            web = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+                 "--workers", str(args.web_workers), "--log-level", "warning"],
+                cwd=workdir, env=env,
+            )
+            processes.append(web)
+            if queue:
+                for stage in QUEUED_STAGES:
+                    for _ in range(workers if stage in args.scale else 1):
+                        processes.append(subprocess.Popen(
+                            [sys.executable, "-m", "app.stage_worker", "--stages", stage,
+                             # CLTK is not thread-safe, so analyze workers take one task at a time
+                             "--concurrency", str(1 if stage == "analyze" else args.worker_concurrency)],
+                            cwd=workdir, env=env,
+                        ))
+            base = f"http://127.0.0.1:{port}"
+            _wait_ready(f"{base}/", web)
+
+            with httpx.Client(base_url=base, timeout=600,
+                              limits=httpx.Limits(max_connections=args.clients)) as client:
+                def upload(i: int):
+                    start = time.perf_counter()
+                    response = client.post("/api/upload", files={"file": (f"page{i}.png", images[i], "image/png")},
+                                           data={"language": "lat"})
+                    return time.perf_counter() - start, response.status_code == 200 and response.json().get("success")
+
+                with ThreadPoolExecutor(args.clients) as pool:
+                    # Workers import OpenCV and build clients on their first task
+                    list(pool.map(upload, range(len(images) - args.documents)))
+                    start = time.perf_counter()
+                    results = list(pool.map(upload, range(len(images) - args.documents, len(images))))
+                    elapsed = time.perf_counter() - start
+        finally:
+            _stop(processes)
+            ollama.stop()
+
+    latencies = [seconds for seconds, _ in results]
+    return {
+        "mode": "queue" if queue else "in-process",
+        "stage_workers": workers if queue else 0,
+        "documents": len(results),
+        "errors": sum(1 for _, ok in results if not ok),
+        "seconds": round(elapsed, 3),
+        "docs_per_second": round(len(results) / elapsed, 3),
+        "latency": summarize(latencies),
+    }
+
+
+def print_report(report: Dict):
+    print(f"{'mode':<12} {'workers':>8} {'docs/s':>8} {'speedup':>8} {'p50 ms':>10} {'p90 ms':>10} {'errors':>7}")
+    base = next((r["docs_per_second"] for r in report["runs"] if r["mode"] == "queue"), None)
+    for run in report["runs"]:
+        speedup = f"{run['docs_per_second'] / base:.2f}x" if base and run["mode"] == "queue" else ""
+        print(f"{run['mode']:<12} {run['stage_workers'] or '':>8} {run['docs_per_second']:>8.2f} {speedup:>8} "
+              f"{run['latency']['p50_ms']:>10.0f} {run['latency']['p90_ms']:>10.0f} {run['errors']:>7}")
+
+
+def main(argv=None) -> int:
+    from bench.manuscript import RESOLUTIONS, encode_png, generate_manuscript
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="stage worker processes per scaled stage, one run each")
+    parser.add_argument("--scale", default=",".join(QUEUED_STAGES), help="stages whose workers are scaled")
+    parser.add_argument("--worker-concurrency", type=int, default=1, help="tasks each stage worker runs at once (analyze: always 1)")
+    parser.add_argument("--web-workers", type=int, default=2, help="uvicorn worker processes")
+    parser.add_argument("--documents", type=int, default=24, help="uploads per run")
+    parser.add_argument("--warmup", type=int, default=4, help="uploads before measuring")
+    parser.add_argument("--clients", type=int, default=12, help="concurrent uploads")
+    parser.add_argument("--resolution", default="small", choices=sorted(RESOLUTIONS))
+    parser.add_argument("--vision-latency", type=float, default=0.3, help="seconds per Vision call")
+    parser.add_argument("--ollama-latency", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--ollama-token-latency", type=float, default=0.002, help="seconds per generated token")
+    parser.add_argument("--in-process", action="store_true", help="also run with the queue off, as a baseline")
+    parser.add_argument("--min-speedup", type=float, help="exit 1 when the largest run is not this much faster than the smallest")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args(argv)
+    counts = [int(w) for w in args.workers.split(",") if w]
+    args.scale = [s for s in args.scale.split(",") if s]
+    unknown = [s for s in args.scale if s not in QUEUED_STAGES]
+    if unknown:
+        parser.error(f"unknown stage: {', '.join(unknown)}")
+
+    width, height = RESOLUTIONS[args.resolution]
+    images = [encode_png(generate_manuscript(width, height, seed)) for seed in range(args.warmup + args.documents)]
+    report = {"args": vars(args), "cpus": os.cpu_count(), "runs": []}
+    if args.in_process:
+        print("running in-process baseline...", file=sys.stderr)
+        report["runs"].append(run_load(args, images, 0, queue=False))
+    for workers in counts:
+        print(f"running with {workers} worker(s) per stage...", file=sys.stderr)
+        report["runs"].append(run_load(args, images, workers, queue=True))
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    queued = [r for r in report["runs"] if r["mode"] == "queue"]
+    if args.min_speedup and len(queued) > 1:
+        speedup = queued[-1]["docs_per_second"] / queued[0]["docs_per_second"]
+        if speedup < args.min_speedup:
+            print(f"speedup {speedup:.2f}x is below {args.min_speedup:.2f}x")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Startup budget check: how long a fresh worker takes to import the app and
+answer its first request, and which heavy SDKs it loaded on the way.
+
+    cd backend
+    python -m bench.startup                       # report
+    python -m bench.startup --budget 1.0          # exit 1 when over budget
+    python -m bench.startup --no-serve            # import only, no uvicorn
+
+Each measurement runs in a new interpreter, so nothing is already imported.
+Exits with status 1 when importing app.main or the first response on / takes
+longer than the budget, or when a module in HEAVY_MODULES is imported
+eagerly (they must load on first use, see app.lazy).
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# SDKs and libraries that must not be imported while the app starts
+HEAVY_MODULES = (
+    "cv2",
+    "numpy",
+    "deep_translator",
+    "google.cloud.vision",
+    "google.cloud.texttospeech",
+    "google.generativeai",
+    "pytesseract",
+    "fitz",
+    "cltk",
+    "torch",
+)
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def _environment(workdir: str) -> Dict[str, str]:
+    """Stand-ins for external services, so startup never waits on the network."""
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")])),
+        "OCR_BACKEND": "stub",
+        "VISION_CLIENT": "stub",
+        "TTS_CLIENT": "stub",
+        "TRANSLATION_BACKEND": "stub",
+        "TTS_CACHE_DIR": os.path.join(workdir, "tts"),
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "LEMMA_INDEX_DIR": os.path.join(workdir, "index"),
+        "RESULT_CACHE_PATH": os.path.join(workdir, "cache.sqlite3"),
+        "DOCUMENT_STORE_PATH": os.path.join(workdir, "documents.sqlite3"),
+        "LOG_LEVEL": "WARNING",
+    })
+    return env
+
+
+def measure_import(env: Dict[str, str], workdir: str) -> Dict:
+    """Seconds to import app.main in a new interpreter, plus the heavy modules it pulled in."""
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT % (HEAVY_MODULES,)],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    result["process_seconds"] = time.perf_counter() - start
+    return result
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_first_response(env: Dict[str, str], workdir: str, timeout: float = 30.0) -> float:
+    """Seconds from launching uvicorn to the first successful GET /."""
+    port = _free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited: {server.stderr.read().decode(errors='replace')[-2000:]}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"no response on / within {timeout}s")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def check(report: Dict, budget: float) -> List[str]:
+    """Budget violations in the report."""
+    failures = []
+    seconds = report["import"]["seconds"]
+    if seconds > budget:
+        failures.append(f"import app.main took {seconds:.3f}s (budget {budget:.3f}s)")
+    if report["import"]["loaded"]:
+        failures.append(f"imported at startup: {', '.join(report['import']['loaded'])}")
+    first = report.get("first_response_seconds")
+    if first is not None and first > budget:
+        failures.append(f"first response on / took {first:.3f}s (budget {budget:.3f}s)")
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds allowed for the import and the first response")
+    parser.add_argument("--repeat", type=int, default=3, help="import measurements; the fastest counts")
+    parser.add_argument("--no-serve", action="store_true", help="skip the uvicorn first-response measurement")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="bench-startup-") as workdir:
+        env = _environment(workdir)
+        # The first run also warms the OS file cache; the minimum is the stable number
+        runs = [measure_import(env, workdir) for _ in range(max(1, args.repeat))]
+        report = {"import": min(runs, key=lambda r: r["seconds"]), "import_runs": [round(r["seconds"], 4) for r in runs]}
+        if not args.no_serve:
+            report["first_response_seconds"] = measure_first_response(env, workdir)
+
+    failures = check(report, args.budget)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import app.main: {report['import']['seconds'] * 1000:.0f} ms "
+              f"(runs: {', '.join(f'{s * 1000:.0f}' for s in report['import_runs'])} ms)")
+        if "first_response_seconds" in report:
+            print(f"first response on /: {report['first_response_seconds'] * 1000:.0f} ms")
+        print(f"heavy modules at startup: {', '.join(report['import']['loaded']) or 'none'}")
+    if failures:
+        print("over budget:")
+        for line in failures:
+            print(f"  {line}")
+        return 1
+    print(f"within the {args.budget:.2f}s startup budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
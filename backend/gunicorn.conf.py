@@ -0,0 +1,35 @@
+# Production serving: gunicorn -c gunicorn.conf.py app.main:app
+# With JOB_QUEUE_ENABLED=1 the pipeline stages run in separate stage workers
+# (python -m app.stage_worker, see there) and these workers only serve HTTP.
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Import the app (and build the CLTK pipelines) once in the master
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+graceful_timeout = 30
+
+
+def on_starting(server):
+    """Build CLTK pipelines before forking so workers share them copy-on-write."""
+    # Settings are read at import time; load .env before the first app import
+    from dotenv import load_dotenv
+    load_dotenv()
+    from app.job_queue import is_queued
+    if is_queued("analyze"):
+        server.log.info("CLTK preload skipped: analysis runs in stage workers")
+    else:
+        from app.textProcessor import get_text_processor
+        status = get_text_processor().preload()
+        server.log.info(f"CLTK preload: {status}")
+    # App modules import OpenCV and numpy lazily (see app.lazy); load them
+    # here so workers share them instead of each importing its own copy
+    import cv2  # noqa: F401
+    import numpy  # noqa: F401
+    # Move everything allocated so far out of the GC's reach; otherwise the
+    # first collection in each worker touches (and copies) the shared pages
+    gc.freeze()
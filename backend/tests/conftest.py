@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the backend as `app`, like uvicorn and the stage workers do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
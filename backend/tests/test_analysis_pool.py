@@ -0,0 +1,32 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import analysis_pool
+
+
+@pytest.fixture(autouse=True)
+def thread_pool(monkeypatch):
+    # Same code path as the process pool, without spawning interpreters
+    with ThreadPoolExecutor(2) as pool:
+        monkeypatch.setattr(analysis_pool, "get_analysis_pool", lambda: pool)
+        yield
+
+
+def test_unsupported_language_is_a_failure():
+    (result,) = asyncio.run(analysis_pool.analyze_documents([{"id": "d1", "text": "verbum", "language": "xyz"}]))
+    assert result == {"id": "d1", "success": False, "language": "xyz", "error": "Language 'xyz' not supported"}
+
+
+def test_results_keep_the_input_order(monkeypatch):
+    def analyze(text, language, incremental):
+        if language == "boom":
+            raise RuntimeError("worker died")
+        return [{"word": w, "lemma": w} for w in text.split()]
+
+    monkeypatch.setattr(analysis_pool, "_analyze_document", analyze)
+    documents = [{"id": "a", "text": "in principio"}, {"id": "b", "text": "x", "language": "boom"}]
+    first, second = asyncio.run(analysis_pool.analyze_documents(documents))
+    assert first["id"] == "a" and first["success"] and len(first["text_analysis"]) == 2
+    assert second == {"id": "b", "success": False, "error": "worker died"}
@@ -0,0 +1,45 @@
+import pytest
+
+from app import cache
+from app.cache import MISS, ResultCache, lookup_cached, lookup_cached_many, store_cached
+
+
+@pytest.fixture
+def result_cache(tmp_path, monkeypatch):
+    result_cache = ResultCache(str(tmp_path / "results.sqlite3"))
+    monkeypatch.setattr(cache, "CACHE_ENABLED", True)
+    monkeypatch.setattr(cache, "get_result_cache", lambda: result_cache)
+    return result_cache
+
+
+def test_round_trip(result_cache):
+    assert lookup_cached("ocr", "k") is MISS
+    store_cached("ocr", "k", {"text": "verbum"})
+    assert lookup_cached("ocr", "k") == {"text": "verbum"}
+    assert result_cache.stats()["namespaces"]["ocr"] == {"hits": 1, "misses": 1}
+
+
+def test_cached_none_is_not_a_miss(result_cache):
+    store_cached("ocr", "k", None)
+    assert lookup_cached("ocr", "k") is None
+
+
+def test_unreadable_cache_is_a_miss(result_cache):
+    store_cached("ocr", "k", "verbum")
+    result_cache._conn.close()
+    assert lookup_cached("ocr", "k") is MISS
+    # Writes fail quietly too
+    store_cached("ocr", "k", "verbum")
+
+
+def test_lookup_many(result_cache):
+    for i in range(3):
+        store_cached("translation", f"k{i}", f"v{i}")
+    keys = [f"k{i}" for i in range(1200)] + ["k0"]
+    assert lookup_cached_many("translation", keys) == {"k0": "v0", "k1": "v1", "k2": "v2"}
+    assert result_cache.stats()["namespaces"]["translation"] == {"hits": 3, "misses": 1197}
+
+
+def test_lookup_many_unreadable_cache(result_cache):
+    result_cache._conn.close()
+    assert lookup_cached_many("translation", ["k0"]) == {}
@@ -0,0 +1,43 @@
+from app.chunking import split_text_into_chunks, stitch_chunks
+
+PAGE = "\n\n".join(
+    "\n".join(f"paragraph {p} line {l} in principio erat verbum" for l in range(6)) for p in range(5)
+)
+
+
+def test_short_text_is_one_chunk():
+    assert split_text_into_chunks("in principio", 100) == ["in principio"]
+
+
+def test_chunks_respect_the_limit_plus_overlap():
+    chunks = split_text_into_chunks(PAGE, 300)
+    assert len(chunks) > 1
+    overlap = 2 * max(len(line) + 1 for line in PAGE.split("\n"))
+    assert all(len(chunk) <= 300 + overlap for chunk in chunks)
+
+
+def test_each_chunk_repeats_the_previous_tail():
+    chunks = split_text_into_chunks(PAGE, 300)
+    for previous, following in zip(chunks, chunks[1:]):
+        tail = [line for line in previous.split("\n") if line][-2:]
+        head = [line for line in following.split("\n") if line][:2]
+        assert head == tail
+
+
+def test_stitch_round_trips():
+    for limit in (120, 300, 700):
+        assert stitch_chunks(split_text_into_chunks(PAGE, limit)) == PAGE
+
+
+def test_stitch_tolerates_a_reworded_overlap():
+    chunks = ["alpha\nbeta line\ngamma line", "beta  line\nGamma line\ndelta"]
+    assert stitch_chunks(chunks) == "alpha\nbeta line\ngamma line\ndelta"
+
+
+def test_stitch_keeps_new_lines_that_only_look_alike():
+    chunks = ["alpha\nbeta", "gamma\ndelta"]
+    assert stitch_chunks(chunks) == "alpha\nbeta\ngamma\ndelta"
+
+
+def test_stitch_empty():
+    assert stitch_chunks([]) == ""
@@ -0,0 +1,47 @@
+import pytest
+
+from app.cleanup import apply_rules
+
+
+@pytest.mark.parametrize("text, language, expected", [
+    ("DNS ſanctus", "latin", "DOMINUS sanctus"),
+    ("dn̄s venit", "latin", "dominus venit"),
+    ("7 ꝥ cyning", "old_english", "and þæt cyning"),
+    ("ΘΣ ϲοφια", "greek", "ΘΕΟΣ σοφια"),
+    ("dei | gratia", "sanskrit", "dei । gratia"),
+])
+def test_abbreviations_and_character_maps(text, language, expected):
+    assert apply_rules(text, language).text == expected
+
+
+def test_lowercase_abbreviation_without_a_mark_is_a_word():
+    assert apply_rules("dns", "latin").fixes == {}
+
+
+def test_homoglyphs_only_inside_mixed_script_words():
+    result = apply_rules("Rοma", "latin")  # Greek omicron
+    assert result.text == "Roma"
+    assert result.fixes == {"homoglyphs": 1}
+    assert apply_rules("λόγος", "greek").fixes == {}
+
+
+def test_merged_words_are_split():
+    result = apply_rules("dominusnoster venit", "latin")
+    assert result.text == "dominus noster venit"
+    assert result.fixes == {"splits": 1}
+
+
+def test_clean_long_words_are_not_split():
+    assert apply_rules("propterea", "latin").text == "propterea"
+
+
+def test_stray_symbols_removed_and_quality_scored():
+    result = apply_rules("dom1nus a*b", "latin")
+    assert result.text == "dom1nus ab"
+    assert result.words == 2
+    assert result.quality == pytest.approx(0.5)
+
+
+def test_clean_text_has_full_quality():
+    assert apply_rules("in principio erat verbum", "latin").quality == 1.0
+    assert apply_rules("", "latin").quality == 1.0
@@ -0,0 +1,84 @@
+import re
+
+import pytest
+
+from app import ocr_ai_processor
+from app.ocr_words import WordTable
+
+VERSE = ("in principio erat verbum et verbum erat apud deum et deus erat verbum hoc erat in principio apud deum "
+         "omnia per ipsum facta sunt et sine ipso factum est nihil quod factum est").split()
+
+
+def page(words: int, every: int) -> WordTable:
+    """A page of `words` words, one in `every` uncertain and misread."""
+    text = [VERSE[i % len(VERSE)] for i in range(words)]
+    uncertain = [i % every == every // 2 for i in range(words)]
+    text = [w[:-1] + "1" if doubt else w for w, doubt in zip(text, uncertain)]
+    return WordTable(
+        words=text,
+        confidence=[0.4 if doubt else 0.95 for doubt in uncertain],
+        breaks=[" "] * (words - 1) + [""],
+    )
+
+
+@pytest.fixture
+def prompts(monkeypatch):
+    """Prompts sent to Ollama; the fake model answers with the raw text, digits fixed."""
+    sent = []
+
+    def fake_ollama(prompt, model=ocr_ai_processor.OLLAMA_MODEL):
+        sent.append(prompt)
+        raw = prompt.split("RAW OCR:\n", 1)[1].split("\n\nCRITICAL", 1)[0]
+        return re.sub(r"(?<=[a-z])1", "m", raw)
+
+    monkeypatch.setattr(ocr_ai_processor, "call_ollama", fake_ollama)
+    return sent
+
+
+@pytest.mark.parametrize("words", [600, 2400])
+def test_span_correction_is_cheaper_than_the_whole_page(prompts, words):
+    table = page(words, 33)
+    spans = ocr_ai_processor.uncertain_spans(table, "latin")
+    assert spans
+    text, complete = ocr_ai_processor._correct_spans(table, spans, "latin")
+    span_calls, span_chars = len(prompts), sum(map(len, prompts))
+
+    prompts.clear()
+    for chunk in ocr_ai_processor.split_text_into_chunks(table.text(), ocr_ai_processor.CHUNK_MAX_CHARS):
+        ocr_ai_processor._route_correction(chunk, "latin")
+    full_calls, full_chars = len(prompts), sum(map(len, prompts))
+
+    assert complete
+    assert "1" not in text
+    assert span_calls < full_calls
+    assert span_chars < full_chars
+
+
+def test_many_spans_fall_back_to_the_whole_page():
+    # Context windows cover the whole page, so span prompts would be longer
+    assert ocr_ai_processor.uncertain_spans(page(600, 8), "latin") is None
+
+
+def test_missing_answers_are_not_complete(prompts, monkeypatch):
+    monkeypatch.setattr(ocr_ai_processor, "call_ollama", lambda prompt, model=None: "[1] in principio erat")
+    table = page(600, 33)
+    spans = ocr_ai_processor.uncertain_spans(table, "latin")
+    _, complete = ocr_ai_processor._correct_spans(table, spans, "latin")
+    assert not complete
+
+
+def test_parse_numbered():
+    answer = "[1] in principio\n[3]  erat\nverbum\n[2] et\n[9] extra\n[1] again"
+    assert ocr_ai_processor._parse_numbered(answer, 3) == {1: "in principio", 2: "et", 3: "erat verbum"}
+
+
+def test_clean_chunk_skips_the_model(prompts):
+    text, ok = ocr_ai_processor._correct_chunk(" ".join(VERSE * 5), "latin")
+    assert ok and text == " ".join(VERSE * 5)
+    assert prompts == []
+
+
+def test_dirty_chunk_goes_to_the_model(prompts):
+    words = page(100, 5)
+    text, ok = ocr_ai_processor._correct_chunk(words.text(), "latin")
+    assert ok and len(prompts) == 1
@@ -0,0 +1,75 @@
+import pytest
+
+from app.document_store import DOCUMENT_FIELDS, DocumentStore, InvalidCursorError, decode_cursor, encode_cursor
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DocumentStore(str(tmp_path / "documents.sqlite3"))
+    for i in range(7):
+        pages = [{"page": p, "success": p != 3, "accurate_text": f"doc {i} page {p}"} for p in range(1, 6)]
+        store.save_document(f"doc{i}", f"sha{i}", f"file{i}.pdf", pages, language="latin" if i % 2 else "greek")
+    return store
+
+
+def collect(fetch, limit):
+    """Every item across pages, and how many pages it took."""
+    items, cursor, pages = [], None, 0
+    while True:
+        batch, cursor = fetch(limit, cursor)
+        items += batch
+        pages += 1
+        if cursor is None:
+            return items, pages
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(42)) == 42
+    assert decode_cursor(None) is None
+
+
+@pytest.mark.parametrize("cursor", ["nonsense", "W10", encode_cursor(1)[:-1] + "!"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7, 50])
+def test_documents_newest_first_across_pages(store, limit):
+    documents, pages = collect(lambda n, c: store.list_documents(["id"], n, c), limit)
+    assert [d["id"] for d in documents] == [f"doc{i}" for i in reversed(range(7))]
+    assert pages == -(-7 // limit)
+
+
+def test_filters_apply_on_every_page(store):
+    documents, _ = collect(lambda n, c: store.list_documents(["id", "language"], n, c, language="latin"), 2)
+    assert [d["id"] for d in documents] == ["doc5", "doc3", "doc1"]
+
+
+def test_cursor_is_stable_while_documents_are_added(store):
+    first, cursor = store.list_documents(["id"], 3)
+    store.save_document("doc7", "sha7", "file7.pdf", [])
+    rest, _ = store.list_documents(["id"], 10, cursor)
+    assert [d["id"] for d in first + rest] == [f"doc{i}" for i in reversed(range(7))]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 5])
+def test_pages_in_order_across_pages(store, limit):
+    pages, _ = collect(lambda n, c: store.list_pages("doc0", ["page", "accurate_text"], n, c), limit)
+    assert [p["page"] for p in pages] == [1, 2, 3, 4, 5]
+    assert pages[0]["accurate_text"] == "doc 0 page 1"
+
+
+def test_only_requested_fields(store):
+    (document,), _ = store.list_documents(["id", "status"], 1)
+    assert document == {"id": "doc6", "status": "partial"}
+    assert set(store.get_document("doc0", list(DOCUMENT_FIELDS))) == set(DOCUMENT_FIELDS)
+
+
+def test_translations_and_delete(store):
+    store.save_translation("doc0", 2, "latin", "en", "the word")
+    page = store.get_page("doc0", 2, ["page", "translations"])
+    assert [t["text"] for t in page["translations"]] == ["the word"]
+    assert store.delete_document("doc0")
+    assert store.list_pages("doc0", ["page"]) == ([], None)
+    assert not store.delete_document("doc0")
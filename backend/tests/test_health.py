@@ -0,0 +1,49 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import job_queue
+from app.job_queue import JobQueue
+from app.routers import health
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    queue = JobQueue(str(tmp_path / "queue.sqlite3"))
+    monkeypatch.setattr(job_queue, "JOB_QUEUE_ENABLED", True)
+    monkeypatch.setattr(health, "get_job_queue", lambda: queue)
+    return queue
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(health.router, prefix="/api")
+    return TestClient(app)
+
+
+def test_queued_analysis_is_ready_once_a_worker_is_up(queue, client):
+    # Web workers never load CLTK with analysis queued, so that must not matter
+    response = client.get("/api/ready")
+    assert response.status_code == 503
+    assert response.json()["analyze_workers"] == 0
+
+    queue.register_worker("host:1", ["analyze"])
+    response = client.get("/api/ready")
+    assert response.status_code == 200
+    assert response.json()["ready"]
+
+
+def test_workers_for_other_stages_do_not_count(queue, client):
+    queue.register_worker("host:1", ["ocr", "correct"])
+    assert client.get("/api/ready").status_code == 503
+
+
+def test_stopped_and_silent_workers_do_not_count(queue, client, monkeypatch):
+    queue.register_worker("host:1", ["analyze"])
+    queue.unregister_worker("host:1")
+    assert client.get("/api/ready").status_code == 503
+
+    queue.register_worker("host:2", ["analyze"])
+    monkeypatch.setattr(job_queue, "JOB_QUEUE_LEASE_SECONDS", -1)
+    assert client.get("/api/ready").status_code == 503
@@ -0,0 +1,84 @@
+import pytest
+
+from app import job_queue
+from app.job_queue import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "queue.sqlite3"))
+
+
+def test_claim_takes_the_oldest_task_of_its_stages(queue):
+    first = queue.submit("ocr", "app.x:f", [1], {"k": "v"})
+    queue.submit("analyze", "app.x:g")
+    second = queue.submit("ocr", "app.x:f", [2])
+    assert queue.claim(["ocr"], "w1") == (first, "app.x:f", [1], {"k": "v"})
+    assert queue.claim(["ocr"], "w2")[0] == second
+    assert queue.claim(["ocr"], "w3") is None
+
+
+def test_complete_and_take_results(queue):
+    task_id = queue.submit("ocr", "app.x:f")
+    queue.claim(["ocr"], "w1")
+    assert queue.take_results([task_id]) == []
+    assert queue.complete(task_id, {"text": "verbum"}, "w1")
+    assert queue.take_results([task_id]) == [(task_id, "done", {"text": "verbum"}, None)]
+    # Results are handed out once
+    assert queue.take_results([task_id]) == []
+
+
+def test_fail(queue):
+    task_id = queue.submit("ocr", "app.x:f")
+    queue.claim(["ocr"], "w1")
+    assert queue.fail(task_id, "ValueError: bad page", "w1")
+    assert queue.take_results([task_id]) == [(task_id, "failed", None, "ValueError: bad page")]
+
+
+def test_expired_lease_is_handed_to_another_worker(queue, monkeypatch):
+    task_id = queue.submit("ocr", "app.x:f")
+    monkeypatch.setattr(job_queue, "JOB_QUEUE_LEASE_SECONDS", -1)
+    queue.claim(["ocr"], "w1")
+    monkeypatch.setattr(job_queue, "JOB_QUEUE_LEASE_SECONDS", 60)
+    assert queue.claim(["ocr"], "w2")[0] == task_id
+    # The first worker's late result must not overwrite the retry
+    assert not queue.complete(task_id, "stale", "w1")
+    assert not queue.fail(task_id, "stale", "w1")
+    assert queue.complete(task_id, "fresh", "w2")
+    assert queue.take_results([task_id]) == [(task_id, "done", "fresh", None)]
+
+
+def test_gives_up_after_max_attempts(queue, monkeypatch):
+    task_id = queue.submit("ocr", "app.x:f")
+    monkeypatch.setattr(job_queue, "JOB_QUEUE_LEASE_SECONDS", -1)
+    for attempt in range(job_queue.JOB_QUEUE_MAX_ATTEMPTS):
+        assert queue.claim(["ocr"], f"w{attempt}")[0] == task_id
+    assert queue.claim(["ocr"], "last") is None
+    assert queue.take_results([task_id]) == [(task_id, "failed", None, "Stage worker lost")]
+
+
+def test_heartbeat_keeps_the_lease(queue, monkeypatch):
+    task_id = queue.submit("ocr", "app.x:f")
+    monkeypatch.setattr(job_queue, "JOB_QUEUE_LEASE_SECONDS", -1)
+    queue.claim(["ocr"], "w1")
+    monkeypatch.setattr(job_queue, "JOB_QUEUE_LEASE_SECONDS", 60)
+    assert queue.heartbeat([task_id], "w1") == [task_id]
+    assert queue.claim(["ocr"], "w2") is None
+    assert queue.heartbeat([task_id], "w2") == []
+    assert queue.complete(task_id, None, "w1")
+
+
+def test_cancel_drops_only_queued_tasks(queue):
+    running = queue.submit("ocr", "app.x:f")
+    queued = queue.submit("ocr", "app.x:f")
+    queue.claim(["ocr"], "w1")
+    queue.cancel([running, queued])
+    assert queue.stats()["stages"] == {"ocr": {"running": 1}}
+
+
+def test_job_snapshots(queue):
+    queue.save_jobs([("j1", {"status": "running"}), ("j2", {"status": "done"})])
+    queue.save_jobs([("j1", {"status": "done"})])
+    assert queue.load_job("j1")[0] == {"status": "done"}
+    assert queue.load_job("j2")[0] == {"status": "done"}
+    assert queue.load_job("missing") is None
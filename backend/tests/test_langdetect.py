@@ -0,0 +1,40 @@
+import pytest
+
+from app.langdetect import DEFAULT_LANGUAGE, correction_language, detect_language, script_of
+
+
+@pytest.mark.parametrize("text, language, script", [
+    ("In principio erat verbum et verbum erat apud Deum et Deus erat verbum", "latin", "latin"),
+    ("Ἐν ἀρχῇ ἦν ὁ λόγος, καὶ ὁ λόγος ἦν πρὸς τὸν θεόν", "greek", "greek"),
+    ("Hwæt we gardena in geardagum þeodcyninga þrym gefrunon", "old_english", "latin"),
+    ("धर्मक्षेत्रे कुरुक्षेत्रे समवेता युयुत्सवः", "sanskrit", "devanagari"),
+])
+def test_detects_language_and_script(text, language, script):
+    detection = detect_language(text)
+    assert detection.language == language
+    assert detection.script == script
+    assert detection.confidence >= 0.4
+
+
+@pytest.mark.parametrize("text", ["", "12 34", "..."])
+def test_no_letters_falls_back_to_the_default(text):
+    detection = detect_language(text)
+    assert detection.language == DEFAULT_LANGUAGE
+    assert detection.confidence == 0.0
+
+
+def test_script_of():
+    assert script_of("a") == "latin"
+    assert script_of("þ") == "latin"
+    assert script_of("λ") == "greek"
+    assert script_of("ἀ") == "greek"
+    assert script_of("क") == "devanagari"
+    assert script_of("1") == ""
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("lat", "latin"), ("grc", "greek"), ("ang", "old_english"), ("san", "sanskrit"),
+    ("Latin", "latin"), ("Old English", "old_english"), ("ancient_greek", "greek"),
+])
+def test_correction_language(value, expected):
+    assert correction_language(value) == expected
@@ -0,0 +1,99 @@
+import pytest
+
+from app import lemma_index
+from app.lemma_index import LemmaIndex
+
+DOCS = {
+    "a": "in principio erat verbum et verbum erat apud deum",
+    "b": "et deus erat verbum",
+    "c": "Dóminus vobiscum et cum spiritu tuo",
+}
+
+
+def analysis(text: str):
+    # Lemma is the lowercased form, enough to tell the two fields apart
+    return [{"word": w, "lemma": w.lower()} for w in text.split()]
+
+
+def brute_force(docs, term):
+    return sorted(
+        (doc_id, i) for doc_id, text in docs.items()
+        for i, w in enumerate(text.split()) if lemma_index.normalize_term(w) == lemma_index.normalize_term(term)
+    )
+
+
+def hits(index, field, term):
+    result = index.search(field, term, limit=1000)
+    return sorted((h["doc_id"], h["position"]) for h in result["hits"]), result["total"]
+
+
+@pytest.fixture(params=[False, True], ids=["tail", "merged"])
+def index(request, tmp_path, monkeypatch):
+    # With a threshold of 1 every add rebuilds the sorted postings
+    monkeypatch.setattr(lemma_index, "INDEX_MERGE_THRESHOLD", 1 if request.param else 10 ** 9)
+    index = LemmaIndex(str(tmp_path))
+    for doc_id, text in DOCS.items():
+        index.add_document(doc_id, analysis(text), language="lat")
+    return index
+
+
+@pytest.mark.parametrize("term", ["verbum", "erat", "et", "dominus", "DOMINUS", "missing"])
+def test_search_matches_brute_force(index, term):
+    expected = brute_force(DOCS, term)
+    assert hits(index, "form", term) == (expected, len(expected))
+
+
+def test_postings_and_tail_combine(tmp_path, monkeypatch):
+    monkeypatch.setattr(lemma_index, "INDEX_MERGE_THRESHOLD", 10 ** 9)
+    index = LemmaIndex(str(tmp_path))
+    index.add_document("a", analysis(DOCS["a"]))
+    with index._lock, index._file_lock:
+        index._merge()
+    index.add_document("b", analysis(DOCS["b"]))
+    assert index.stats()["tokens_in_postings"] == len(DOCS["a"].split())
+    docs = {k: DOCS[k] for k in ("a", "b")}
+    assert hits(index, "lemma", "verbum")[0] == brute_force(docs, "verbum")
+
+
+def test_reindexing_hides_the_old_version(index):
+    index.add_document("b", analysis("nihil novum"))
+    docs = dict(DOCS, b="nihil novum")
+    assert hits(index, "form", "verbum")[0] == brute_force(docs, "verbum")
+    assert index.stats()["documents"] == len(DOCS)
+
+
+def test_unchanged_document_is_skipped(index):
+    tokens = index.token_count
+    index.add_document("a", analysis(DOCS["a"]))
+    assert index.token_count == tokens
+
+
+def test_kwic_context(index):
+    hit = index.search("form", "principio", width=2)["hits"][0]
+    assert (hit["left"], hit["keyword"], hit["right"]) == ("in", "principio", "erat verbum")
+
+
+def test_frequency(index):
+    result = index.frequency("form", "verbum")
+    assert result["total"] == 3
+    assert result["documents"][0] == {"doc_id": "a", "name": "a", "count": 2}
+    # "et", "erat" and "verbum" all occur three times
+    (top,) = index.frequency("form", top=1)["terms"]
+    assert top["count"] == 3 and top["term"] in ("et", "erat", "verbum")
+
+
+def test_other_instances_see_new_documents(index, tmp_path):
+    reader = LemmaIndex(str(tmp_path))
+    index.add_document("d", analysis("verbum caro factum est"))
+    docs = dict(DOCS, d="verbum caro factum est")
+    assert hits(reader, "form", "verbum")[0] == brute_force(docs, "verbum")
+
+
+def test_stats_count_distinct_lemmas(index):
+    stats = index.stats()
+    lemmas = {lemma_index.normalize_term(w) for text in DOCS.values() for w in text.split()}
+    assert stats["lemmas"] == len(lemmas)
+    assert stats["documents"] == len(DOCS)
+    assert stats["tokens"] == sum(len(text.split()) for text in DOCS.values())
+    # Forms differing only in case or accents ("Dóminus") share a normalized term
+    assert stats["vocabulary"] == len(lemmas)
@@ -0,0 +1,58 @@
+from app.ocr_words import WordTable, _aligned_replacement
+
+WINDOW = "in principio erat verbum et".split()
+
+
+def table(text: str, uncertain=()):
+    words = text.split()
+    return WordTable(
+        words=words,
+        confidence=[0.3 if i in uncertain else 0.99 for i in range(len(words))],
+        breaks=[" "] * (len(words) - 1) + [""],
+    )
+
+
+def test_unchanged_window_keeps_span():
+    assert _aligned_replacement(WINDOW, list(WINDOW), 2, 3) == (2, 3, ["erat"])
+
+
+def test_edits_outside_the_span_are_ignored():
+    corrected = "in principio erat uerbum et".split()
+    assert _aligned_replacement(WINDOW, corrected, 2, 3) == (2, 3, ["erat"])
+
+
+def test_merge_straddling_the_span_widens_it():
+    corrected = "in principio eratverbum et".split()
+    assert _aligned_replacement(WINDOW, corrected, 2, 3) == (2, 4, ["eratverbum"])
+
+
+def test_split_inside_the_span():
+    corrected = "in principio er at verbum et".split()
+    assert _aligned_replacement(WINDOW, corrected, 2, 3) == (2, 3, ["er", "at"])
+
+
+def test_rewrite_is_rejected():
+    corrected = "totally different words here now".split()
+    assert _aligned_replacement(WINDOW, corrected, 2, 3) is None
+
+
+def test_spans_merge_touching_context():
+    words = table("a b c d e f g h i j", uncertain=(2, 4, 9))
+    assert words.spans(0.8, 1) == [(2, 5, 1, 6), (9, 10, 8, 10)]
+
+
+def test_splice_replaces_only_uncertain_words():
+    words = table("in princ1pio erat verbum", uncertain=(1,))
+    words.breaks[2] = "\n"
+    assert words.splice([((1, 2, 0, 3), "in principio erat")]) == "in principio erat\nverbum"
+
+
+def test_splice_joins_a_word_split_across_the_span_edge():
+    words = table("in principio erat ver bum et deus", uncertain=(3,))
+    (span,) = words.spans(0.8, 3)
+    assert words.splice([(span, "in principio erat verbum et deus")]) == "in principio erat verbum et deus"
+
+
+def test_splice_without_fixes_is_the_page_text():
+    words = table("in principio erat", uncertain=(1,))
+    assert words.splice([]) == words.text()
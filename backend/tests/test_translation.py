@@ -0,0 +1,25 @@
+import asyncio
+
+import pytest
+
+from app import cache
+from app.cache import ResultCache
+from app.translation import StubTranslationBackend, Translator
+
+
+@pytest.fixture
+def translator(tmp_path, monkeypatch):
+    result_cache = ResultCache(str(tmp_path / "results.sqlite3"))
+    monkeypatch.setattr(cache, "CACHE_ENABLED", True)
+    monkeypatch.setattr(cache, "get_result_cache", lambda: result_cache)
+    return Translator(StubTranslationBackend(latency=0))
+
+
+def test_second_translation_is_served_from_the_cache(translator):
+    text = "In principio erat verbum.\nEt verbum erat apud Deum."
+    first, stats = asyncio.run(translator.translate(text, "la", "en"))
+    assert stats["cached"] == 0 and stats["translated"] == stats["segments"]
+    second, stats = asyncio.run(translator.translate(text, "la", "en"))
+    assert second == first
+    assert stats["cached"] == stats["segments"] and stats["requests"] == 0
+    assert translator.backend.calls == 1
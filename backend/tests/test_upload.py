@@ -0,0 +1,42 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import jobs
+from app.routers import upload
+from app.storage import UploadTooLargeError
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(upload.router)
+    return TestClient(app)
+
+
+@pytest.fixture
+def new_jobs(monkeypatch):
+    """Jobs created during the test."""
+    created = []
+
+    def create_job(stages, meta=None):
+        job = jobs.create_job(stages, meta)
+        created.append(job)
+        return job
+
+    monkeypatch.setattr(upload, "create_job", create_job)
+    return created
+
+
+@pytest.mark.parametrize("error, status", [(UploadTooLargeError("File exceeds 1 bytes"), 413), (OSError("disk full"), 500)])
+def test_failed_save_fails_the_job(client, new_jobs, monkeypatch, error, status):
+    def save_upload(*args):
+        raise error
+
+    monkeypatch.setattr(upload, "save_upload", save_upload)
+    response = client.post("/api/upload", files={"file": ("page.png", b"\x89PNG")}, data={"background": "true"})
+    assert response.status_code == status
+    (job,) = new_jobs
+    assert job.status == "failed"
+    assert job.error == str(error)
+    assert job.finished_at is not None